@@ -0,0 +1,130 @@
+'''Benchmark suite of the glossing pipeline on synthetic corpora.
+
+Each stage is timed on its own (wall time, number of items, throughput, and
+peak memory), as well as the full chain, for each corpus size. The results
+are written as JSON, to track performance regressions.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --output benchmark_results.json
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # To import the modules below
+
+import sklearn_crfsuite
+
+import crf_glossing.features as cgfeat
+import crf_glossing.majority_label as ml
+import crf_glossing.process_file as cgpf
+import crf_glossing.simple_eval as simple_eval
+from synthetic_corpus import generate_corpus
+
+
+class StageTimer:
+    '''Records the wall time, item count, and peak memory of each stage.'''
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = dict()
+
+    def run(self, name, function, n_items):
+        '''Run function() as the stage name, processing n_items items.'''
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        self.stages[name] = {'seconds': seconds, 'items': n_items,
+                             'items_per_second': n_items / seconds if seconds > 0 else None,
+                             'peak_memory_mb': peak}
+        print(f'  {name}: {seconds:.3f} s ({n_items} items)', file=sys.stderr)
+        return result
+
+
+def run_pipeline(n_sentences, work_dir, max_iterations=50, n_jobs=1, trace_memory=True, seed=0):
+    '''Benchmark the whole chain on a synthetic corpus of n_sentences (80% training, 20% test).'''
+    n_test = max(1, n_sentences // 5)
+    n_train = max(1, n_sentences - n_test)
+    train_file = os.path.join(work_dir, f'train-{n_train}')
+    test_file = os.path.join(work_dir, f'test-{n_test}')
+    generate_corpus(train_file, n_train, seed=seed, sample_seed=0)
+    generate_corpus(test_file, n_test, seed=seed, sample_seed=1)
+    with open(train_file, 'r', encoding='utf-8') as in_file:
+        train = in_file.read().rstrip('\n')
+    with open(test_file, 'r', encoding='utf-8') as in_file:
+        test = in_file.read().rstrip('\n')
+
+    timer = StageTimer(trace_memory=trace_memory)
+    start = time.perf_counter()
+    train_corpus = timer.run('parse', lambda: cgpf.IGT_Corpus(train, test=False), n_train)
+    test_corpus = cgpf.IGT_Corpus(test, test=True)
+    n_train_tokens = sum(len(sentence.split_source) for sentence in train_corpus.sentences)
+
+    train_sents = timer.run('convert_to_crf_format', lambda: train_corpus.convert_to_crf_format(stem=True), n_train)
+    test_sents = test_corpus.convert_to_crf_format(stem=True)
+    X_train = timer.run('sent2features', lambda: cgfeat.corpus2features(train_sents, n_jobs=n_jobs), n_train_tokens)
+    y_train = [cgfeat.sent2labels(s) for s in train_sents]
+    X_test = cgfeat.corpus2features(test_sents, n_jobs=n_jobs)
+
+    crf = sklearn_crfsuite.CRF(algorithm='lbfgs', c1=0.1, c2=0.1, max_iterations=max_iterations,
+                               all_possible_transitions=True)
+    timer.run('crf_fit', lambda: crf.fit(X_train, y_train), n_train)
+    y_pred = timer.run('crf_predict', lambda: crf.predict(X_test), n_test)
+
+    majority_dictionary = timer.run('create_majority_dict', lambda: ml.create_majority_dict(train_corpus), n_train)
+    y_pred = timer.run('apply_majority_label',
+                       lambda: ml.apply_majority_label(y_pred, majority_dictionary, test_corpus), n_test)
+    prediction_file = os.path.join(work_dir, f'prediction-{n_test}')
+    cgpf.write_predictions(cgpf.convert_to_igt_format(y_pred), prediction_file)
+    results = timer.run('simple_eval', lambda: simple_eval.evaluate_pair(prediction_file, test_file), n_test)
+    total = time.perf_counter() - start
+
+    return {'n_sentences': n_sentences, 'n_train': n_train, 'n_test': n_test,
+            'n_train_tokens': n_train_tokens, 'stages': timer.stages, 'total_seconds': total,
+            'morpheme_accuracy': results['morpheme_level']['accuracy']}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the glossing pipeline on synthetic corpora.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='Corpus sizes (number of sentences, e.g., 1000 to 10000000)')
+    parser.add_argument('--output', default='benchmark_results.json', help='Path of the JSON results')
+    parser.add_argument('--max-iterations', type=int, default=50, help='CRF training iterations')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of featurization processes')
+    parser.add_argument('--no-memory', action='store_true', help='Do not trace the peak memory (faster)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic corpora')
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for n_sentences in args.sizes:
+            print(f'{n_sentences} sentences', file=sys.stderr)
+            runs.append(run_pipeline(n_sentences, work_dir, max_iterations=args.max_iterations,
+                                     n_jobs=args.jobs, trace_memory=not args.no_memory, seed=args.seed))
+
+    report = {'date': datetime.now(timezone.utc).isoformat(), 'revision': git_revision(),
+              'python': platform.python_version(), 'platform': platform.platform(),
+              'cpu_count': os.cpu_count(), 'runs': runs}
+    with open(args.output, 'w', encoding='utf-8') as out_file:
+        json.dump(report, out_file, indent=4)
+    print(f'Results saved in {args.output}', file=sys.stderr)
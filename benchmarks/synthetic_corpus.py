@@ -0,0 +1,125 @@
+'''Synthetic IGT corpus generator (SIGMORPHON Shared Task format) for benchmarks.
+
+Morphemes and glosses follow Zipfian distributions: a small set of frequent
+grammatical affixes and clitics (uppercase glosses, with some homonymy) and a
+long tail of stems (lexical glosses, some of them ambiguous).
+
+Usage:
+    python benchmarks/synthetic_corpus.py OUTPUT_FILE --sentences 100000 --seed 0 --sample-seed 0
+'''
+import argparse
+import random
+from bisect import bisect
+from itertools import accumulate
+
+
+CONSONANTS = 'ptkbdgmnslrwyhxq'
+VOWELS = 'aeiou'
+GRAM_LABELS = ['1SG', '2SG', '3SG', '1PL', '2PL', '3PL', 'PL', 'PST', 'FUT', 'PROG', 'IPFV', 'PFV',
+               'NEG', 'Q', 'DET', 'CN', 'PN', 'LOC', 'INS', 'COMP', 'CAUS', 'PASS', 'TR', 'ANTIP',
+               'NMLZ', 'DEM', 'FOC', 'TOP', 'ERG', 'ABS', 'GEN', 'DAT', 'POSS', 'REFL', 'CCNJ', 'PROSP']
+
+
+def syllables(rng, n_syllables):
+    return ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(n_syllables))
+
+
+class ZipfSampler:
+    '''Samples items with a Zipfian (1 / rank ** exponent) distribution.'''
+    def __init__(self, items, exponent=1.1):
+        self.items = items
+        self.cumulative = list(accumulate(1 / (rank ** exponent) for rank in range(1, len(items) + 1)))
+
+    def sample(self, rng):
+        return self.items[bisect(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+class SyntheticIGT:
+    '''Generates sentences in the SIGMORPHON Shared Task format.
+
+    Parameters
+    ----------
+    n_stems : int
+        Number of stem types (lexicon size)
+    seed : int
+        Random seed of the lexicon (the same language for the same seed)
+    sample_seed : int
+        Random seed of the sentences (e.g., different for training and test corpora)
+    '''
+    def __init__(self, n_stems=20000, seed=0, sample_seed=0):
+        rng = random.Random(seed)
+        self.rng = random.Random(f'{seed}-{sample_seed}')
+
+        # Grammatical morphemes: short forms, some forms with two labels
+        grams = []
+        for label in GRAM_LABELS:
+            grams.append((syllables(rng, 1)[:rng.choice([1, 2])], label))
+        grams += [(form, rng.choice(GRAM_LABELS)) for form, _ in rng.sample(grams, len(grams) // 5)]
+        rng.shuffle(grams)
+        self.prefixes = ZipfSampler(grams[:len(grams) // 3])
+        self.suffixes = ZipfSampler(grams[len(grams) // 3:])
+
+        # Stems: longer forms with lexical glosses, some ambiguous
+        stems = dict()
+        while len(stems) < n_stems:
+            form = syllables(rng, rng.choice([1, 2, 2, 3]))
+            stems[form] = syllables(rng, rng.choice([2, 3])).replace('q', 'c')
+        stems = list(stems.items())
+        stems += [(form, syllables(rng, 3)) for form, _ in rng.sample(stems, n_stems // 20)]
+        self.stems = ZipfSampler(stems)
+
+    def word(self):
+        '''Generate one word: (segmented word, glosses, stem gloss).'''
+        rng = self.rng
+        morphs, glosses = [], []
+        n_prefixes = rng.choices([0, 1, 2], weights=[6, 3, 1])[0]
+        n_suffixes = rng.choices([0, 1, 2, 3], weights=[4, 4, 2, 1])[0]
+        for _ in range(n_prefixes):
+            form, label = self.prefixes.sample(rng)
+            morphs += [form, '-']
+            glosses += [label, '-']
+        form, gloss = self.stems.sample(rng)
+        morphs.append(form)
+        glosses.append(gloss)
+        for _ in range(n_suffixes):
+            boundary = '=' if rng.random() < 0.15 else '-'
+            form, label = self.suffixes.sample(rng)
+            morphs += [boundary, form]
+            glosses += [boundary, label]
+        return ''.join(morphs), ''.join(glosses), gloss
+
+    def sentence(self):
+        '''Generate one sentence block (string).'''
+        n_words = max(1, min(60, int(self.rng.lognormvariate(1.8, 0.5))))
+        words = [self.word() for _ in range(n_words)]
+        segmented = ' '.join(word for word, _, _ in words)
+        glossed = ' '.join(gloss for _, gloss, _ in words)
+        transcription = segmented.replace('-', '').replace('=', '')
+        translation = ' '.join(stem_gloss for _, _, stem_gloss in words).capitalize() + '.'
+        return f'\\t {transcription}\n\\m {segmented}\n\\g {glossed}\n\\l {translation}\n'
+
+
+def generate_corpus(path, n_sentences, n_stems=20000, seed=0, sample_seed=0):
+    '''Write a synthetic corpus of n_sentences sentences (streamed, constant memory).
+
+    Corpora with the same seed share the same lexicon; use another sample_seed
+    for a test corpus.'''
+    generator = SyntheticIGT(n_stems=n_stems, seed=seed, sample_seed=sample_seed)
+    with open(path, 'w', encoding='utf-8') as out_file:
+        for i in range(n_sentences):
+            if i > 0:
+                out_file.write('\n')
+            out_file.write(generator.sentence())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic IGT corpus.')
+    parser.add_argument('output_file', help='Path to the output corpus file')
+    parser.add_argument('--sentences', type=int, default=10000, help='Number of sentences')
+    parser.add_argument('--stems', type=int, default=20000, help='Number of stem types')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the lexicon')
+    parser.add_argument('--sample-seed', type=int, default=0, help='Random seed of the sentences')
+    args = parser.parse_args()
+
+    generate_corpus(args.output_file, args.sentences, n_stems=args.stems, seed=args.seed,
+                    sample_seed=args.sample_seed)
@@ -0,0 +1,85 @@
+'''Content-addressed cache of the pipeline artifacts.
+
+Each artifact (parsed corpus, feature sequences, crfsuite model, lexicon) is
+stored under a hash of everything it depends on: the content of the input
+files, the options, and the keys of the upstream artifacts. Changing only
+the test file therefore reuses all the training artifacts.'''
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+import crf_glossing.corpus_cache as corpus_cache
+
+
+CACHE_VERSION = 1
+
+
+def artifact_key(kind, **inputs):
+    '''Hash of the kind of artifact and of its inputs (JSON serialisable).'''
+    description = json.dumps({'kind': kind, 'version': CACHE_VERSION, 'inputs': inputs}, sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+class ArtifactCache:
+    '''Stores artifacts in root/kind/key (files or directories).
+
+    Artifacts are written to a temporary path first and then renamed, so an
+    interrupted run never leaves a partial artifact behind (the temporary
+    path is deleted if the build fails).
+
+    Parameters
+    ----------
+    root : string
+        Cache directory
+    '''
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, kind, key, suffix=''):
+        return os.path.join(self.root, kind, key + suffix)
+
+    def corpus(self, path, test=False, tilde=False, lower=True, equal=True):
+        '''Parsed corpus (Compact_IGT_Corpus) and its key.'''
+        key = corpus_cache.corpus_key(path, test=test, tilde=tilde, lower=lower, equal=equal)
+        corpus = corpus_cache.load_or_parse(path, os.path.join(self.root, 'corpus'), test=test,
+                                            tilde=tilde, lower=lower, equal=equal)
+        return corpus, key
+
+    def pickled(self, kind, key, build):
+        '''Load a pickled artifact, building (and saving) it with build() on a miss.'''
+        path = self.path(kind, key, '.pkl')
+        if os.path.exists(path):
+            with open(path, 'rb') as in_file:
+                return pickle.load(in_file)
+        artifact = build()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.tmp{os.getpid()}'
+        try:
+            with open(temp_path, 'wb') as out_file:
+                pickle.dump(artifact, out_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return artifact
+
+    def directory(self, kind, key, build):
+        '''Path of a directory artifact, created with build(temporary directory) on a miss.'''
+        path = self.path(kind, key)
+        if not os.path.isdir(path):
+            temp_path = f'{path}.tmp{os.getpid()}'
+            shutil.rmtree(temp_path, ignore_errors=True)
+            os.makedirs(temp_path)
+            try:
+                build(temp_path)
+            except BaseException:
+                shutil.rmtree(temp_path, ignore_errors=True)
+                raise
+            try:
+                os.rename(temp_path, path)
+            except OSError: # Built concurrently by another process
+                shutil.rmtree(temp_path, ignore_errors=True)
+        return path
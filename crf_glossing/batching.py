@@ -0,0 +1,80 @@
+'''Length-bucketed batching, with long sentences split into overlapping windows.
+
+The sentences (feature sequences, or lists of morphemes for the NumPy
+decoder) are tagged by batches of similar lengths instead of in file order.
+The sentences longer than max_length are split into windows of at most
+max_length positions, which overlap by `overlap` positions: each position
+keeps the label predicted in the window where it is furthest from the edges
+(the first half of each overlap is taken from the previous window, the
+second half from the next one). The labels are stitched back, so the
+predictions have the order and the lengths of the sentences, as expected by
+apply_majority_label.
+
+The features of a position are computed on the whole sentence (or, for
+lists of morphemes, on the window: the positions of the margins lose their
+context features, but they are not kept if overlap // 2 >= 2). Only the
+decoding is limited to the window, so that its cost (and latency) is
+bounded by max_length.
+
+    X_test = cgfeat.corpus2features(test_corpus.convert_to_crf_format())
+    y_pred = batched_predict(model.predict, X_test, max_length=64, overlap=16)
+    y_pred = ml.apply_majority_label(y_pred, majority_dictionary, test_corpus)
+'''
+import crf_glossing.instrument as instrument
+
+
+DEFAULT_OVERLAP = 16
+DEFAULT_BATCH_SIZE = 256
+
+
+def windows(length, max_length=None, overlap=DEFAULT_OVERLAP):
+    '''Windows of a sentence: (start, end, keep_start, keep_end) of each window.
+
+    The window [start, end[ is tagged, and its labels of [keep_start, keep_end[ are kept.'''
+    if max_length is None or length <= max_length:
+        return [(0, length, 0, length)]
+    assert 0 <= overlap < max_length, f'The overlap ({overlap}) must be smaller than the windows ({max_length}).'
+    step = max_length - overlap
+    sentence_windows = []
+    start = 0
+    while True:
+        end = min(start + max_length, length)
+        keep_start = 0 if start == 0 else start + overlap // 2
+        keep_end = length if end == length else end - (overlap - overlap // 2)
+        sentence_windows.append((start, end, keep_start, keep_end))
+        if end == length:
+            return sentence_windows
+        start += step
+
+def length_batches(segments, batch_size=DEFAULT_BATCH_SIZE):
+    '''Group segments (sentence index, start, end, ...) into batches of similar lengths.'''
+    ordered = sorted(segments, key=lambda segment: segment[2] - segment[1])
+    for start in range(0, len(ordered), batch_size):
+        yield ordered[start:start + batch_size]
+
+def batched_predict(predict, sequences, max_length=None, overlap=DEFAULT_OVERLAP, batch_size=DEFAULT_BATCH_SIZE,
+                    aligned=None):
+    '''Predict the labels of sequences by length-bucketed batches, in windows for the long ones.
+
+    predict: function of a list of sequences returning their label sequences (e.g.,
+    GlossingModel.predict, or ViterbiDecoder.decode_morphemes).
+    sequences: feature sequences (or lists of morphemes) of each sentence.
+    max_length: maximum length of a tagged sequence (None: sentences not split).
+    aligned: sequences with one element per position, split like the sentences and given
+    to predict as second argument (e.g., the candidate labels of ViterbiDecoder.decode).
+    Returns the labels of each sentence, in order.'''
+    segments = [(i, start, end, keep_start, keep_end)
+                for i, sequence in enumerate(sequences) if len(sequence) > 0
+                for start, end, keep_start, keep_end in windows(len(sequence), max_length, overlap)]
+    y_pred = [[None] * len(sequence) for sequence in sequences]
+    with instrument.stage('batched_predict', len(sequences)):
+        for batch in length_batches(segments, batch_size):
+            batch_sequences = [sequences[i][start:end] for i, start, end, _, _ in batch]
+            if aligned is None:
+                batch_labels = predict(batch_sequences)
+            else:
+                batch_labels = predict(batch_sequences, [aligned[i][start:end] for i, start, end, _, _ in batch])
+            for (i, start, _, keep_start, keep_end), labels in zip(batch, batch_labels):
+                y_pred[i][keep_start:keep_end] = labels[keep_start - start:keep_end - start]
+    assert all(label is not None for labels in y_pred for label in labels), 'Some positions were not tagged.'
+    return y_pred
@@ -0,0 +1,306 @@
+'''Command-line train/predict/evaluate pipeline with cached artifacts.
+
+Usage (from the repository root):
+    python -m crf_glossing.cli train --train TRAIN_FILE
+    python -m crf_glossing.cli predict --train TRAIN_FILE --test TEST_FILE --output PREDICTION_FILE
+    python -m crf_glossing.cli evaluate --pred PREDICTION_FILE --gold GOLD_FILE
+    python -m crf_glossing.cli tune --train TRAIN_FILE --c1 0.01 0.1 1 --c2 0.01 0.1 --folds 5
+    python -m crf_glossing.cli stats --train TRAIN_FILE --min-attribute-freq 2 --test TEST_FILE
+
+Every intermediate artifact (parsed corpus, feature sequences, crfsuite model,
+lexicon) is cached under a hash of its inputs and options (see artifacts.py):
+re-running with only the test file changed skips featurizing and training on
+the training set.
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import sklearn_crfsuite
+
+import crf_glossing.features as cgfeat
+import crf_glossing.majority_label as ml
+import crf_glossing.process_file as cgpf
+import crf_glossing.simple_eval as simple_eval
+import crf_glossing.tuning as tuning
+from crf_glossing.artifacts import ArtifactCache, artifact_key
+from crf_glossing.batching import batched_predict, DEFAULT_OVERLAP, DEFAULT_BATCH_SIZE
+from crf_glossing.model import GlossingModel, MODEL_FILE, COUNTS_FILE, DEFAULT_CRF_PARAMS, crf_params
+from crf_glossing.confidence import top_k_marginals
+from crf_glossing.prediction_cache import PredictionCache
+from crf_glossing.viterbi import ViterbiDecoder, label_candidates
+
+
+DEFAULT_CACHE_DIR = '.crf_glossing_cache'
+
+
+def feature_options(translation=False, hash_size=None):
+    '''Non-default feature options (so that the keys of the default features do not change).'''
+    options = dict()
+    if translation:
+        options['translation'] = True
+    if hash_size is not None:
+        options['hash_size'] = hash_size
+    return options
+
+def corpus_features(cache, corpus, corpus_key, stem=True, n_jobs=None, translation=False, hash_size=None):
+    '''Feature sequences (X, y) of a parsed corpus (cached) and their key.
+
+    translation, hash_size: feature options (see sent2features).'''
+    key = artifact_key('features', corpus=corpus_key, stem=stem, **feature_options(translation, hash_size))
+
+    def build():
+        crf_sents = corpus.convert_to_crf_format(stem=stem)
+        translations = [sentence.split_translation for sentence in corpus] if translation else None
+        return (cgfeat.corpus2features(crf_sents, n_jobs=n_jobs, translations=translations, hash_size=hash_size),
+                [cgfeat.sent2labels(s) for s in crf_sents])
+
+    return cache.pickled('features', key, build), key
+
+def model_features(cache, model, test_file, n_jobs=None):
+    '''Feature sequences of a test file, with the feature options of a model.'''
+    corpus, corpus_key = cache.corpus(test_file, test=True)
+    (X, _), _ = corpus_features(cache, corpus, corpus_key, stem=model.stem, n_jobs=n_jobs,
+                                translation=model.translation, hash_size=model.hash_size)
+    return X
+
+def train_model(cache, train_file, stem=True, n_jobs=None, min_attribute_freq=1, translation=False, hash_size=None,
+                **crf_parameters):
+    '''Train (or load from the cache) the CRF model and the lexicon of a training file.
+
+    min_attribute_freq: rarer string-valued features are pruned before training (see prune_features).
+    translation, hash_size: feature options (see sent2features).'''
+    crf_parameters = crf_params(**crf_parameters)
+    corpus, corpus_key = cache.corpus(train_file, test=False)
+
+    lexicon_path = cache.path('lexicon', artifact_key('lexicon', corpus=corpus_key), '.json')
+    if not os.path.exists(lexicon_path):
+        os.makedirs(os.path.dirname(lexicon_path), exist_ok=True)
+        ml.MajorityLexicon.from_corpus(corpus).save(lexicon_path)
+
+    features_key = artifact_key('features', corpus=corpus_key, stem=stem, **feature_options(translation, hash_size))
+    if min_attribute_freq > 1:
+        features_key = artifact_key('pruned_features', features=features_key, min_freq=min_attribute_freq)
+    model_key = artifact_key('model', features=features_key, crf_params=crf_parameters)
+
+    def build(directory):
+        (X_train, y_train), _ = corpus_features(cache, corpus, corpus_key, stem=stem, n_jobs=n_jobs,
+                                                translation=translation, hash_size=hash_size)
+        X_train = cgfeat.prune_features(X_train, min_freq=min_attribute_freq)
+        print(f'Training the CRF on {len(X_train)} sentences.', file=sys.stderr)
+        crf = sklearn_crfsuite.CRF(model_filename=os.path.join(directory, MODEL_FILE), **crf_parameters)
+        crf.fit(X_train, y_train)
+        lexicon = ml.MajorityLexicon.load(lexicon_path)
+        GlossingModel(os.path.join(directory, MODEL_FILE), lexicon.to_dict(), stem=stem,
+                      translation=translation, hash_size=hash_size).save(directory)
+
+    model_dir = cache.directory('model', model_key, build)
+    if not os.path.exists(os.path.join(model_dir, COUNTS_FILE)): # Label counts, for the constrained decoding
+        shutil.copyfile(lexicon_path, os.path.join(model_dir, COUNTS_FILE))
+    return GlossingModel.load(model_dir)
+
+def predict_file(cache, model, test_file, n_jobs=None, decoder='crfsuite', constrain=False, max_length=None,
+                 overlap=DEFAULT_OVERLAP, batch_size=DEFAULT_BATCH_SIZE):
+    '''Predict the glosses of a test file; returns one gloss line per sentence.
+
+    decoder: crfsuite (tagger), or numpy (ViterbiDecoder, on the morphemes directly if the
+    model uses the default features, on the feature sequences otherwise).
+    constrain: restrict the labels of known morphemes to those seen in training (numpy decoder).
+    max_length: tag by length-bucketed batches, the longer sentences in overlapping windows
+    (see batched_predict; None: whole sentences).
+    With a model prediction cache (crfsuite), the repeated sentences are tagged only once.'''
+    corpus, _ = cache.corpus(test_file, test=True)
+    if decoder != 'numpy' and model.prediction_cache is not None:
+        return cgpf.convert_to_igt_format(model.label_batch(list(corpus)))
+    if decoder == 'numpy':
+        viterbi_decoder = ViterbiDecoder.from_model(model.model_path)
+        sentences = [list(sentence.split_source) for sentence in corpus]
+        candidates = None
+        if constrain:
+            lexicon = model.lexicon()
+            assert lexicon is not None, f'No {COUNTS_FILE} saved with the model: cannot constrain the labels.'
+            candidates = [label_candidates(sentence, lexicon, viterbi_decoder, stem=model.stem,
+                                           custom_dict=model.custom_dict) for sentence in sentences]
+        if model.default_features:
+            sequences, decode = sentences, viterbi_decoder.decode_morphemes
+        else:
+            sequences, decode = model_features(cache, model, test_file, n_jobs=n_jobs), viterbi_decoder.decode
+        if max_length is None:
+            predictions = decode(sequences, candidates)
+        else:
+            predictions = batched_predict(decode, sequences, max_length=max_length, overlap=overlap,
+                                          batch_size=batch_size, aligned=candidates)
+    else:
+        X_test = model_features(cache, model, test_file, n_jobs=n_jobs)
+        if max_length is None:
+            predictions = model.predict(X_test)
+        else:
+            predictions = batched_predict(model.predict, X_test, max_length=max_length, overlap=overlap,
+                                          batch_size=batch_size)
+    y_pred = ml.apply_majority_label(predictions, model.majority_dictionary, corpus, backoff=model.backoff)
+    return cgpf.convert_to_igt_format(y_pred)
+
+def score_file(cache, model, test_file, path, k=3):
+    '''Save the top-k glosses of each morpheme of a test file and their probabilities (see LabelScores).'''
+    corpus, _ = cache.corpus(test_file, test=True)
+    decoder = ViterbiDecoder.from_model(model.model_path)
+    if model.default_features:
+        scores = top_k_marginals(decoder, [list(sentence.split_source) for sentence in corpus], k=k)
+    else:
+        scores = top_k_marginals(decoder, X=model_features(cache, model, test_file), k=k)
+    scores.apply_majority_label(model.majority_dictionary, corpus, backoff=model.backoff).save(path)
+
+def add_training_arguments(parser):
+    parser.add_argument('--algorithm', default=DEFAULT_CRF_PARAMS['algorithm'], help='CRFsuite training algorithm')
+    parser.add_argument('--c1', type=float, default=DEFAULT_CRF_PARAMS['c1'], help='L1 regularisation')
+    parser.add_argument('--c2', type=float, default=DEFAULT_CRF_PARAMS['c2'], help='L2 regularisation')
+    parser.add_argument('--max-iterations', type=int, default=DEFAULT_CRF_PARAMS['max_iterations'])
+    parser.add_argument('--no-stem', action='store_true', help='Keep the lexical glosses as CRF labels')
+    parser.add_argument('--min-attribute-freq', type=int, default=1,
+                        help='Prune the morpheme features seen fewer times in training')
+    parser.add_argument('--translation-features', action='store_true',
+                        help='Use the words of the translation as features')
+    parser.add_argument('--hash-size', type=int, default=None,
+                        help='Hash the features into this number of buckets (e.g., 262144)')
+
+def training_params(args):
+    return crf_params(algorithm=args.algorithm, c1=args.c1, c2=args.c2, max_iterations=args.max_iterations)
+
+def get_model(cache, args):
+    '''Model given by --model, or trained (if not cached) on --train.'''
+    if args.model is not None:
+        return GlossingModel.load(args.model)
+    return train_model(cache, args.train, stem=not args.no_stem, n_jobs=args.jobs,
+                       min_attribute_freq=args.min_attribute_freq, translation=args.translation_features,
+                       hash_size=args.hash_size, **training_params(args))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='CRF glossing pipeline.')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory of the cached artifacts')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of featurization processes')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='Train a model (CRF and lexicon)')
+    train_parser.add_argument('--train', required=True, help='Training file (SIGMORPHON format)')
+    train_parser.add_argument('--output', help='Also save the model in this directory')
+    add_training_arguments(train_parser)
+
+    predict_parser = subparsers.add_parser('predict', help='Gloss a test file')
+    predict_parser.add_argument('--test', required=True, help='Test file (SIGMORPHON format)')
+    model_group = predict_parser.add_mutually_exclusive_group(required=True)
+    model_group.add_argument('--model', help='Directory of a saved model')
+    model_group.add_argument('--train', help='Training file (the model is trained if not cached)')
+    predict_parser.add_argument('--output', required=True, help='Prediction file')
+    predict_parser.add_argument('--decoder', choices=['crfsuite', 'numpy'], default='crfsuite',
+                                help='crfsuite tagger, or batched NumPy Viterbi decoder')
+    predict_parser.add_argument('--constrain', action='store_true',
+                                help='Only the labels seen with each known morpheme in training (numpy decoder)')
+    predict_parser.add_argument('--scores', help='Also save the top-k glosses and probabilities (.npz)')
+    predict_parser.add_argument('--top-k', type=int, default=3, help='Number of glosses per morpheme in --scores')
+    predict_parser.add_argument('--prediction-cache', type=int, default=0,
+                                help='Tag each distinct sentence once (cache of this many sentences, crfsuite decoder)')
+    predict_parser.add_argument('--backoff', action='store_true',
+                                help='Gloss the unknown stems with the closest known morpheme (instead of UNK)')
+    predict_parser.add_argument('--max-length', type=int, default=None,
+                                help='Tag by batches of similar lengths, the longer sentences in overlapping windows')
+    predict_parser.add_argument('--window-overlap', type=int, default=DEFAULT_OVERLAP,
+                                help='Number of positions shared by consecutive windows (with --max-length)')
+    predict_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                                help='Number of sentences (or windows) per batch (with --max-length)')
+    add_training_arguments(predict_parser)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='Evaluate prediction files')
+    evaluate_parser.add_argument('--pred', required=True, nargs='+', help='Prediction file(s)')
+    evaluate_parser.add_argument('--gold', required=True, nargs='+', help='Gold file (or one per prediction)')
+    evaluate_parser.add_argument('--output', help='Path of the JSON report')
+
+    tune_parser = subparsers.add_parser('tune', help='Select the CRF parameters by cross-validation')
+    tune_parser.add_argument('--train', required=True, help='Training file (SIGMORPHON format)')
+    tune_parser.add_argument('--algorithm', nargs='+', default=[DEFAULT_CRF_PARAMS['algorithm']])
+    tune_parser.add_argument('--c1', type=float, nargs='+', default=[DEFAULT_CRF_PARAMS['c1']])
+    tune_parser.add_argument('--c2', type=float, nargs='+', default=[DEFAULT_CRF_PARAMS['c2']])
+    tune_parser.add_argument('--max-iterations', type=int, nargs='+', default=[DEFAULT_CRF_PARAMS['max_iterations']])
+    tune_parser.add_argument('--folds', type=int, default=5, help='Number of cross-validation folds')
+    tune_parser.add_argument('--seed', type=int, default=0, help='Random seed of the folds')
+    tune_parser.add_argument('--metric', default='morpheme_level.accuracy',
+                             help='simple_eval metric to maximise (e.g., classes.stem.f1)')
+    tune_parser.add_argument('--no-stem', action='store_true', help='Keep the lexical glosses as CRF labels')
+    tune_parser.add_argument('--report', help='Path of the JSON cross-validation results')
+    tune_parser.add_argument('--output', help='Also save the best model in this directory')
+
+    stats_parser = subparsers.add_parser('stats', help='Size and tagging speed of a model')
+    stats_group = stats_parser.add_mutually_exclusive_group(required=True)
+    stats_group.add_argument('--model', help='Directory of a saved model')
+    stats_group.add_argument('--train', help='Training file (the model is trained if not cached)')
+    stats_parser.add_argument('--test', help='Test file to measure the tagging throughput')
+    add_training_arguments(stats_parser)
+
+    args = parser.parse_args(argv)
+    cache = ArtifactCache(args.cache_dir)
+
+    if args.command == 'train':
+        model = train_model(cache, args.train, stem=not args.no_stem, n_jobs=args.jobs,
+                            min_attribute_freq=args.min_attribute_freq, translation=args.translation_features,
+                            hash_size=args.hash_size, **training_params(args))
+        if args.output is not None:
+            model.save(args.output)
+        print(os.path.dirname(model.model_path))
+    elif args.command == 'predict':
+        if args.constrain and args.decoder != 'numpy':
+            parser.error('--constrain requires --decoder numpy.')
+        if args.max_length is not None and args.prediction_cache > 0:
+            parser.error('--max-length cannot be used with --prediction-cache (whole sentences are cached).')
+        if args.max_length is not None and not 0 <= args.window_overlap < args.max_length:
+            parser.error('--window-overlap must be smaller than --max-length.')
+        model = get_model(cache, args)
+        if args.backoff:
+            model.backoff = model.backoff_lexicon()
+        if args.prediction_cache > 0:
+            model.prediction_cache = PredictionCache(args.prediction_cache)
+        cgpf.write_predictions(predict_file(cache, model, args.test, n_jobs=args.jobs, decoder=args.decoder,
+                                            constrain=args.constrain, max_length=args.max_length,
+                                            overlap=args.window_overlap, batch_size=args.batch_size), args.output)
+        print(f'Predictions saved in {args.output}', file=sys.stderr)
+        if model.prediction_cache is not None:
+            print(f'Prediction cache: {json.dumps(model.prediction_cache.stats())}', file=sys.stderr)
+        if args.scores is not None:
+            score_file(cache, model, args.test, args.scores, k=args.top_k)
+    elif args.command == 'evaluate':
+        gold = args.gold * len(args.pred) if len(args.gold) == 1 else args.gold
+        if len(gold) != len(args.pred):
+            parser.error('Give either one gold file or one gold file per prediction file.')
+        report = simple_eval.evaluate_files(list(zip(args.pred, gold)), n_jobs=args.jobs)
+        if args.output is not None:
+            with open(args.output, 'w', encoding='utf-8') as out_file:
+                json.dump(report, out_file, sort_keys=True, indent=4)
+        results = report[0]['results'] if len(report) == 1 else report
+        print(json.dumps(results, sort_keys=True, indent=4))
+    elif args.command == 'tune':
+        stem = not args.no_stem
+        corpus, corpus_key = cache.corpus(args.train, test=False)
+        (X, y), _ = corpus_features(cache, corpus, corpus_key, stem=stem, n_jobs=args.jobs)
+        grid = {'algorithm': args.algorithm, 'c1': args.c1, 'c2': args.c2, 'max_iterations': args.max_iterations}
+        cv_results = tuning.cross_validate(X, y, corpus, tuning.parameter_grid(grid), n_folds=args.folds,
+                                           n_jobs=args.jobs, seed=args.seed, metric=tuple(args.metric.split('.')))
+        for entry in sorted(cv_results, key=lambda entry: -entry['mean_score']):
+            print(f"{entry['mean_score']:.4f} (+/- {entry['std_score']:.4f}) {entry['params']}", file=sys.stderr)
+        if args.report is not None:
+            with open(args.report, 'w', encoding='utf-8') as out_file:
+                json.dump(cv_results, out_file, sort_keys=True, indent=4)
+        # The best model is trained on the whole corpus (cached like the train command)
+        model = train_model(cache, args.train, stem=stem, n_jobs=args.jobs, **tuning.best_configuration(cv_results))
+        if args.output is not None:
+            model.save(args.output)
+        print(os.path.dirname(model.model_path))
+    elif args.command == 'stats':
+        model = get_model(cache, args)
+        X_test = None
+        if args.test is not None:
+            X_test = model_features(cache, model, args.test, n_jobs=args.jobs)
+        print(json.dumps(model.stats(X_test), sort_keys=True, indent=4))
+
+
+if __name__ == '__main__':
+    main()
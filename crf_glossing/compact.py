@@ -0,0 +1,208 @@
+'''Compact, array-backed representation of IGT corpora.'''
+import sys
+from array import array
+
+import crf_glossing.process_file as cgpf
+
+
+class Vocabulary:
+    '''Interns strings to integer ids (shared between corpora).
+
+    Parameters
+    ----------
+    strings : iterable [string]
+        Initial strings, in id order
+
+    Attributes
+    ----------
+    strings : list [string]
+        Interned string for each id
+    index : dict {string: id}
+        Id of each string
+    '''
+    __slots__ = ('strings', 'index')
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self.index = dict()
+        for string in strings:
+            self.add(string)
+
+    def add(self, string):
+        '''Return the id of the string, adding it to the vocabulary if needed.'''
+        string_id = self.index.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            string = sys.intern(string)
+            self.strings.append(string)
+            self.index[string] = string_id
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __contains__(self, string):
+        return string in self.index
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class Compact_IGT_Corpus:
+    '''Stores a corpus as flat integer arrays with per-sentence offsets.
+
+    Morphemes, glosses, and translation words are interned in vocabularies,
+    which can be shared between corpora (e.g., training and test datasets).
+    Sentences are light views (CompactSentence) created on demand, so the
+    corpus can be used in place of an IGT_Corpus for to_crf_format,
+    create_majority_dict, and apply_majority_label.
+
+    Parameters
+    ----------
+    sentences : iterable [Sentence (object)]
+        Processed sentences (e.g., an IGT_Corpus or an IGT_Stream)
+    test : bool
+        Indicates whether the corpus is a test dataset or not
+    vocabularies : tuple (Vocabulary, Vocabulary, Vocabulary)
+        Morpheme, gloss, and translation word vocabularies to share (new ones by default)
+
+    Attributes
+    ----------
+    morph_ids : array [int]
+        Morpheme (and boundary) ids of all sentences, concatenated
+    gloss_ids : array [int]
+        Gloss ids aligned with morph_ids (empty for a test dataset)
+    offsets : array [int]
+        Start of each sentence in morph_ids (n_sent + 1 values)
+    word_ids : array [int]
+        Translation word ids of all sentences, concatenated
+    word_offsets : array [int]
+        Start of each sentence in word_ids (n_sent + 1 values)
+    n_sent : int
+        Number of sentences in the corpus
+    '''
+    def __init__(self, sentences=(), test=False, vocabularies=None):
+        self.test = test
+        if vocabularies is None:
+            vocabularies = (Vocabulary(), Vocabulary(), Vocabulary())
+        self.morph_vocab, self.gloss_vocab, self.word_vocab = vocabularies
+
+        self.morph_ids = array('i')
+        self.gloss_ids = array('i')
+        self.offsets = array('q', [0])
+        self.word_ids = array('i')
+        self.word_offsets = array('q', [0])
+        for sentence in sentences:
+            self.append(sentence)
+
+    @classmethod
+    def from_buffers(cls, morph_ids, gloss_ids, offsets, word_ids, word_offsets, vocabularies, test=False):
+        '''Create a corpus from existing integer buffers (e.g., memory-mapped memoryviews).
+
+        Read-only buffers cannot be appended to.'''
+        corpus = cls(test=test, vocabularies=vocabularies)
+        corpus.morph_ids = morph_ids
+        corpus.gloss_ids = gloss_ids
+        corpus.offsets = offsets
+        corpus.word_ids = word_ids
+        corpus.word_offsets = word_offsets
+        return corpus
+
+    @property
+    def vocabularies(self):
+        return (self.morph_vocab, self.gloss_vocab, self.word_vocab)
+
+    @property
+    def n_sent(self):
+        return len(self.offsets) - 1
+
+    @property
+    def sentences(self):
+        '''Sequence of sentences (as in IGT_Corpus).'''
+        return self
+
+    def append(self, sentence):
+        '''Add a processed sentence (Sentence object) to the corpus.'''
+        split_source = sentence.split_source
+        self.morph_ids.extend(self.morph_vocab.add(morph) for morph in split_source)
+        if not self.test:
+            n_gloss = len(sentence.split_gloss)
+            assert n_gloss == len(split_source), \
+                f'Lengths do not match: {len(split_source)} and {n_gloss}.'
+            self.gloss_ids.extend(self.gloss_vocab.add(gloss) for gloss in sentence.split_gloss)
+        self.offsets.append(len(self.morph_ids))
+        self.word_ids.extend(self.word_vocab.add(word) for word in sentence.split_translation)
+        self.word_offsets.append(len(self.word_ids))
+
+    def __len__(self):
+        return self.n_sent
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n_sent
+        if not 0 <= index < self.n_sent:
+            raise IndexError('Sentence index out of range.')
+        return CompactSentence(self, index)
+
+    def __iter__(self):
+        for index in range(self.n_sent):
+            yield CompactSentence(self, index)
+
+    def convert_to_crf_format(self, stem=True, custom_dict=dict()):
+        '''Convert the corpus into the CRFsuite format.'''
+        return [sentence.to_crf_format(stem=stem, custom_dict=custom_dict) for sentence in self]
+
+
+class CompactSentence:
+    '''View on one sentence of a Compact_IGT_Corpus.
+
+    The split lists are decoded from the corpus arrays on access.'''
+    __slots__ = ('corpus', 'index')
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+
+    @property
+    def test(self):
+        return self.corpus.test
+
+    @property
+    def split_source(self):
+        corpus = self.corpus
+        morph_vocab = corpus.morph_vocab.strings
+        start, end = corpus.offsets[self.index], corpus.offsets[self.index + 1]
+        return [morph_vocab[morph_id] for morph_id in corpus.morph_ids[start:end]]
+
+    @property
+    def split_gloss(self):
+        corpus = self.corpus
+        if corpus.test: # Gloss not available
+            return ['']
+        gloss_vocab = corpus.gloss_vocab.strings
+        start, end = corpus.offsets[self.index], corpus.offsets[self.index + 1]
+        return [gloss_vocab[gloss_id] for gloss_id in corpus.gloss_ids[start:end]]
+
+    @property
+    def split_translation(self):
+        corpus = self.corpus
+        word_vocab = corpus.word_vocab.strings
+        start, end = corpus.word_offsets[self.index], corpus.word_offsets[self.index + 1]
+        return [word_vocab[word_id] for word_id in corpus.word_ids[start:end]]
+
+    @property
+    def source(self):
+        return cgpf.pred_to_igt_format(self.split_source)
+
+    @property
+    def gloss(self):
+        return '' if self.test else cgpf.pred_to_igt_format(self.split_gloss)
+
+    @property
+    def pp_translation(self):
+        return ' '.join(self.split_translation)
+
+    def to_crf_format(self, stem=False, custom_dict=dict()):
+        '''Convert the sentence into the CRFsuite format (see Sentence.to_crf_format).'''
+        return cgpf.units_to_crf_format(self.split_source, self.split_gloss, test=self.test,
+                                        stem=stem, custom_dict=custom_dict)
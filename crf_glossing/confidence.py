@@ -0,0 +1,153 @@
+'''Per-morpheme confidence: top-k labels and their marginal probabilities.
+
+The marginals are computed in batches with the forward-backward algorithm,
+on the NumPy export of the CRF model (see viterbi.ViterbiDecoder), and only
+the k most probable labels of each morpheme are kept, in flat arrays:
+
+    label_ids (n_morphemes, k) int32, probabilities (n_morphemes, k) float32,
+    offsets (n_sentences + 1) int64: the morphemes of sentence i are the rows
+    offsets[i] to offsets[i + 1].
+
+The stem label can then be replaced with the majority label (as in
+apply_majority_label), keeping its probability, and the scores saved with
+NumPy (no per-token Python objects).
+
+    decoder = ViterbiDecoder.from_model('model.crfsuite')
+    scores = top_k_marginals(decoder, [sentence.split_source for sentence in test_corpus], k=3)
+    scores = scores.apply_majority_label(majority_dictionary, test_corpus)
+    scores.save('scores.npz')
+'''
+import numpy as np
+
+import crf_glossing.instrument as instrument
+import crf_glossing.majority_label as ml
+
+
+class LabelScores:
+    '''Top-k labels of each morpheme of a corpus and their probabilities.
+
+    Parameters
+    ----------
+    labels : list [labels (string)]
+        Label of each label id
+    label_ids : numpy array int32 (n_morphemes, k)
+        Most probable labels of each morpheme (by decreasing probability)
+    probabilities : numpy array float32 (n_morphemes, k)
+        Marginal probability of each of these labels
+    offsets : numpy array int64 (n_sentences + 1)
+        Index of the first morpheme of each sentence (and the total number of morphemes)
+    '''
+    def __init__(self, labels, label_ids, probabilities, offsets):
+        self.labels = list(labels)
+        self.label_ids = label_ids
+        self.probabilities = probabilities
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def k(self):
+        return self.label_ids.shape[1]
+
+    def sentence(self, i):
+        '''Label ids and probabilities (n_morphemes, k) of the sentence i.'''
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.label_ids[start:end], self.probabilities[start:end]
+
+    def sentence_labels(self, i):
+        '''Top-k (label, probability) pairs of each morpheme of the sentence i.'''
+        label_ids, probabilities = self.sentence(i)
+        return [[(self.labels[label], float(probability)) for label, probability in zip(row_ids, row_probabilities)]
+                for row_ids, row_probabilities in zip(label_ids.tolist(), probabilities.tolist())]
+
+    def best(self):
+        '''Most probable label of each morpheme (list of sentences).'''
+        best_labels = np.asarray(self.labels, dtype=object)[self.label_ids[:, 0]]
+        return [best_labels[self.offsets[i]:self.offsets[i + 1]].tolist() for i in range(len(self))]
+
+    def apply_majority_label(self, majority_dictionary, corpus, backoff=None):
+        '''Replace the stem label with the majority label of each morpheme (see apply_majority_label).
+
+        The replaced labels keep their probability. corpus: the sentences of the scores.
+        Returns new LabelScores (with the glosses added to the labels).'''
+        if 'stem' not in self.labels:
+            return self
+        stem_id = self.labels.index('stem')
+        labels = list(self.labels)
+        label_index = {label: i for i, label in enumerate(labels)}
+        morpheme_glosses = np.full(len(self.label_ids), stem_id, dtype=np.int32) # Gloss id of each morpheme
+        has_stem = (self.label_ids == stem_id).any(axis=1)
+        n_sent = 0
+        for i, sentence in enumerate(corpus):
+            n_sent += 1
+            start, end = self.offsets[i], self.offsets[i + 1]
+            split_source = sentence.split_source # Decoded on each access for a CompactSentence
+            assert end - start == len(split_source), \
+                f'Number of morphemes do not match: {end - start} and {len(split_source)}.'
+            for j in np.flatnonzero(has_stem[start:end]):
+                gloss = ml.stem_gloss(split_source[j], majority_dictionary, backoff=backoff)
+                if gloss not in label_index:
+                    label_index[gloss] = len(labels)
+                    labels.append(gloss)
+                morpheme_glosses[start + j] = label_index[gloss]
+        assert n_sent == len(self), f'Number of sentences do not match: {len(self)} and {n_sent}.'
+        label_ids = np.where(self.label_ids == stem_id, morpheme_glosses[:, None], self.label_ids)
+        return LabelScores(labels, label_ids.astype(np.int32), self.probabilities, self.offsets)
+
+    def save(self, path):
+        '''Save the scores in a NumPy .npz file.'''
+        np.savez(path, labels=np.asarray(self.labels, dtype=str), label_ids=self.label_ids,
+                 probabilities=self.probabilities, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        '''Load scores saved with save.'''
+        with np.load(path) as data:
+            return cls(data['labels'].tolist(), data['label_ids'], data['probabilities'], data['offsets'])
+
+
+def logsumexp(scores, axis):
+    maximum = scores.max(axis=axis, keepdims=True)
+    maximum = np.where(np.isfinite(maximum), maximum, 0.0)
+    return np.log(np.exp(scores - maximum).sum(axis=axis)) + np.squeeze(maximum, axis=axis)
+
+def marginals(emissions, transitions):
+    '''Marginal probabilities (n_sent, length, n_labels) of the labels of each position.
+
+    emissions: state scores (n_sent, length, n_labels); transitions: (n_labels, n_labels).'''
+    n_sent, length, n_labels = emissions.shape
+    alpha = np.empty_like(emissions)
+    beta = np.empty_like(emissions)
+    alpha[:, 0] = emissions[:, 0]
+    for t in range(1, length):
+        alpha[:, t] = logsumexp(alpha[:, t - 1, :, None] + transitions[None], axis=1) + emissions[:, t]
+    beta[:, -1] = 0.0
+    for t in range(length - 2, -1, -1):
+        beta[:, t] = logsumexp(transitions[None] + (emissions[:, t + 1] + beta[:, t + 1])[:, None, :], axis=2)
+    log_partition = logsumexp(alpha[:, -1], axis=1)
+    return np.exp(alpha + beta - log_partition[:, None, None])
+
+def top_k_marginals(decoder, sentences=None, X=None, k=3):
+    '''Top-k labels and marginal probabilities of each morpheme, in batches.
+
+    decoder: ViterbiDecoder of the CRF model.
+    sentences: lists of morphemes (e.g., split_source), or X: featurized sentences.
+    Returns LabelScores.'''
+    lengths = [len(sentence) for sentence in (sentences if sentences is not None else X)]
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    k = min(k, decoder.n_labels)
+    label_ids = np.zeros((offsets[-1], k), dtype=np.int32)
+    probabilities = np.zeros((offsets[-1], k), dtype=np.float32)
+
+    with instrument.stage('top_k_marginals', len(lengths)):
+        for bucket, emissions in decoder.emission_batches(X=X, sentences=sentences):
+            bucket_marginals = marginals(emissions, decoder.transitions)
+            top = np.argpartition(-bucket_marginals, k - 1, axis=2)[:, :, :k]
+            top_probabilities = np.take_along_axis(bucket_marginals, top, axis=2)
+            order = np.argsort(-top_probabilities, axis=2, kind='stable')
+            rows = (offsets[bucket][:, None] + np.arange(emissions.shape[1])[None, :]).ravel()
+            label_ids[rows] = np.take_along_axis(top, order, axis=2).reshape(-1, k)
+            probabilities[rows] = np.take_along_axis(top_probabilities, order, axis=2).reshape(-1, k)
+    return LabelScores(decoder.labels, label_ids, probabilities, offsets)
@@ -0,0 +1,115 @@
+'''Binary on-disk cache of parsed corpora, loaded back with mmap.
+
+File layout: magic string, header length (uint64), JSON header (options,
+vocabularies, and the position of each array), then the raw integer arrays
+(each aligned on 8 bytes).'''
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import crf_glossing.compact as compact
+import crf_glossing.process_file as cgpf
+
+
+MAGIC = b'CRFGLOSS'
+FORMAT_VERSION = 1
+ARRAY_NAMES = ['morph_ids', 'gloss_ids', 'offsets', 'word_ids', 'word_offsets']
+
+
+def file_hash(path, block_size=1 << 20):
+    '''Compute the SHA-256 hash of the content of a file.'''
+    file_sha = hashlib.sha256()
+    with open(path, 'rb') as in_file:
+        for block in iter(lambda: in_file.read(block_size), b''):
+            file_sha.update(block)
+    return file_sha.hexdigest()
+
+def corpus_key(path, test=False, tilde=False, lower=True, equal=True):
+    '''Cache key of a corpus file: content hash and preprocessing options.'''
+    options = {'format': FORMAT_VERSION, 'content': file_hash(path), 'test': test,
+               'tilde': tilde, 'lower': lower, 'equal': equal}
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def save_corpus(corpus, path, options=dict()):
+    '''Save a Compact_IGT_Corpus in the binary cache format.
+
+    options: preprocessing options stored in the header (for information).'''
+    header = {'version': FORMAT_VERSION, 'byteorder': sys.byteorder, 'test': corpus.test,
+              'options': options, 'arrays': dict(),
+              'vocabularies': [vocab.strings for vocab in corpus.vocabularies]}
+    position = 0
+    buffers = []
+    for name in ARRAY_NAMES:
+        buffer = getattr(corpus, name)
+        if not isinstance(buffer, array):
+            buffer = array(buffer.format, buffer)
+        header['arrays'][name] = {'typecode': buffer.typecode, 'length': len(buffer),
+                                  'position': position}
+        buffers.append(buffer)
+        position += _padded(len(buffer) * buffer.itemsize)
+
+    json_header = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    json_header += b' ' * (_padded(len(json_header)) - len(json_header))
+
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'wb') as out_file:
+        out_file.write(MAGIC)
+        out_file.write(struct.pack('<Q', len(json_header)))
+        out_file.write(json_header)
+        for buffer in buffers:
+            raw = buffer.tobytes()
+            out_file.write(raw)
+            out_file.write(b'\0' * (_padded(len(raw)) - len(raw)))
+    os.replace(temp_path, path) # Atomic: concurrent readers never see a partial file
+
+def load_corpus(path):
+    '''Load a corpus saved with save_corpus without re-parsing it.
+
+    The integer arrays are memory-mapped (read-only) memoryviews on the file.'''
+    with open(path, 'rb') as in_file:
+        mapped = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'{path} is not a corpus cache file.')
+    header_start = len(MAGIC) + 8
+    header_length = struct.unpack('<Q', mapped[len(MAGIC):header_start])[0]
+    header = json.loads(mapped[header_start:header_start + header_length].decode('utf-8'))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f'Unsupported corpus cache version: {header["version"]}.')
+
+    data_start = header_start + header_length
+    view = memoryview(mapped)
+    buffers = []
+    for name in ARRAY_NAMES:
+        info = header['arrays'][name]
+        start = data_start + info['position']
+        raw = view[start:start + info['length'] * array(info['typecode']).itemsize]
+        if header['byteorder'] == sys.byteorder:
+            buffers.append(raw.cast(info['typecode']))
+        else: # Copy needed to swap the bytes
+            buffer = array(info['typecode'], raw.tobytes())
+            buffer.byteswap()
+            buffers.append(buffer)
+    vocabularies = tuple(compact.Vocabulary(strings) for strings in header['vocabularies'])
+    return compact.Compact_IGT_Corpus.from_buffers(*buffers, vocabularies=vocabularies,
+                                                   test=header['test'])
+
+def load_or_parse(path, cache_dir, test=False, tilde=False, lower=True, equal=True):
+    '''Load a corpus file from the cache, parsing (and caching) it on a miss.'''
+    key = corpus_key(path, test=test, tilde=tilde, lower=lower, equal=equal)
+    cache_path = os.path.join(cache_dir, f'{key}.igtc')
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        stream = cgpf.IGT_Stream(path, test=test, tilde=tilde, lower=lower, equal=equal)
+        corpus = compact.Compact_IGT_Corpus(stream, test=test)
+        save_corpus(corpus, cache_path, options={'source': os.path.abspath(path), 'tilde': tilde,
+                                                 'lower': lower, 'equal': equal})
+    return load_corpus(cache_path)
+
+def _padded(n_bytes):
+    '''Round a number of bytes up to a multiple of 8.'''
+    return (n_bytes + 7) // 8 * 8
@@ -1,7 +1,7 @@
 """Defines models and functions for loading, manipulating, and writing task data"""
 """Code from the SIGMORPHON 2023 Shared Task on Interlinear Glossing: https://github.com/sigmorphon/2023glossingST/ ."""
 
-from typing import Optional, List
+from typing import Optional, List, Iterator
 import re
 # from datasets import Dataset, DatasetDict
 # import torch
@@ -50,8 +50,11 @@ class IGTLine:
 
 def load_data_file(path: str) -> List[IGTLine]:
     """Loads a file containing IGT data into a list of entries."""
-    all_data = []
+    return list(iter_data_file(path))
 
+
+def iter_data_file(path: str) -> Iterator[IGTLine]:
+    """Lazily reads a file containing IGT data, yielding one entry at a time."""
     with open(path, 'r', encoding='utf-8') as file:
         current_entry = [None, None, None, None]  # transc, segm, gloss, transl
 
@@ -69,28 +72,27 @@ def load_data_file(path: str) -> List[IGTLine]:
             elif line_prefix == '\\l' and current_entry[3] == None:
                 current_entry[3] = line[3:].strip()
                 # Once we have the translation, we've reached the end and can save this entry
-                all_data.append(IGTLine(transcription=current_entry[0],
-                                        segmentation=current_entry[1],
-                                        glosses=current_entry[2],
-                                        translation=current_entry[3]))
+                yield IGTLine(transcription=current_entry[0],
+                              segmentation=current_entry[1],
+                              glosses=current_entry[2],
+                              translation=current_entry[3])
                 current_entry = [None, None, None, None]
             elif line.strip() != "":
                 # Something went wrong
                 print("Skipping line: ", line)
             else:
                 if not current_entry == [None, None, None, None]:
-                    all_data.append(IGTLine(transcription=current_entry[0],
-                                            segmentation=current_entry[1],
-                                            glosses=current_entry[2],
-                                            translation=None))
+                    yield IGTLine(transcription=current_entry[0],
+                                  segmentation=current_entry[1],
+                                  glosses=current_entry[2],
+                                  translation=None)
                     current_entry = [None, None, None, None]
         # Might have one extra line at the end
         if not current_entry == [None, None, None, None]:
-            all_data.append(IGTLine(transcription=current_entry[0],
-                                    segmentation=current_entry[1],
-                                    glosses=current_entry[2],
-                                    translation=None))
-    return all_data
+            yield IGTLine(transcription=current_entry[0],
+                          segmentation=current_entry[1],
+                          glosses=current_entry[2],
+                          translation=None)
 
 
 # def create_encoder(train_data: List[IGTLine], threshold: int, tokenizer, model_type: ModelType = ModelType.SEQ_TO_SEQ, split_morphemes=False):
@@ -1,57 +1,178 @@
+import sys
+import zlib
+from collections import Counter
+from functools import lru_cache, partial
+from itertools import repeat
+
 import sklearn_crfsuite
 
+import crf_glossing.instrument as instrument
+import crf_glossing.utils as utils
 
-# Default CRF features (from CRF suite documentation) + additional features for glossing
-def morph2features(sentence, i):
-    morph = sentence[i][0]
 
-    def is_boundary(morpheme):
-        '''Outputs whether the morpheme is a morpheme boundary or not.'''
-        return morpheme in ['-', '=']
+# Maximum number of morpheme types whose intrinsic features are kept in memory
+MORPH_CACHE_SIZE = 2 ** 16
+# Default number of buckets of the hashed feature space (see hash_features)
+HASH_SIZE = 2 ** 18
 
-    features = {
+def is_boundary(morpheme):
+    '''Outputs whether the morpheme is a morpheme boundary or not.'''
+    return morpheme in ['-', '=']
+
+@lru_cache(maxsize=MORPH_CACHE_SIZE)
+def morph_features(morph):
+    '''Compute the features of a morpheme type once (cached).
+
+    Returns the feature pieces used at each position of the window:
+    (current morpheme, previous morpheme, second previous morpheme, next morpheme, is_boundary).'''
+    lower = sys.intern(morph.lower())
+    length = len(morph)
+    boundary = is_boundary(morph)
+    current = {
         'bias': 1.0,
-        'morph.lower()': morph.lower(), # the morpheme itself
+        'morph.lower()': lower, # the morpheme itself
         # 'morph.isupper()': morph.isupper(), 
         'morph.istitle()': morph.istitle(), # Is the morpheme in title case?
         'morph.isdigit()': morph.isdigit(), # Is the morpheme only digits?
-        'morph.length': len(morph), # the morpheme length
-        'morph.is_boundary': is_boundary(morph), # Is it a morpheme boundary?
+        'morph.length': length, # the morpheme length
+        'morph.is_boundary': boundary, # Is it a morpheme boundary?
+    }
+    previous = {
+        '-1:morph.lower()': lower, # the previous morpheme
+        '-1:morph.length': length, # the length of the previous morpheme
+        '-1:morph.is_boundary': boundary, # the previous element is a morpheme boundary?
     }
+    previous2 = {
+        '-2:morph.lower()': lower, # morpheme itself
+        '-2:morph.length': length, # length 
+    }
+    following = {
+        '+1:morph.lower()': lower, # the next morpheme
+        '+1:morph.length': length, # the length of the next morpheme
+        #'+1:morph.is_boundary': is_boundary(next_morph), # the next element is a morpheme boundary?
+    }
+    return current, previous, previous2, following, boundary
+
+# Default CRF features (from CRF suite documentation) + additional features for glossing
+def morph2features(sentence, i):
+    return window2features([morph_features(morph) for morph, _ in sentence], i)
+
+def window2features(pieces, i):
+    '''Assemble the features of position i from the cached morpheme features.'''
+    features = pieces[i][0].copy()
 
     # Previous morpheme
     if i > 0:
-        prev_morph = sentence[i - 1][0]
-        features.update({
-            '-1:morph.lower()': prev_morph.lower(), # the previous morpheme
-            '-1:morph.length': len(prev_morph), # the length of the previous morpheme
-            '-1:morph.is_boundary': is_boundary(prev_morph), # the previous element is a morpheme boundary?
-        })
-        if (i > 1) and (is_boundary(prev_morph)): # if the previous morpheme is a morpheme boundary
-            prev2_morph = sentence[i - 2][0]
-            features.update({
-                '-2:morph.lower()': prev2_morph.lower(), # morpheme itself
-                '-2:morph.length': len(prev2_morph), # length 
-            })
+        features.update(pieces[i - 1][1])
+        if (i > 1) and pieces[i - 1][4]: # if the previous morpheme is a morpheme boundary
+            features.update(pieces[i - 2][2])
     else:
         features['BOS'] = True # beginning of the sentence
 
     # Next morpheme
-    if i < len(sentence) - 1:
-        next_morph = sentence[i + 1][0]
-        features.update({
-            '+1:morph.lower()': next_morph.lower(), # the next morpheme
-            '+1:morph.length': len(next_morph), # the length of the next morpheme
-            #'+1:morph.is_boundary': is_boundary(next_morph), # the next element is a morpheme boundary?
-        })
+    if i < len(pieces) - 1:
+        features.update(pieces[i + 1][3])
     else:
         features['EOS'] = True # end of the sentence
 
     return features
 
 
-def sent2features(sentence):
-    return [morph2features(sentence, i) for i in range(len(sentence))]
+@instrument.timed('sent2features', items=len, aggregate=True)
+def sent2features(sentence, translation=None, hash_size=None):
+    '''Features of each position of a sentence (CRFsuite format).
+
+    translation: words of the translation (split_translation), added to every
+    position as bag-of-words features (None: no translation features).
+    hash_size: map the features to this number of buckets (see hash_features).'''
+    pieces = [morph_features(morph) for morph, _ in sentence]
+    features = [window2features(pieces, i) for i in range(len(sentence))]
+    if translation is None and hash_size is None:
+        return features
+    words = translation_features(translation or [])
+    if hash_size is None:
+        for position in features:
+            position.update(words)
+        return features
+    words = hash_features(words, hash_size)
+    return [hash_features(position, hash_size, words) for position in features]
+
+def translation_features(words):
+    '''Bag-of-words features of the translation of a sentence (empty words, e.g., of an empty translation, skipped).'''
+    return {f'translation:{word}': 1.0 for word in words if word}
+
+@lru_cache(maxsize=MORPH_CACHE_SIZE)
+def feature_bucket(name, hash_size):
+    '''Bucket of a feature name: stable across processes and runs (unlike hash).'''
+    return f'h{zlib.crc32(name.encode("utf-8")) % hash_size}'
+
+def hash_features(features, hash_size=HASH_SIZE, hashed=None):
+    '''Map the features of a position to a fixed number of buckets (feature hashing).
+
+    A string value is the feature "key:value" of value 1 (as for crfsuite),
+    the other values keep their key; the values of the features falling in
+    the same bucket are added up. The model then has at most hash_size
+    attributes, whatever the size of the vocabulary.
+    hashed: features already hashed (e.g., of the translation) to add.'''
+    buckets = dict(hashed) if hashed else dict()
+    for key, value in features.items():
+        if isinstance(value, str):
+            name, value = f'{key}:{value}', 1.0
+        else:
+            name, value = key, float(value)
+        if value == 0.0: # Ignored by crfsuite
+            continue
+        bucket = feature_bucket(name, hash_size)
+        buckets[bucket] = buckets.get(bucket, 0.0) + value
+    return buckets
+
+def _sent_translation2features(item, hash_size=None):
+    sentence, translation = item
+    return sent2features(sentence, translation=translation, hash_size=hash_size)
+
+def corpus2features(sentences, n_jobs=None, chunksize=None, min_parallel=1000, translations=None, hash_size=None):
+    '''Featurize a whole corpus (list of sentences in the CRFsuite format) in parallel.
+
+    The sentences are sharded across a process pool and the original order is kept.
+    Small corpora (fewer than min_parallel sentences) are featurized serially.
+    translations: translation words of each sentence; hash_size: see sent2features.'''
+    with instrument.stage('corpus2features') as current_stage:
+        if translations is None and hash_size is None:
+            X = utils.parallel_map(sent2features, sentences, n_jobs=n_jobs,
+                                   chunksize=chunksize, min_parallel=min_parallel)
+        else:
+            translations = repeat(None) if translations is None else translations
+            X = utils.parallel_map(partial(_sent_translation2features, hash_size=hash_size),
+                                   zip(sentences, translations), n_jobs=n_jobs,
+                                   chunksize=chunksize, min_parallel=min_parallel)
+        current_stage.items = len(X)
+    return X
+
+# Feature pruning
+def attribute_frequencies(X):
+    '''Number of positions where each string-valued feature (key, value) occurs.
+
+    crfsuite turns each of them into its own attribute ("key:value"), unlike the
+    boolean and numeric features (one attribute per key).'''
+    frequencies = Counter()
+    for sentence in X:
+        for features in sentence:
+            frequencies.update((key, value) for key, value in features.items() if isinstance(value, str))
+    return frequencies
+
+def prune_features(X, min_freq=2, frequencies=None):
+    '''Drop the string-valued features occurring fewer than min_freq times (e.g., rare morphemes).
+
+    frequencies: attribute_frequencies of the training features (computed on X otherwise).
+    The other features are kept, so each position still has its boolean and numeric features.'''
+    if min_freq <= 1:
+        return X
+    if frequencies is None:
+        frequencies = attribute_frequencies(X)
+    with instrument.stage('prune_features', len(X)):
+        return [[{key: value for key, value in features.items()
+                  if not isinstance(value, str) or frequencies[(key, value)] >= min_freq}
+                 for features in sentence] for sentence in X]
 
 def sent2labels(sentence):
     return [label for token, label in sentence]
@@ -0,0 +1,235 @@
+'''Incremental retraining on newly annotated sentences.
+
+Each sentence block of the corpus is identified by a hash of its text and of
+the preprocessing options. A persistent feature store (SQLite) keeps, for
+each hash, the morphemes and glosses of the sentence, its CRF labels, and its
+features: when the corpus is updated, only the new or changed blocks are
+parsed and featurized. The majority lexicon is updated in place when the new
+sentences follow the previous corpus; when sentences were edited, removed,
+or inserted, it is recounted from the stored morphemes and glosses (without
+parsing), so that its ties are broken as by a full count.
+
+crfsuite cannot start training from the weights of a previous model, so the
+CRF itself is retrained on all the stored features (streamed from the store,
+not re-featurized); the training is skipped when neither the corpus nor the
+parameters changed.
+
+    trainer = IncrementalTrainer('models/git')
+    model = trainer.update('git-train-track2-uncovered') # Every day, after the new annotations
+'''
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+
+import sklearn_crfsuite
+
+import crf_glossing.features as cgfeat
+import crf_glossing.instrument as instrument
+import crf_glossing.majority_label as ml
+import crf_glossing.process_file as cgpf
+from crf_glossing.model import GlossingModel, MODEL_FILE, COUNTS_FILE, crf_params
+
+
+STORE_FILE = 'features.sqlite'
+MANIFEST_FILE = 'manifest.json'
+STORE_VERSION = 1
+
+
+def block_key(block, options):
+    '''Hash of a sentence block (string) and of the options it is processed with.'''
+    content = json.dumps(options, sort_keys=True) + '\n' + block.strip()
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class FeatureStore:
+    '''Persistent store of featurized sentences: key -> (units, labels, features).
+
+    The columns are pickled separately, so that the units (for the lexicon)
+    and the labels can be read without loading the features.
+
+    Parameters
+    ----------
+    path : string
+        Path to the SQLite database (created if needed)
+    '''
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sentences '
+                                '(key TEXT PRIMARY KEY, units BLOB, labels BLOB, features BLOB)')
+
+    def __contains__(self, key):
+        return self.connection.execute('SELECT 1 FROM sentences WHERE key = ?', (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM sentences').fetchone()[0]
+
+    def keys(self):
+        return [key for (key,) in self.connection.execute('SELECT key FROM sentences')]
+
+    def add(self, entries):
+        '''Store (key, units, labels, features) entries.'''
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO sentences VALUES (?, ?, ?, ?)',
+                ((key, self._dumps(units), self._dumps(labels), self._dumps(features))
+                 for key, units, labels, features in entries))
+
+    def delete(self, keys):
+        with self.connection:
+            self.connection.executemany('DELETE FROM sentences WHERE key = ?', ((key,) for key in keys))
+
+    def column(self, name, keys, batch_size=500):
+        '''Values of a column (units, labels, or features) for the keys, in order (generator).
+
+        The keys are fetched batch_size at a time (one SELECT ... IN query per batch).'''
+        assert name in ('units', 'labels', 'features'), f'Unknown column {name}.'
+        keys = list(keys)
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            unique_keys = list(dict.fromkeys(batch))
+            query = f'SELECT key, {name} FROM sentences WHERE key IN ({", ".join("?" * len(unique_keys))})'
+            values = dict(self.connection.execute(query, unique_keys))
+            for key in batch:
+                yield pickle.loads(values[key])
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class IncrementalTrainer:
+    '''Keeps a model (CRF and majority lexicon) up to date with a growing corpus.
+
+    The directory holds the feature store, the lexicon counts, the manifest
+    (keys of the corpus sentences in order, options), and the GlossingModel
+    files (see GlossingModel.save), so it can be loaded with GlossingModel.load.
+
+    Parameters
+    ----------
+    directory : string
+        Directory of the model and of its feature store
+    stem : bool
+        Replace the lexical glosses with the stem label (see to_crf_format)
+    custom_dict : dict
+        Custom dictionary (see to_crf_format)
+    tilde, lower, equal : bool
+        Preprocessing options (see Sentence)
+    n_jobs : int
+        Number of processes to featurize the new sentences (see corpus2features)
+    crf_parameters : sklearn_crfsuite.CRF parameters (notebook defaults otherwise)
+    '''
+    def __init__(self, directory, stem=True, custom_dict=dict(), tilde=False, lower=True, equal=True,
+                 n_jobs=None, **crf_parameters):
+        self.directory = directory
+        self.stem = stem
+        self.custom_dict = custom_dict
+        self.options = {'version': STORE_VERSION, 'stem': stem, 'custom_dict': custom_dict,
+                        'tilde': tilde, 'lower': lower, 'equal': equal}
+        self.n_jobs = n_jobs
+        self.crf_parameters = crf_params(**crf_parameters)
+        os.makedirs(directory, exist_ok=True)
+
+        self.manifest = {'keys': [], 'crf_parameters': None}
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as in_file:
+                manifest = json.load(in_file)
+            if manifest['options'] == self.options: # Otherwise, every sentence is processed again
+                self.manifest = manifest
+        counts_path = os.path.join(directory, COUNTS_FILE)
+        if self.manifest['keys'] and os.path.exists(counts_path):
+            self.lexicon = ml.MajorityLexicon.load(counts_path)
+        else:
+            self.lexicon = ml.MajorityLexicon()
+            self.manifest['keys'] = []
+
+    def update(self, source, prune=True):
+        '''Bring the model up to date with the whole (edited or extended) corpus.
+
+        source: path to the corpus file, or iterable of its lines.
+        prune: delete the stored features of the sentences no longer in the corpus.
+        Returns the GlossingModel.'''
+        return self._update(self._blocks(source), prune=prune)
+
+    def append(self, source):
+        '''Add new sentences (path or iterable of lines) after the current corpus.'''
+        return self._update(self._blocks(source), previous=self.manifest['keys'], prune=False)
+
+    def _blocks(self, source):
+        if isinstance(source, str):
+            with open(source, 'r', encoding='utf-8') as corpus_file:
+                yield from cgpf.iter_blocks(corpus_file)
+        else:
+            yield from cgpf.iter_blocks(source)
+
+    def _update(self, blocks, previous=(), prune=True):
+        store = FeatureStore(os.path.join(self.directory, STORE_FILE))
+        try:
+            keys = list(previous)
+            stored_keys = set(store.keys())
+            new_blocks = dict()
+            for block in blocks:
+                key = block_key(block, self.options)
+                keys.append(key)
+                if key not in new_blocks and key not in stored_keys:
+                    new_blocks[key] = block
+            self._featurize(new_blocks, store)
+
+            # Majority lexicon: the new sentences are added if they follow the previous corpus;
+            # otherwise, it is recounted from the stored units (ties depend on the corpus order,
+            # see MajorityLexicon)
+            old_keys = self.manifest['keys']
+            if keys[:len(old_keys)] == old_keys:
+                for units in store.column('units', keys[len(old_keys):]):
+                    self.lexicon.add_sentence(units)
+            else:
+                self.lexicon = ml.MajorityLexicon.from_corpus(store.column('units', keys))
+
+            model_path = os.path.join(self.directory, MODEL_FILE)
+            unchanged = (keys == self.manifest['keys'] and self.crf_parameters == self.manifest['crf_parameters']
+                         and os.path.exists(model_path))
+            if not unchanged:
+                self._train(store, keys, model_path)
+            if prune:
+                store.delete(set(store.keys()) - set(keys))
+        finally:
+            store.close()
+
+        self.manifest = {'options': self.options, 'crf_parameters': self.crf_parameters, 'keys': keys}
+        self._save()
+        return GlossingModel.load(self.directory)
+
+    def _featurize(self, new_blocks, store):
+        '''Parse and featurize the new sentence blocks, and store them.'''
+        with instrument.stage('incremental_featurize', len(new_blocks)):
+            sentences = [cgpf.parse_block(block, test=False, tilde=self.options['tilde'],
+                                          lower=self.options['lower'], equal=self.options['equal'])
+                         for block in new_blocks.values()]
+            crf_sents = list(cgpf.sentences_to_crf_format(sentences, stem=self.stem, custom_dict=self.custom_dict))
+            X = cgfeat.corpus2features(crf_sents, n_jobs=self.n_jobs)
+            store.add((key, cgpf.Units(sentence.split_source, sentence.split_gloss), cgfeat.sent2labels(crf_sent), features)
+                      for key, sentence, crf_sent, features in zip(new_blocks, sentences, crf_sents, X))
+        print(f'{len(new_blocks)} new or changed sentences featurized.', file=sys.stderr)
+
+    def _train(self, store, keys, model_path):
+        '''Retrain the CRF on all the stored features (streamed from the store).'''
+        y = list(store.column('labels', keys))
+        crf = sklearn_crfsuite.CRF(model_filename=model_path, **self.crf_parameters)
+        with instrument.stage('crf_fit', len(keys)):
+            crf.fit(store.column('features', keys), y)
+
+    def _save(self):
+        self.lexicon.save(os.path.join(self.directory, COUNTS_FILE))
+        model = GlossingModel(os.path.join(self.directory, MODEL_FILE), self.lexicon.to_dict(),
+                              stem=self.stem, custom_dict=self.custom_dict)
+        model.save(self.directory)
+        temp_path = os.path.join(self.directory, f'{MANIFEST_FILE}.tmp{os.getpid()}')
+        with open(temp_path, 'w', encoding='utf-8') as out_file:
+            json.dump(self.manifest, out_file)
+        os.replace(temp_path, os.path.join(self.directory, MANIFEST_FILE))
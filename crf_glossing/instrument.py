@@ -0,0 +1,233 @@
+'''Opt-in timing and memory instrumentation of the pipeline stages.
+
+Disabled by default: stages then cost a single flag check. Enable it with
+enable() (or the CRF_GLOSSING_INSTRUMENT environment variable: 1 for timings,
+memory for timings and peak allocations), run the pipeline, then export the
+statistics:
+
+    import crf_glossing.instrument as instrument
+    instrument.enable(trace_memory=True)
+    ...
+    print(instrument.summary())
+    instrument.export_json('stages.json')
+    instrument.export_trace('trace.json') # chrome://tracing or https://ui.perfetto.dev
+
+Two kinds of measurements are recorded:
+- stages (instrument.stage), with wall time, item count, and peak memory
+  allocated during the stage (if trace_memory is on);
+- hot functions called once per sentence (instrument.timed with aggregate=True),
+  whose calls are only summed up.
+
+The aggregates recorded in the worker processes of utils.parallel_map are sent
+back with the results and merged (see snapshot, aggregates_since, and merge);
+the stages run in the workers are not.
+'''
+import json
+import os
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+
+ENABLED = False
+TRACE_MEMORY = False
+
+_lock = threading.Lock()
+_local = threading.local()
+_events = [] # Stages: (name, start (ns), duration (ns), items, peak memory (bytes), thread id)
+_aggregates = dict() # Hot functions: name -> [calls, total time (ns), items]
+
+
+def enable(trace_memory=False):
+    '''Start recording; trace_memory also records the peak allocations (slower).'''
+    global ENABLED, TRACE_MEMORY
+    TRACE_MEMORY = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    ENABLED = True
+
+def disable():
+    '''Stop recording (the statistics are kept until reset).'''
+    global ENABLED
+    ENABLED = False
+    if TRACE_MEMORY and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def reset():
+    '''Delete all the recorded statistics.'''
+    with _lock:
+        _events.clear()
+        _aggregates.clear()
+
+
+class _NullStage:
+    '''Stage used when instrumentation is disabled: does nothing.'''
+    items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    '''Context manager recording one execution of a stage.
+
+    The number of items can be given at creation or set later (stage.items = n).'''
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        if TRACE_MEMORY and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack: # Keep the peak of the enclosing stage before resetting it
+                stack[-1].observed_peak = max(stack[-1].observed_peak, peak)
+            tracemalloc.reset_peak()
+            self.base_memory = self.observed_peak = current
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter_ns() - self.start
+        stack = _local.stack
+        stack.pop()
+        peak_memory = None
+        if TRACE_MEMORY and tracemalloc.is_tracing() and hasattr(self, 'base_memory'):
+            absolute_peak = max(self.observed_peak, tracemalloc.get_traced_memory()[1])
+            peak_memory = absolute_peak - self.base_memory
+            if stack:
+                stack[-1].observed_peak = max(stack[-1].observed_peak, absolute_peak)
+        with _lock:
+            _events.append((self.name, self.start, duration, self.items, peak_memory, threading.get_ident()))
+        return False
+
+
+def stage(name, items=None):
+    '''Record a stage: with instrument.stage('parse', n_sent): ...'''
+    if not ENABLED:
+        return _NULL_STAGE
+    return Stage(name, items)
+
+def timed(name, items=None, aggregate=False):
+    '''Decorator recording each call of a function as a stage.
+
+    items: function of the result giving the number of processed items (e.g., len).
+    aggregate: only sum up the calls (for functions called once per sentence).'''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            if aggregate:
+                start = time.perf_counter_ns()
+                result = function(*args, **kwargs)
+                add(name, time.perf_counter_ns() - start, items(result) if items is not None else 1)
+                return result
+            with Stage(name) as current_stage:
+                result = function(*args, **kwargs)
+                if items is not None:
+                    current_stage.items = items(result)
+            return result
+        return wrapper
+    return decorator
+
+def add(name, duration, items=1):
+    '''Add one call of a hot function (duration in ns) to its aggregated statistics.'''
+    with _lock:
+        aggregate = _aggregates.get(name)
+        if aggregate is None:
+            aggregate = _aggregates[name] = [0, 0, 0]
+        aggregate[0] += 1
+        aggregate[1] += duration
+        aggregate[2] += items
+
+def timed_iter(name, iterable):
+    '''Iterate over iterable, adding the time taken to produce each item to an aggregate.
+
+    For lazy readers (e.g., IGT_Stream), whose work happens between the items.'''
+    if not ENABLED:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter_ns()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        add(name, time.perf_counter_ns() - start)
+        yield item
+
+def snapshot():
+    '''Copy of the aggregated statistics (see aggregates_since).'''
+    with _lock:
+        return {name: list(aggregate) for name, aggregate in _aggregates.items()}
+
+def aggregates_since(before):
+    '''Aggregated statistics recorded since a snapshot, as {name: [calls, time (ns), items]}.'''
+    since = dict()
+    for name, aggregate in snapshot().items():
+        previous = before.get(name, [0, 0, 0])
+        if aggregate[0] > previous[0]:
+            since[name] = [value - previous_value for value, previous_value in zip(aggregate, previous)]
+    return since
+
+def merge(aggregates):
+    '''Add aggregated statistics recorded elsewhere (e.g., by aggregates_since in a worker process).'''
+    with _lock:
+        for name, (calls, duration, items) in aggregates.items():
+            aggregate = _aggregates.get(name)
+            if aggregate is None:
+                aggregate = _aggregates[name] = [0, 0, 0]
+            aggregate[0] += calls
+            aggregate[1] += duration
+            aggregate[2] += items
+
+
+def summary():
+    '''Statistics per stage: calls, wall time, items, throughput, and peak memory.'''
+    stats = dict()
+    with _lock:
+        for name, _, duration, items, peak_memory, _ in _events:
+            stage_stats = stats.setdefault(name, {'calls': 0, 'seconds': 0.0, 'items': 0, 'peak_memory_mb': None})
+            stage_stats['calls'] += 1
+            stage_stats['seconds'] += duration / 1e9
+            stage_stats['items'] += items or 0
+            if peak_memory is not None:
+                stage_stats['peak_memory_mb'] = max(stage_stats['peak_memory_mb'] or 0, peak_memory / 2 ** 20)
+        for name, (calls, duration, items) in _aggregates.items():
+            stats[name] = {'calls': calls, 'seconds': duration / 1e9, 'items': items, 'peak_memory_mb': None,
+                           'aggregated': True}
+    for stage_stats in stats.values():
+        seconds = stage_stats['seconds']
+        stage_stats['items_per_second'] = stage_stats['items'] / seconds if seconds > 0 and stage_stats['items'] else None
+    return stats
+
+def export_json(path):
+    '''Save the summary (see summary) as a JSON file.'''
+    with open(path, 'w', encoding='utf-8') as out_file:
+        json.dump(summary(), out_file, indent=4, sort_keys=True)
+
+def export_trace(path):
+    '''Save the stages in the Chrome trace event format (chrome://tracing, Perfetto).'''
+    pid = os.getpid()
+    with _lock:
+        trace_events = [{'name': name, 'ph': 'X', 'ts': start / 1000, 'dur': duration / 1000,
+                         'pid': pid, 'tid': thread_id,
+                         'args': {'items': items, 'peak_memory_bytes': peak_memory}}
+                        for name, start, duration, items, peak_memory, thread_id in _events]
+    with open(path, 'w', encoding='utf-8') as out_file:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, out_file)
+
+
+if os.environ.get('CRF_GLOSSING_INSTRUMENT', '') not in ('', '0'):
+    enable(trace_memory=os.environ.get('CRF_GLOSSING_INSTRUMENT') == 'memory')
@@ -0,0 +1,194 @@
+'''Indexed lexicon to gloss unknown stems with the closest known morpheme.
+
+Known morphemes are indexed once (character tries for shared prefixes and
+suffixes, a deletion index for small edit distances), so that a lookup never
+scans the whole vocabulary.'''
+from functools import lru_cache
+
+
+class TrieNode:
+    '''Node of a character trie.
+
+    best is the most frequent word stored in the subtree of the node.'''
+    __slots__ = ('children', 'word', 'weight', 'best', 'best_weight')
+
+    def __init__(self):
+        self.children = dict()
+        self.word = None
+        self.weight = 0
+        self.best = None
+        self.best_weight = 0
+
+
+class MorphemeTrie:
+    '''Character trie over known morphemes.
+
+    The longest shared prefix search only follows the path of the query.'''
+    def __init__(self):
+        self.root = TrieNode()
+        self.size = 0
+
+    def insert(self, word, weight=1):
+        node = self.root
+        self._update_best(node, word, weight)
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+            node = child
+            self._update_best(node, word, weight)
+        if node.word is None:
+            self.size += 1
+        node.word = word
+        node.weight = weight
+
+    @staticmethod
+    def _update_best(node, word, weight):
+        if node.best is None or weight > node.best_weight:
+            node.best = word
+            node.best_weight = weight
+
+    def longest_prefix(self, word):
+        '''Find a known word sharing the longest prefix with word.
+
+        Returns (length of the shared prefix, most frequent word with this prefix).'''
+        node = self.root
+        depth = 0
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                break
+            node = child
+            depth += 1
+        return depth, node.best
+
+    def __len__(self):
+        return self.size
+
+
+def deletions(word, max_distance=1):
+    '''All the strings obtained by deleting up to max_distance characters from word.'''
+    variants = {word}
+    current = {word}
+    for _ in range(max_distance):
+        current = {variant[:i] + variant[i + 1:] for variant in current for i in range(len(variant))}
+        variants |= current
+    return variants
+
+def edit_distance(word, other, max_distance):
+    '''Levenshtein distance between two words (max_distance + 1 if it is larger).'''
+    if abs(len(word) - len(other)) > max_distance:
+        return max_distance + 1
+    previous_row = list(range(len(other) + 1))
+    for i, char in enumerate(word, 1):
+        row = [i]
+        for j, other_char in enumerate(other, 1):
+            row.append(min(row[j - 1] + 1, previous_row[j] + 1, previous_row[j - 1] + (char != other_char)))
+        if min(row) > max_distance:
+            return max_distance + 1
+        previous_row = row
+    return previous_row[-1]
+
+
+class DeletionIndex:
+    '''Symmetric deletion index for bounded edit distance searches.
+
+    Each known word is indexed under all its variants with up to max_distance
+    deleted characters. Two words within max_distance edits share at least one
+    variant, so a query only checks the words indexed under its own variants,
+    whatever the size of the vocabulary.'''
+    def __init__(self, max_distance=1):
+        self.max_distance = max_distance
+        self.index = dict()
+        self.weights = dict()
+
+    def insert(self, word, weight=1):
+        self.weights[word] = weight
+        for variant in deletions(word, self.max_distance):
+            self.index.setdefault(variant, []).append(word)
+
+    def nearest(self, word):
+        '''Find the closest known word within max_distance edits.
+
+        Returns (distance, word), or (None, None) if there is no such word.
+        Ties are broken by weight, then alphabetically.'''
+        best = None # (distance, -weight, word): deterministic order
+        checked = set()
+        for variant in deletions(word, self.max_distance):
+            for candidate in self.index.get(variant, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                distance = edit_distance(word, candidate, self.max_distance)
+                if distance <= self.max_distance:
+                    key = (distance, -self.weights[candidate], candidate)
+                    if best is None or key < best:
+                        best = key
+        if best is None:
+            return None, None
+        return best[0], best[2]
+
+
+class BackoffLexicon:
+    '''Glosses unknown stems with the gloss of the closest known morpheme.
+
+    Only morphemes with a lexical majority label (neither a grammatical label
+    nor a boundary) are indexed. The closest known form is, in this order:
+    the morpheme itself, a morpheme within max_distance edits, or the morpheme
+    sharing the longest prefix or suffix (at least min_affix characters).
+
+    Parameters
+    ----------
+    majority_dictionary : dict {morpheme: gloss}
+        Majority label of each training morpheme (see create_majority_dict)
+    frequencies : dict {morpheme: int}
+        Frequency of each morpheme, to break ties (optional)
+    max_distance : int
+        Maximum edit distance for the nearest known morpheme
+    min_affix : int
+        Minimum length of the shared prefix or suffix
+    cache_size : int
+        Number of lookups kept in memory (repeated unknown morphemes)
+    '''
+    def __init__(self, majority_dictionary, frequencies=None, max_distance=1, min_affix=3, cache_size=2 ** 16):
+        self.max_distance = max_distance
+        self.min_affix = min_affix
+        self.glosses = dict()
+        self.prefix_trie = MorphemeTrie()
+        self.suffix_trie = MorphemeTrie() # Reversed morphemes
+        self.deletion_index = DeletionIndex(max_distance) if max_distance > 0 else None
+        for morph, gloss in majority_dictionary.items():
+            if gloss in ['-', '='] or gloss.isupper(): # Not a lexical gloss
+                continue
+            weight = 1 if frequencies is None else frequencies.get(morph, 1)
+            self.glosses[morph] = gloss
+            self.prefix_trie.insert(morph, weight)
+            self.suffix_trie.insert(morph[::-1], weight)
+            if self.deletion_index is not None:
+                self.deletion_index.insert(morph, weight)
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def closest(self, morph):
+        '''Find the closest known morpheme (None if nothing is close enough).'''
+        if morph in self.glosses:
+            return morph
+        if self.deletion_index is not None:
+            _, nearest = self.deletion_index.nearest(morph)
+            if nearest is not None:
+                return nearest
+        prefix_length, prefix_morph = self.prefix_trie.longest_prefix(morph)
+        suffix_length, suffix_morph = self.suffix_trie.longest_prefix(morph[::-1])
+        if max(prefix_length, suffix_length) < self.min_affix:
+            return None
+        if prefix_length >= suffix_length:
+            return prefix_morph
+        return suffix_morph[::-1]
+
+    def _lookup(self, morph):
+        closest = self.closest(morph)
+        return None if closest is None else self.glosses[closest]
+
+    def get(self, morph, default='UNK'):
+        '''Gloss of the closest known morpheme (default if nothing is close enough).'''
+        gloss = self.lookup(morph)
+        return default if gloss is None else gloss
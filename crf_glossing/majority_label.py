@@ -1,9 +1,10 @@
 '''Code from gloss_lost (majority_model.py). Modified.'''
+import json
+import os
 import re
 
-from collections import Counter
-
 # from gloss_lost.to_wapiti import LabelHandler
+import crf_glossing.instrument as instrument
 import crf_glossing.utils as utils
 
 
@@ -18,46 +19,167 @@ def reshape_counter(counter):
     return new_counter
 
 # Creating a dictionary with the majority label
+@instrument.timed('create_majority_dict', items=len)
 def create_majority_dict(train_corpus, label=None):
     '''Use training data to create a dictionary of label.
     
-    Training data in the IGT_Corpus object.'''
-    # split_data = utils.text_to_line(train_data)
-    maj_dict_list = []
-    # all_morph_list = []
-    # for line in split_data:
-    for sentence in train_corpus.sentences:
+    Training data in the IGT_Corpus object (or any iterable of Sentence objects).
+    Ties between labels are broken by their first occurrence in the corpus.'''
+    return MajorityLexicon.from_corpus(train_corpus).to_dict()
+
+
+class MajorityLexicon:
+    '''Majority label of each morpheme, built in one streaming pass.
+
+    Only the frequency of each (morpheme, label) pair is stored, never the
+    token stream, and the majority label is updated at each addition.
+    Annotated sentences can be added (or removed) incrementally, and the
+    lexicon can be saved and reloaded without recounting the corpus.
+    It can be used in place of the majority dictionary in apply_majority_label.
+
+    Ties are broken by the first occurrence of the labels: the majority labels
+    are those of create_majority_dict as long as the sentences are only added,
+    in corpus order. After a removal, the counts are exact, but a tie is broken
+    by the order in which the remaining labels were first added, which may
+    differ from their order in the remaining corpus (from_corpus recounts it).
+
+    Attributes
+    ----------
+    counts : dict {morpheme: {label: frequency}}
+        Frequency of each label of each morpheme (labels in order of first occurrence)
+    majority : dict {morpheme: label}
+        Current majority label of each morpheme
+    '''
+    def __init__(self):
+        self.counts = dict()
+        self.majority = dict()
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        '''Build the lexicon from an IGT_Corpus (or any iterable of Sentence objects).'''
+        lexicon = cls()
+        lexicon.update(corpus)
+        return lexicon
+
+    def add(self, morph, label, count=1):
+        '''Add count occurrences of a (morpheme, label) pair.'''
+        labels = self.counts.get(morph)
+        if labels is None: # New morpheme
+            self.counts[morph] = {label: count}
+            self.majority[morph] = label
+            return
+        new_count = labels.get(label, 0) + count
+        labels[label] = new_count
+        best = self.majority[morph]
+        if label != best:
+            best_count = labels[best]
+            if new_count > best_count or (new_count == best_count and self._first(labels, label, best)):
+                self.majority[morph] = label
+
+    def remove(self, morph, label, count=1):
+        '''Remove count occurrences of a (morpheme, label) pair (e.g., corrected annotation).
+
+        The new majority label is the most frequent one; ties are broken by first addition
+        (not necessarily the first occurrence in the remaining corpus).'''
+        labels = self.counts[morph]
+        new_count = labels[label] - count
+        assert new_count >= 0, f'Cannot remove {count} occurrences of ({morph}, {label}).'
+        if new_count > 0:
+            labels[label] = new_count
+        else:
+            del labels[label]
+        if not labels: # Morpheme no longer in the corpus
+            del self.counts[morph]
+            del self.majority[morph]
+        elif label == self.majority[morph]: # The majority label may have changed
+            self.majority[morph] = self._best(labels)
+
+    def add_sentence(self, sentence):
+        '''Add all (morpheme, gloss) pairs of an annotated sentence.'''
+        for morph, gloss in self._pairs(sentence):
+            self.add(morph, gloss)
+
+    def remove_sentence(self, sentence):
+        '''Remove all (morpheme, gloss) pairs of a previously added sentence.'''
+        for morph, gloss in self._pairs(sentence):
+            self.remove(morph, gloss)
+
+    def update(self, sentences):
+        '''Add an iterable of annotated sentences (e.g., newly annotated data).'''
+        for sentence in sentences:
+            self.add_sentence(sentence)
+
+    @staticmethod
+    def _pairs(sentence):
         split_source = sentence.split_source
         split_gloss = sentence.split_gloss
         m = len(split_source)
         assert m == len(split_gloss), f'Lengths do not match: {m} and {len(split_gloss)}.'
-        for j in range(m):
-            maj_dict_list.append((split_source[j], split_gloss[j])) # 2
-        # all_morph_list.append(split_line[0])
-    maj_counter = Counter(maj_dict_list)
-    # all_morph_set = set(all_morph_list)
-    #print(maj_counter)
-    
-    # Reshape the counter
-    resh_counter = reshape_counter(maj_counter)
-    #print(resh_counter)
-
-    # Keep the most frequent label only
-    new_dict = dict()
-    for (morph, lab_list) in resh_counter.items():
-        #print(morph, lab_list)
-        new_dict[morph] = lab_list[0][0]
-        if len(lab_list) == 1: # Only one label
-            continue
-        else: # Several possible labels -> majority label
-            # Initialised with the first element
-            current_freq = lab_list[0][1]
-            #print(current_freq)
-            for j in range(1, len(lab_list)):
-                if lab_list[j][1] > current_freq:
-                    new_dict[morph] = lab_list[j][0]
-                    current_freq = lab_list[j][1]
-    return new_dict
+        return zip(split_source, split_gloss)
+
+    @staticmethod
+    def _first(labels, label, other):
+        '''Whether label occurred before the other label.'''
+        for current_label in labels:
+            if current_label == label:
+                return True
+            if current_label == other:
+                return False
+
+    @staticmethod
+    def _best(labels):
+        '''Most frequent label (the first one in case of tie).'''
+        best, best_count = None, 0
+        for label, count in labels.items():
+            if count > best_count:
+                best, best_count = label, count
+        return best
+
+    # Same interface as the majority dictionary
+    def __contains__(self, morph):
+        return morph in self.majority
+
+    def __getitem__(self, morph):
+        return self.majority[morph]
+
+    def __len__(self):
+        return len(self.majority)
+
+    def get(self, morph, default=None):
+        return self.majority.get(morph, default)
+
+    def to_dict(self):
+        '''Majority dictionary {morpheme: label} (see create_majority_dict).'''
+        return dict(self.majority)
+
+    def labels(self, morph):
+        '''Labels seen with the morpheme and their frequency (empty if unknown).'''
+        return self.counts.get(morph, dict())
+
+    def frequency(self, morph):
+        '''Number of occurrences of the morpheme.'''
+        return sum(self.counts.get(morph, dict()).values())
+
+    def save(self, path):
+        '''Save the lexicon as a JSON file (written atomically).'''
+        data = {'version': 1, 
+                'lexicon': {morph: [self.majority[morph], list(labels.items())] 
+                            for morph, labels in self.counts.items()}}
+        temp_path = f'{path}.tmp{os.getpid()}'
+        with open(temp_path, 'w', encoding='utf-8') as out_file:
+            json.dump(data, out_file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        '''Load a lexicon saved with save (no recounting).'''
+        with open(path, 'r', encoding='utf-8') as in_file:
+            data = json.load(in_file)
+        lexicon = cls()
+        for morph, (majority, labels) in data['lexicon'].items():
+            lexicon.counts[morph] = dict(labels)
+            lexicon.majority[morph] = majority
+        return lexicon
 
 # # Apply the majority label to the test dataset
 # def majority_labelling(train, test, label_type='base'):
@@ -86,25 +208,49 @@ def create_majority_dict(train_corpus, label=None):
 #     return '\n'.join(new_file_list)
 
 # Apply the majority label to replace stem labels
-def apply_majority_label(prediction_list, majority_dictionary, corpus):
-    '''Replace all predicted stem labels with the majority label.'''
-    # n = len(prediction_list)
-    assert len(prediction_list) == corpus.n_sent, f'Number of sentences do not match: {len(prediction_list)} and {corpus.n_sent}.'
-    new_prediction = []
-    for i in range(corpus.n_sent):
-        sent_label_list = []
-        sentence = corpus.sentences[i]
-        assert len(prediction_list[i]) == len(sentence.split_source), \
-                f'Number of morphemes do not match: {len(prediction_list[i])} and {len(sentence.split_source)}.'
-        for j in range(len(prediction_list[i])):
-            morpheme = sentence.split_source[j]
-            gloss = prediction_list[i][j]
-            if gloss == 'stem':
-                if morpheme in majority_dictionary: # Known morpheme
-                    sent_label_list.append(majority_dictionary[morpheme])
-                else: # Unknown morpheme
-                    sent_label_list.append('UNK')
-            else:
-                sent_label_list.append(prediction_list[i][j])
-        new_prediction.append(sent_label_list)
-    return new_prediction
+@instrument.timed('apply_majority_label', items=len)
+def apply_majority_label(prediction_list, majority_dictionary, corpus, backoff=None):
+    '''Replace all predicted stem labels with the majority label.
+
+    corpus: IGT_Corpus object, or any iterable of Sentence objects (e.g., IGT_Stream).
+    backoff: BackoffLexicon used to gloss unknown morphemes (UNK otherwise).'''
+    if hasattr(corpus, 'n_sent'):
+        assert len(prediction_list) == corpus.n_sent, f'Number of sentences do not match: {len(prediction_list)} and {corpus.n_sent}.'
+    return list(iter_majority_label(prediction_list, majority_dictionary, corpus, backoff=backoff))
+
+def iter_majority_label(prediction_list, majority_dictionary, sentences, backoff=None):
+    '''Lazily replace all predicted stem labels with the majority label (generator).
+
+    Predictions and sentences can both be generators: they are consumed in parallel.'''
+    prediction_iter = iter(prediction_list)
+    n_sent = 0
+    for sentence in sentences:
+        sent_prediction = next(prediction_iter, None)
+        assert sent_prediction is not None, f'Number of sentences do not match: more sentences than the {n_sent} predictions.'
+        n_sent += 1
+        yield relabel_sentence(sent_prediction, majority_dictionary, sentence, backoff=backoff)
+    assert next(prediction_iter, None) is None, f'Number of sentences do not match: more predictions than the {n_sent} sentences.'
+
+def relabel_sentence(sent_prediction, majority_dictionary, sentence, backoff=None):
+    '''Replace the predicted stem labels of one sentence with the majority label.'''
+    split_source = sentence.split_source # Decoded on each access for a CompactSentence
+    assert len(sent_prediction) == len(split_source), \
+            f'Number of morphemes do not match: {len(sent_prediction)} and {len(split_source)}.'
+    sent_label_list = []
+    for j in range(len(sent_prediction)):
+        morpheme = split_source[j]
+        gloss = sent_prediction[j]
+        if gloss == 'stem':
+            sent_label_list.append(stem_gloss(morpheme, majority_dictionary, backoff=backoff))
+        else:
+            sent_label_list.append(sent_prediction[j])
+    return sent_label_list
+
+def stem_gloss(morpheme, majority_dictionary, backoff=None):
+    '''Gloss replacing the stem label of a morpheme.'''
+    if morpheme in majority_dictionary: # Known morpheme
+        return majority_dictionary[morpheme]
+    elif backoff is not None: # Unknown morpheme: closest known morpheme
+        return backoff.get(morpheme, 'UNK')
+    else: # Unknown morpheme
+        return 'UNK'
@@ -0,0 +1,285 @@
+'''Reusable inference object: trained CRF model and majority dictionary.'''
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from functools import partial
+
+import pycrfsuite
+import sklearn_crfsuite
+
+import crf_glossing.features as cgfeat
+import crf_glossing.instrument as instrument
+import crf_glossing.majority_label as ml
+import crf_glossing.process_file as cgpf
+import crf_glossing.utils as utils
+from crf_glossing.lexicon import BackoffLexicon
+
+
+MODEL_FILE = 'model.crfsuite'
+LEXICON_FILE = 'lexicon.json'
+CONFIG_FILE = 'config.json'
+COUNTS_FILE = 'lexicon_counts.json' # MajorityLexicon (labels of each morpheme and their frequency), if saved
+
+# Default hyperparameters (from the demonstration notebook)
+DEFAULT_CRF_PARAMS = {'algorithm': 'lbfgs', 'c1': 0.1, 'c2': 0.1, 'max_iterations': 100,
+                      'all_possible_transitions': True}
+# Regularisation parameters supported by each training algorithm (others have none)
+REGULARISATION_PARAMS = {'lbfgs': ('c1', 'c2'), 'l2sgd': ('c2',)}
+
+
+def crf_params(**params):
+    '''CRF parameters: the given ones over the defaults, without the regularisation
+    parameters that the training algorithm does not support.'''
+    params = {**DEFAULT_CRF_PARAMS, **params}
+    supported = REGULARISATION_PARAMS.get(params['algorithm'], ())
+    for name in ('c1', 'c2'):
+        if name not in supported:
+            params.pop(name, None)
+    return params
+
+
+class GlossingModel:
+    '''Trained CRF glossing model with its majority dictionary.
+
+    The model is loaded once and can serve many requests: each thread opens
+    its own crfsuite tagger on first use and keeps it, so concurrent callers
+    neither share (nor lock) one tagger nor reload the model.
+
+    Parameters
+    ----------
+    model_path : string
+        Path to the trained crfsuite model file
+    majority_dictionary : dict {morpheme: gloss}
+        Majority label of each training morpheme (see create_majority_dict)
+    stem : bool
+        Indicates whether the CRF was trained with the stem label
+    custom_dict : dict
+        Custom dictionary used to convert the training data (see to_crf_format)
+    translation : bool
+        Indicates whether the CRF uses the words of the translation as features
+    hash_size : int
+        Number of buckets of the hashed feature space (None: features not hashed, see sent2features)
+    prediction_cache : PredictionCache
+        Cache of the labels of the sentences already glossed (None: no cache)
+    backoff : BackoffLexicon
+        Glosses the unknown stems with the closest known morpheme (None: UNK, see backoff_lexicon)
+    '''
+    def __init__(self, model_path, majority_dictionary, stem=True, custom_dict=dict(), translation=False,
+                 hash_size=None, prediction_cache=None, backoff=None):
+        self.model_path = model_path
+        self.majority_dictionary = majority_dictionary
+        self.stem = stem
+        self.custom_dict = custom_dict
+        self.translation = translation
+        self.hash_size = hash_size
+        self.prediction_cache = prediction_cache
+        self.backoff = backoff
+        self._version = None
+        self._local = threading.local()
+
+    @classmethod
+    def train(cls, train_corpus, model_path, stem=True, custom_dict=dict(), n_jobs=None,
+              min_attribute_freq=1, translation=False, hash_size=None, backoff=False, **crf_parameters):
+        '''Train a CRF model (saved in model_path) and the majority dictionary on a corpus.
+
+        train_corpus: IGT_Corpus (or any iterable of Sentence objects).
+        min_attribute_freq: rarer string-valued features are pruned before training (see prune_features).
+        translation, hash_size: feature options (see sentence_to_features).
+        backoff: gloss the unknown stems with the closest known morpheme (BackoffLexicon,
+        ties broken by the training frequency of the morphemes).
+        crf_parameters: sklearn_crfsuite.CRF parameters (notebook defaults otherwise).'''
+        train_corpus = list(train_corpus) # Read twice (features and majority dictionary): parsed only once
+        featurized = utils.parallel_map(partial(cgpf.sentence_to_features, stem=stem, custom_dict=custom_dict,
+                                                translation=translation, hash_size=hash_size),
+                                        train_corpus, n_jobs=n_jobs)
+        X_train = [features for features, _ in featurized]
+        y_train = [labels for _, labels in featurized]
+        X_train = cgfeat.prune_features(X_train, min_freq=min_attribute_freq)
+
+        crf = sklearn_crfsuite.CRF(model_filename=model_path, **crf_params(**crf_parameters))
+        with instrument.stage('crf_fit', len(X_train)):
+            crf.fit(X_train, y_train)
+        with instrument.stage('create_majority_dict') as current_stage: # Counted once, for both lexicons
+            lexicon = ml.MajorityLexicon.from_corpus(train_corpus)
+            majority_dictionary = lexicon.to_dict()
+            current_stage.items = len(majority_dictionary)
+        backoff_lexicon = None
+        if backoff:
+            backoff_lexicon = BackoffLexicon(majority_dictionary, {morph: lexicon.frequency(morph)
+                                                                   for morph in majority_dictionary})
+        return cls(model_path, majority_dictionary, stem=stem, custom_dict=custom_dict,
+                   translation=translation, hash_size=hash_size, backoff=backoff_lexicon)
+
+    def save(self, directory):
+        '''Save the model file, the majority dictionary, and the options in a directory.'''
+        os.makedirs(directory, exist_ok=True)
+        model_path = os.path.join(directory, MODEL_FILE)
+        if os.path.abspath(self.model_path) != os.path.abspath(model_path):
+            shutil.copyfile(self.model_path, model_path)
+        with open(os.path.join(directory, LEXICON_FILE), 'w', encoding='utf-8') as out_file:
+            json.dump(self.majority_dictionary, out_file, ensure_ascii=False)
+        with open(os.path.join(directory, CONFIG_FILE), 'w', encoding='utf-8') as out_file:
+            json.dump({'stem': self.stem, 'custom_dict': self.custom_dict, 'translation': self.translation,
+                       'hash_size': self.hash_size}, out_file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, prediction_cache=None, backoff=False):
+        '''Load a model saved with save (prediction_cache: see GlossingModel).
+
+        backoff: gloss the unknown stems with the closest known morpheme (see backoff_lexicon).'''
+        with open(os.path.join(directory, LEXICON_FILE), 'r', encoding='utf-8') as in_file:
+            majority_dictionary = json.load(in_file)
+        with open(os.path.join(directory, CONFIG_FILE), 'r', encoding='utf-8') as in_file:
+            config = json.load(in_file)
+        model = cls(os.path.join(directory, MODEL_FILE), majority_dictionary,
+                    stem=config['stem'], custom_dict=config['custom_dict'],
+                    translation=config.get('translation', False), hash_size=config.get('hash_size'),
+                    prediction_cache=prediction_cache)
+        if backoff:
+            model.backoff = model.backoff_lexicon()
+        return model
+
+    @property
+    def version(self):
+        '''Hash of the CRF model file, the majority dictionary, and the options (computed once).'''
+        if self._version is None:
+            digest = hashlib.sha1()
+            with open(self.model_path, 'rb') as model_file:
+                for chunk in iter(lambda: model_file.read(2 ** 20), b''):
+                    digest.update(chunk)
+            digest.update(json.dumps([self.majority_dictionary, self.stem, self.custom_dict, self.translation,
+                                      self.hash_size, self.backoff is not None], sort_keys=True).encode('utf-8'))
+            self._version = digest.hexdigest()
+        return self._version
+
+    @property
+    def default_features(self):
+        '''Whether the CRF uses the default feature templates (needed by ViterbiDecoder.decode_morphemes).'''
+        return not self.translation and self.hash_size is None
+
+    def featurize(self, sentences):
+        '''Features of Sentence objects, with the feature options of the model.'''
+        return [cgpf.sentence_to_features(sentence, stem=self.stem, custom_dict=self.custom_dict,
+                                          translation=self.translation, hash_size=self.hash_size)[0]
+                for sentence in sentences]
+
+    @property
+    def tagger(self):
+        '''crfsuite tagger of the current thread (opened on first use).'''
+        tagger = getattr(self._local, 'tagger', None)
+        if tagger is None:
+            tagger = pycrfsuite.Tagger()
+            tagger.open(self.model_path)
+            self._local.tagger = tagger
+        return tagger
+
+    def predict(self, X):
+        '''Predict the CRF labels of featurized sentences (as crf.predict).'''
+        tagger = self.tagger
+        with instrument.stage('crf_tag', len(X)):
+            return [tagger.tag(features) for features in X]
+
+    def stats(self, X=None):
+        '''Size of the model (file, labels, attributes, features) and its tagging speed.
+
+        X: featurized sentences used to measure the tagging throughput (optional).'''
+        start = time.perf_counter()
+        tagger = pycrfsuite.Tagger()
+        tagger.open(self.model_path)
+        load_seconds = time.perf_counter() - start
+        info = tagger.info()
+        stats = {
+            'file_bytes': os.path.getsize(self.model_path),
+            'load_seconds': load_seconds,
+            'labels': len(info.labels),
+            'attributes': len(info.attributes),
+            'state_features': len(info.state_features), # (attribute, label) pairs with a weight
+            'transition_features': len(info.transitions),
+            'lexicon_entries': len(self.majority_dictionary),
+        }
+        if X is not None:
+            n_morphs = sum(len(features) for features in X)
+            start = time.perf_counter()
+            for features in X:
+                tagger.tag(features)
+            seconds = time.perf_counter() - start
+            stats.update({'tagged_sentences': len(X), 'tagging_seconds': seconds,
+                          'sentences_per_second': len(X) / seconds if seconds > 0 else None,
+                          'morphemes_per_second': n_morphs / seconds if seconds > 0 else None})
+        tagger.close()
+        return stats
+
+    def backoff_lexicon(self):
+        '''BackoffLexicon of the majority dictionary, with the frequencies of the saved lexicon
+        (COUNTS_FILE) to break ties (all equal if there is none).'''
+        lexicon = self.lexicon()
+        frequencies = None
+        if lexicon is not None:
+            frequencies = {morph: lexicon.frequency(morph) for morph in self.majority_dictionary}
+        return BackoffLexicon(self.majority_dictionary, frequencies)
+
+    def lexicon(self):
+        '''MajorityLexicon saved with the model (COUNTS_FILE), or None.'''
+        path = os.path.join(os.path.dirname(self.model_path), COUNTS_FILE)
+        if not os.path.exists(path):
+            return None
+        return ml.MajorityLexicon.load(path)
+
+    def label_batch(self, sentences):
+        '''Predict the labels of a batch of sentences, with the majority label for stems.
+
+        sentences: Sentence objects, morpheme-segmented sentences (string), or (sentence, translation)
+        pairs. A model using the translation as features needs it (Sentence objects or pairs).
+        With a prediction cache, only the sentences not cached (nor repeated in the batch) are tagged.'''
+        if self.translation and any(isinstance(sentence, str) for sentence in sentences):
+            raise ValueError('This model uses the translation as features: give (sentence, translation) pairs.')
+        sentences = [to_sentence(sentence) for sentence in sentences]
+        if self.prediction_cache is None:
+            return ml.apply_majority_label(self.predict(self.featurize(sentences)), self.majority_dictionary,
+                                           sentences, backoff=self.backoff)
+
+        labels = [None] * len(sentences)
+        missing = dict() # key -> indices of the sentences to tag
+        for i, sentence in enumerate(sentences):
+            key = self.cache_key(sentence)
+            if key in missing:
+                missing[key].append(i)
+                continue
+            labels[i] = self.prediction_cache.get(key)
+            if labels[i] is None:
+                missing[key] = [i]
+        to_tag = [sentences[indices[0]] for indices in missing.values()]
+        new_labels = ml.apply_majority_label(self.predict(self.featurize(to_tag)), self.majority_dictionary, to_tag,
+                                             backoff=self.backoff)
+        for (key, indices), sentence_labels in zip(missing.items(), new_labels):
+            self.prediction_cache.put(key, sentence_labels)
+            for i in indices:
+                labels[i] = list(sentence_labels)
+        self.prediction_cache.record_hits(sum(len(indices) - 1 for indices in missing.values()))
+        return labels
+
+    def cache_key(self, sentence):
+        '''Key of a sentence in the prediction cache: model version and morphemes (and translation, if used).'''
+        if self.translation:
+            return (self.version, tuple(sentence.split_source), tuple(sentence.split_translation))
+        return (self.version, tuple(sentence.split_source))
+
+    def gloss_batch(self, sentences):
+        '''Gloss a batch of sentences: returns one gloss line (string) per sentence.
+
+        sentences: see label_batch.'''
+        return cgpf.convert_to_igt_format(self.label_batch(sentences))
+
+
+def to_sentence(sentence):
+    '''Convert a morpheme-segmented sentence (string), or a (sentence, translation) pair of
+    strings, into a test Sentence object.'''
+    if isinstance(sentence, str):
+        return cgpf.Sentence(sentence.strip(), '', '', test=True)
+    if isinstance(sentence, (tuple, list)):
+        source, translation = sentence
+        return cgpf.Sentence(source.strip(), '', translation or '', test=True)
+    return sentence
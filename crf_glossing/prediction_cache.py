@@ -0,0 +1,84 @@
+'''Cache of the predicted glosses of whole sentences.
+
+Field corpora repeat the same sentences (formulas, short answers...) many
+times: the glosses of a sentence (after apply_majority_label) are kept under
+the version of the model and the morpheme sequence of the sentence, so that
+a repeated sentence is neither featurized nor decoded again. The least
+recently used sentences are evicted above the size cap.
+
+Only whole sentences are cached: the CRF features of a morpheme depend on
+its neighbours (see window2features), across word boundaries, so the labels
+of a word are not the same in every sentence.
+
+    cache = PredictionCache(max_entries=100000)
+    model = GlossingModel.load('model_directory', prediction_cache=cache)
+    model.gloss_batch(sentences)
+    print(cache.stats())
+'''
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    '''LRU cache {(model version, morpheme sequence): labels}, thread-safe.
+
+    It can be shared by several models (e.g., of a ModelRegistry), since the
+    keys include the model version.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of cached sentences
+    '''
+    def __init__(self, max_entries=100000):
+        assert max_entries > 0, f'The cache must hold at least one sentence, not {max_entries}.'
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # key -> labels (tuple), least recently used first
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''Cached labels (list) of a key, or None.'''
+        with self._lock:
+            labels = self.entries.get(key)
+            if labels is None:
+                self.n_misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.n_hits += 1
+        return list(labels)
+
+    def put(self, key, labels):
+        with self._lock:
+            self.entries[key] = tuple(labels)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.n_evictions += 1
+
+    def record_hits(self, n_hits):
+        '''Count the sentences repeated within a batch (tagged once) as hits.'''
+        with self._lock:
+            self.n_hits += n_hits
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        '''Hit, miss, and eviction statistics.'''
+        with self._lock:
+            n_requests = self.n_hits + self.n_misses
+            return {
+                'hits': self.n_hits,
+                'misses': self.n_misses,
+                'hit_rate': self.n_hits / n_requests if n_requests else None,
+                'evictions': self.n_evictions,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+            }
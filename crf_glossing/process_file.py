@@ -1,9 +1,14 @@
 import re
+from collections import namedtuple
+from functools import partial
 
+import crf_glossing.features as cgfeat
+import crf_glossing.instrument as instrument
 import crf_glossing.utils as utils
 
 
 ## Process IGT files in the SIGMORPHON Shared Task format
+@instrument.timed('preprocess_translation', aggregate=True)
 def preprocess_translation(translation_sentence, tilde=False, lower=True):
     '''Preprocess the translation sentence.'''
     new_sentence = translation_sentence.strip()
@@ -22,6 +27,66 @@ def preprocess_translation(translation_sentence, tilde=False, lower=True):
     return new_sentence.strip()
 
 
+def parse_block(sentence_block, test=False, tilde=False, lower=True, equal=True):
+    r'''Parse one blank-line separated block of the Shared Task file into a Sentence.
+
+    4 tiers:
+    \t: raw source sentence
+    \m: morpheme segmented sentence
+    \g: gloss
+    \l: translation
+    If covered, there is no gloss output'''
+    split_sentence = utils.text_to_line(sentence_block)
+    if len(split_sentence) == 5: # 5 tiers (e.g., Uspanteko)
+        #print(split_sentence)
+        field_dict = {'m': 1, 'g': 3, 'l': 4}
+    elif len(split_sentence) == 4: # 4 tiers
+        field_dict = {'m': 1, 'g': 2, 'l': 3}
+    elif len(split_sentence) == 3: # 3 tiers (e.g., Nyangbo)
+        field_dict = {'m': 1, 'g': 2, 'l': -1}
+    else:
+        print(f'Number of tiers {len(split_sentence)} for {split_sentence}')
+    #utils.check_equality(len(split_sentence), 4) # 4 tiers
+
+    # Source sentence
+    source = split_sentence[field_dict['m']].strip()
+    utils.check_equality(source[0:3], r'\m ')
+
+    # Gloss sentence
+    gloss = split_sentence[field_dict['g']].strip()
+    if not test:
+        utils.check_equality(gloss[0:3], r'\g ')
+    else: # If test dataset, gloss is not available
+        gloss = r'\g '
+
+    # Translation
+    if field_dict['l'] == -1: # If no translation
+        translation = r'\l '
+    else: 
+        translation = split_sentence[field_dict['l']].strip()
+        utils.check_equality(translation[0:3], r'\l ')
+
+    # print(source, gloss)
+    return Sentence(source[3:], gloss[3:], translation[3:], test, 
+                    tilde=tilde, lower=lower, equal=equal)
+
+def iter_blocks(lines):
+    '''Group an iterable of lines into blank-line separated blocks (string).
+
+    Only one block is kept in memory at a time.'''
+    block = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.strip() == '': # End of the current block
+            if block:
+                yield '\n'.join(block)
+                block = []
+        else:
+            block.append(line)
+    if block: # Last block without a final empty line
+        yield '\n'.join(block)
+
+
 class IGT_Corpus:
     '''Processes a corpus in the SIGMORPHON Shared Task format
 
@@ -31,6 +96,8 @@ class IGT_Corpus:
         Raw corpus file
     test : bool
         Indicates whether the corpus is a test dataset or not
+    tilde, lower, equal : bool
+        Preprocessing options (see Sentence)
 
     Attributes
     ----------
@@ -41,7 +108,7 @@ class IGT_Corpus:
     sentences : list [Sentences (object)]
         List of all processed sentences using the Sentence class
     '''
-    def __init__(self, corpus_file, test=False):
+    def __init__(self, corpus_file, test=False, tilde=False, lower=True, equal=True):
         self.split_file = re.split('\n\n', corpus_file)
         self.n_sent = len(self.split_file)
 
@@ -54,10 +121,11 @@ class IGT_Corpus:
             print(f'This corpus is a training dataset.')
 
         self.sentences = []
-        self.split_uncovered()
+        with instrument.stage('parse', self.n_sent):
+            self.split_uncovered(tilde=tilde, lower=lower, equal=equal)
         
 
-    def split_uncovered(self, tilde=False, lower=True):
+    def split_uncovered(self, tilde=False, lower=True, equal=True):
         r'''Convert the Shared task file into three separate files.
 
         4 tiers:
@@ -70,53 +138,87 @@ class IGT_Corpus:
         # corpus = IGT_Corpus(uncovered_file)
 
         for sentence in self.split_file:
-            split_sentence = utils.text_to_line(sentence)
-            if len(split_sentence) == 5: # 5 tiers (e.g., Uspanteko)
-                #print(split_sentence)
-                field_dict = {'m': 1, 'g': 3, 'l': 4}
-            elif len(split_sentence) == 4: # 4 tiers
-                field_dict = {'m': 1, 'g': 2, 'l': 3}
-            elif len(split_sentence) == 3: # 3 tiers (e.g., Nyangbo)
-                field_dict = {'m': 1, 'g': 2, 'l': -1}
-            else:
-                print(f'Number of tiers {len(split_sentence)} for {split_sentence}')
-            #utils.check_equality(len(split_sentence), 4) # 4 tiers
-
-            # Source sentence
-            source = split_sentence[field_dict['m']].strip()
-            utils.check_equality(source[0:3], r'\m ')
-
-            # Gloss sentence
-            gloss = split_sentence[field_dict['g']].strip()
-            if not self.test:
-                utils.check_equality(gloss[0:3], r'\g ')
-            else: # If test dataset, gloss is not available
-                gloss = r'\g '
-
-            # Translation
-            if field_dict['l'] == -1: # If no translation
-                translation = r'\l '
-            else: 
-                translation = split_sentence[field_dict['l']].strip()
-                utils.check_equality(translation[0:3], r'\l ')
-                pp_translation = preprocess_translation(translation[3:], tilde=tilde, lower=lower)
-
-            # # Add to lists
-            # self.source_list.append(source[3:])
-            # self.gloss_list.append(gloss[3:])
-            # self.translation_list.append(pp_translation)
-
-            # print(source, gloss)
-            self.sentences.append(Sentence(source[3:], gloss[3:], translation[3:], self.test))
-        # return source_list, gloss_list, translation_list
+            self.sentences.append(parse_block(sentence, test=self.test, tilde=tilde, lower=lower, equal=equal))
+
+    def __iter__(self):
+        return iter(self.sentences)
 
     def convert_to_crf_format(self, stem=True, custom_dict=dict()):
-        '''Convert the corpus into the CRFsuite format.'''
-        return [sentence.to_crf_format(stem=stem, custom_dict=custom_dict) 
-                for sentence in self.sentences]
+        '''Convert the corpus into the CRFsuite format.
+
+        Serial: the conversion is too cheap to be worth pickling the sentences
+        for a process pool (see convert_to_features).'''
+        with instrument.stage('convert_to_crf_format', self.n_sent):
+            return [sentence.to_crf_format(stem=stem, custom_dict=custom_dict) for sentence in self.sentences]
+
+    def convert_to_features(self, stem=True, custom_dict=dict(), n_jobs=None, translation=False, hash_size=None):
+        '''Convert the corpus into CRFsuite features and labels in parallel.
+
+        translation, hash_size: feature options (see sentence_to_features).
+        Returns (X, y): the features (sent2features) and labels (sent2labels) of each sentence.'''
+        with instrument.stage('convert_to_features', self.n_sent):
+            featurized = utils.parallel_map(partial(sentence_to_features, stem=stem, custom_dict=custom_dict,
+                                                    translation=translation, hash_size=hash_size),
+                                            self.sentences, n_jobs=n_jobs)
+        return [features for features, _ in featurized], [labels for _, labels in featurized]
     
 
 
+class IGT_Stream:
+    '''Lazily reads a corpus in the SIGMORPHON Shared Task format.
+
+    Sentences are parsed one block at a time, so the corpus never has to fit
+    in memory. A file path can be iterated over several times (e.g., once to
+    predict and once to apply the majority label); an iterator of lines can 
+    only be read once.
+
+    Parameters
+    ----------
+    source : string or iterable [lines (string)]
+        Path to the corpus file, or iterable of its lines
+    test : bool
+        Indicates whether the corpus is a test dataset or not
+    tilde, lower, equal : bool
+        Preprocessing options (see Sentence)
+    '''
+    def __init__(self, source, test=False, tilde=False, lower=True, equal=True):
+        self.source = source
+        self.test = test
+        self.tilde = tilde
+        self.lower = lower
+        self.equal = equal
+
+    def __iter__(self):
+        if isinstance(self.source, str):
+            with open(self.source, 'r', encoding='utf-8') as corpus_file:
+                yield from instrument.timed_iter('parse_stream', self._parse(corpus_file))
+        else:
+            yield from instrument.timed_iter('parse_stream', self._parse(self.source))
+
+    def _parse(self, lines):
+        for block in iter_blocks(lines):
+            yield parse_block(block, test=self.test, tilde=self.tilde, lower=self.lower, equal=self.equal)
+
+    def convert_to_crf_format(self, stem=True, custom_dict=dict()):
+        '''Lazily convert the corpus into the CRFsuite format (generator).'''
+        return sentences_to_crf_format(self, stem=stem, custom_dict=custom_dict)
+
+
+def sentences_to_crf_format(sentences, stem=True, custom_dict=dict()):
+    '''Convert an iterable of Sentence objects into the CRFsuite format (generator).'''
+    for sentence in sentences:
+        yield sentence.to_crf_format(stem=stem, custom_dict=custom_dict)
+
+def sentence_to_features(sentence, stem=True, custom_dict=dict(), translation=False, hash_size=None):
+    '''Convert one Sentence object into CRFsuite features and labels.
+
+    translation: add the words of the translation as features; hash_size: see sent2features.'''
+    crf_sentence = sentence.to_crf_format(stem=stem, custom_dict=custom_dict)
+    features = cgfeat.sent2features(crf_sentence, translation=sentence.split_translation if translation else None,
+                                    hash_size=hash_size)
+    return features, cgfeat.sent2labels(crf_sentence)
+
+
 class Sentence:
     '''Object to handle one sentence and its annotations.
 
@@ -130,6 +232,12 @@ class Sentence:
         Translation of the source sentence (raw, neither processed nor tokenised)
     test : bool
         If it is a sentence from the test dataset or not.
+    tilde : bool
+        Remove tildes from the translation (see preprocess_translation)
+    lower : bool
+        Lowercase the translation (see preprocess_translation)
+    equal : bool
+        Treat equal signs as a separate morpheme boundary (otherwise, as hyphens)
 
     Attributes
     ----------
@@ -142,10 +250,7 @@ class Sentence:
     n_morph : int
         Number of morphemes in the source sentence (or number of glosses)
     '''
-    def __init__(self, source, gloss, translation, test=False):
-        tilde=False 
-        lower=True
-        
+    def __init__(self, source, gloss, translation, test=False, tilde=False, lower=True, equal=True):
         self.source = source
         self.gloss = gloss
         self.raw_translation = translation
@@ -163,7 +268,6 @@ class Sentence:
                 self.gloss = '$$$' + self.gloss[1:]
 
         # Split according to morpheme boundaries
-        equal = True
         if equal: # Treat equal signs differently than hyphens
             split_pattern = '(-|=)' #'[ -=]'
         else:
@@ -195,34 +299,49 @@ class Sentence:
         
         stem: indicates whether lexical glosses should be replaced by the stem label.
         custom_dict: keeps certain tags in the label set.'''
-        morph_gloss_list = []
-        n_unit = len(self.split_source) # Number of units (with hyphens)
-        for i in range(n_unit): #self.n_morph):
-            source_morph = self.split_source[i]
-            if not self.test:
-                gloss = self.split_gloss[i]
-                # if source_morph == 'ke' and custom_dict != dict():
-                #     print(source_morph, gloss, custom_dict[source_morph], custom_dict[source_morph] == gloss)
-                if gloss in ['-', '=']:
-                    pp_gloss = gloss
-                elif gloss.isupper(): # Grammatical label (reference)
-                    pp_gloss = gloss
-                elif custom_dict != dict() and \
-                    (source_morph in custom_dict and custom_dict[source_morph] == gloss):
-                    print('Custom dictionary', source_morph, gloss)
-                    pp_gloss = gloss
-                else: # Lexical label
-                    # if source_morph == 'ke' and custom_dict != dict():
-                    #     print(custom_dict)
-                    #     print(source_morph, gloss, custom_dict[source_morph])
-                    if stem:
-                        pp_gloss = 'stem'
-                    else:
-                        pp_gloss = gloss
-            else:
-                pp_gloss = ''
-            morph_gloss_list.append((source_morph, pp_gloss))
-        return morph_gloss_list
+        return units_to_crf_format(self.split_source, self.split_gloss, test=self.test, 
+                                   stem=stem, custom_dict=custom_dict)
+
+
+# Morphemes and glosses of a sentence: enough for the majority labelling and the gold glosses
+Units = namedtuple('Units', ['split_source', 'split_gloss'])
+
+def units_to_crf_format(split_source, split_gloss, test=False, stem=False, custom_dict=dict()):
+    '''Convert the morpheme and gloss units of a sentence into the CRFsuite format.
+
+    See Sentence.to_crf_format.'''
+    morph_gloss_list = []
+    n_unit = len(split_source) # Number of units (with hyphens)
+    for i in range(n_unit): #self.n_morph):
+        source_morph = split_source[i]
+        if not test:
+            pp_gloss = gloss_to_crf_label(source_morph, split_gloss[i], stem=stem, custom_dict=custom_dict)
+        else:
+            pp_gloss = ''
+        morph_gloss_list.append((source_morph, pp_gloss))
+    return morph_gloss_list
+
+def gloss_to_crf_label(source_morph, gloss, stem=False, custom_dict=dict()):
+    '''Convert the gloss of a morpheme into its CRF label.'''
+    # if source_morph == 'ke' and custom_dict != dict():
+    #     print(source_morph, gloss, custom_dict[source_morph], custom_dict[source_morph] == gloss)
+    if gloss in ['-', '=']:
+        pp_gloss = gloss
+    elif gloss.isupper(): # Grammatical label (reference)
+        pp_gloss = gloss
+    elif custom_dict != dict() and \
+        (source_morph in custom_dict and custom_dict[source_morph] == gloss):
+        print('Custom dictionary', source_morph, gloss)
+        pp_gloss = gloss
+    else: # Lexical label
+        # if source_morph == 'ke' and custom_dict != dict():
+        #     print(custom_dict)
+        #     print(source_morph, gloss, custom_dict[source_morph])
+        if stem:
+            pp_gloss = 'stem'
+        else:
+            pp_gloss = gloss
+    return pp_gloss
 
 
 # Conversion of the output into IGT format
@@ -235,4 +354,14 @@ def pred_to_igt_format(pred_list):
     '''Convert a list of labels (prediction) into a sentence.'''
     str_pred = re.sub(' - ', '-', ' '.join(pred_list))
     str_pred = re.sub(' = ', '=', str_pred)
-    return str_pred
\ No newline at end of file
+    return str_pred
+
+def write_predictions(gloss_sent_list, path):
+    '''Save the predictions (only) in a text file, as in the demonstration notebook.'''
+    with open(path, 'w', encoding='utf-8') as out_file:
+        for gloss_sentence in gloss_sent_list:
+            out_file.write('\\t' + '\n')
+            out_file.write('\\m' + '\n')
+            out_file.write('\\g ' + gloss_sentence + '\n')
+            out_file.write('\\l' + '\n')
+            out_file.write('\n')
@@ -0,0 +1,217 @@
+'''Readers of ELAN and Toolbox files, yielding Sentence objects directly.
+
+They replace the conversion to the SIGMORPHON format (format_conversion) and
+its parsing by IGT_Corpus: each record is read once, in memory, and turned
+into a Sentence. Like IGT_Stream, the readers can be used wherever a corpus
+is expected (convert_to_crf_format, create_majority_dict, MajorityLexicon,
+apply_majority_label...), and are read lazily, one record at a time.
+
+In both formats, the morphemes and glosses are usually separate tokens,
+the bound morphemes marked with a hyphen or an equal sign on the side of
+their host (e.g., 'ni- yukw -hl'). The tokens are joined into words
+('ni-yukw-hl'), and the glosses alike, as in the SIGMORPHON format.
+
+    train_corpus = ToolboxReader('archive.txt')
+    crf_corpus = train_corpus.convert_to_crf_format(stem=True)
+    majority_dictionary = ml.create_majority_dict(train_corpus)
+
+    test_corpus = ElanReader(['recording1.eaf', 'recording2.eaf'], test=True)
+'''
+import sys
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+import crf_glossing.instrument as instrument
+from crf_glossing.process_file import IGT_Stream, Sentence, sentences_to_crf_format
+
+
+BOUNDARIES = '-='
+
+
+def join_morphemes(morphs, glosses=None):
+    '''Join morpheme tokens (and their glosses) into a segmented sentence.
+
+    A token starting with a boundary (-, =) is attached to the previous one,
+    a token ending with a boundary to the next one. The glosses are joined at
+    the same places as the morphemes.
+    Returns (source, gloss) strings ('' as gloss if no glosses, e.g., test data).'''
+    if glosses is None:
+        return join_morphemes(morphs, morphs)[0], ''
+    assert len(morphs) == len(glosses), \
+        f'Number of morphemes and glosses do not match: {len(morphs)} and {len(glosses)}.'
+    source, gloss = [], []
+    for i, (morph, morph_gloss) in enumerate(zip(morphs, glosses)):
+        stripped = morph.strip(BOUNDARIES) or morph # A hyphen alone is punctuation
+        if i == 0:
+            separator = ''
+        elif stripped != morph and morph[0] in BOUNDARIES:
+            separator = morph[0]
+        elif morphs[i - 1].strip(BOUNDARIES) and morphs[i - 1][-1] in BOUNDARIES:
+            separator = morphs[i - 1][-1]
+        else:
+            separator = ' '
+        source.append(separator + stripped)
+        gloss.append(separator + (morph_gloss.strip(BOUNDARIES) or morph_gloss))
+    return ''.join(source), ''.join(gloss)
+
+
+## Toolbox
+def iter_toolbox_records(lines):
+    '''Records (lists of lines) of a Toolbox file: a new record starts at each \\t line.'''
+    record = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith('\\t') and any(l.strip() for l in record):
+            yield record
+            record = []
+        record.append(line)
+    if any(l.strip() for l in record):
+        yield record
+
+def record_fields(record):
+    '''Content of each marker of a Toolbox record (lines with the same marker are joined).'''
+    fields = dict()
+    for line in record:
+        if not line.startswith('\\'):
+            continue
+        marker, _, content = line.partition(' ')
+        fields[marker] = f'{fields[marker]} {content.strip()}' if marker in fields else content.strip()
+    return fields
+
+
+class ToolboxReader(IGT_Stream):
+    r'''Lazily reads a Toolbox file (\t, \m, \g, \l records) into Sentence objects.
+
+    The records whose numbers of morphemes and glosses differ are skipped
+    (with a warning), as by format_conversion/toolbox_to_pipeline.py.
+
+    Parameters
+    ----------
+    source : string or iterable [lines (string)]
+        Path to the Toolbox file, or iterable of its lines
+    test : bool
+        Indicates whether the corpus is a test dataset (glosses not read) or not
+    tilde, lower, equal : bool
+        Preprocessing options (see Sentence)
+    morph_marker, gloss_marker, translation_marker : string
+        Markers of the morpheme, gloss, and translation lines
+    '''
+    def __init__(self, source, test=False, tilde=False, lower=True, equal=True,
+                 morph_marker='\\m', gloss_marker='\\g', translation_marker='\\l'):
+        super().__init__(source, test=test, tilde=tilde, lower=lower, equal=equal)
+        self.morph_marker = morph_marker
+        self.gloss_marker = gloss_marker
+        self.translation_marker = translation_marker
+
+    def _parse(self, lines):
+        for i, record in enumerate(iter_toolbox_records(lines)):
+            fields = record_fields(record)
+            morphs = fields.get(self.morph_marker, '').split()
+            if not morphs: # E.g., file header
+                continue
+            glosses = None if self.test else fields.get(self.gloss_marker, '').split()
+            if glosses is not None and len(morphs) != len(glosses):
+                print(f'Warning: token/gloss mismatch, skipping record {i + 1}.', file=sys.stderr)
+                continue
+            source, gloss = join_morphemes(morphs, glosses)
+            yield Sentence(source, gloss, fields.get(self.translation_marker, ''), self.test,
+                           tilde=self.tilde, lower=self.lower, equal=self.equal)
+
+
+## ELAN
+class TierIndex:
+    '''Interval index of the annotations of a tier, built once.
+
+    Annotations are sorted by start time, with the running maximum of their
+    end times: an overlap query is two binary searches plus the matches, so
+    aligning a whole tier costs O(n log n) instead of one full scan of the
+    tier per query (Eaf.get_annotation_data_between_times). Used by
+    ElanReader and format_conversion/elan_to_crf.py.'''
+    def __init__(self, annotations):
+        self.annotations = sorted(annotation[:3] for annotation in annotations) # (start, end, value)
+        self.starts = [start for start, _, _ in self.annotations]
+        self.max_ends = list(accumulate((end for _, end, _ in self.annotations), max))
+
+    @classmethod
+    def from_tier(cls, eaf, tier):
+        return cls(eaf.get_annotation_data_for_tier(tier))
+
+    def overlapping(self, start, end, strict=True):
+        '''Annotations overlapping the interval from start to end, sorted.
+
+        strict: exclude the annotations which only touch the interval (e.g., the first
+        morpheme of the next sentence); otherwise, they are included, as by
+        Eaf.get_annotation_data_between_times.'''
+        if strict:
+            first = bisect_right(self.max_ends, start) # Before it, all the annotations end at start at the latest
+            last = bisect_left(self.starts, end) # From it, all the annotations start at end at the earliest
+            return [annotation for annotation in self.annotations[first:last] if annotation[1] > start]
+        first = bisect_left(self.max_ends, start)
+        last = bisect_right(self.starts, end)
+        return [annotation for annotation in self.annotations[first:last] if annotation[1] >= start]
+
+
+class ElanReader:
+    '''Reads ELAN files (pympi) into Sentence objects, one transcription annotation each.
+
+    The morpheme and gloss annotations (and the translation, if any) within
+    the time span of each transcription annotation make the sentence; the
+    annotations whose numbers of morphemes and glosses differ are skipped.
+
+    Parameters
+    ----------
+    eaf_files : string, pympi.Elan.Eaf, or list of them
+        ELAN file(s)
+    test : bool
+        Indicates whether the corpus is a test dataset (glosses not read) or not
+    tilde, lower, equal : bool
+        Preprocessing options (see Sentence)
+    transcription_tier, morph_tier, gloss_tier : string
+        Names of the tiers
+    translation_tier : string
+        Name of the translation tier (None: no translation)
+    '''
+    def __init__(self, eaf_files, test=False, tilde=False, lower=True, equal=True,
+                 transcription_tier='transcription', morph_tier='morphemes', gloss_tier='gloss',
+                 translation_tier=None):
+        self.eaf_files = eaf_files if isinstance(eaf_files, (list, tuple)) else [eaf_files]
+        self.test = test
+        self.tilde = tilde
+        self.lower = lower
+        self.equal = equal
+        self.transcription_tier = transcription_tier
+        self.morph_tier = morph_tier
+        self.gloss_tier = gloss_tier
+        self.translation_tier = translation_tier
+
+    def __iter__(self):
+        for eaf in self.eaf_files:
+            if isinstance(eaf, str):
+                from pympi.Elan import Eaf
+                eaf = Eaf(eaf)
+            yield from instrument.timed_iter('parse_stream', self._parse(eaf))
+
+    def _parse(self, eaf):
+        tier_names = eaf.get_tier_names()
+        indexes = {tier: TierIndex.from_tier(eaf, tier)
+                   for tier in (self.morph_tier, self.gloss_tier, self.translation_tier)
+                   if tier is not None and tier in tier_names}
+        empty = TierIndex([])
+        for annotation in eaf.get_annotation_data_for_tier(self.transcription_tier):
+            start, end = annotation[0], annotation[1]
+            morphs = [value for _, _, value in indexes.get(self.morph_tier, empty).overlapping(start, end)]
+            if not morphs:
+                continue
+            glosses = None
+            if not self.test:
+                glosses = [value for _, _, value in indexes.get(self.gloss_tier, empty).overlapping(start, end)]
+                if len(morphs) != len(glosses):
+                    continue
+            translation = ' '.join(value for _, _, value in indexes.get(self.translation_tier, empty).overlapping(start, end))
+            source, gloss = join_morphemes(morphs, glosses)
+            yield Sentence(source, gloss, translation, self.test,
+                           tilde=self.tilde, lower=self.lower, equal=self.equal)
+
+    def convert_to_crf_format(self, stem=True, custom_dict=dict()):
+        '''Lazily convert the corpus into the CRFsuite format (generator).'''
+        return sentences_to_crf_format(self, stem=stem, custom_dict=custom_dict)
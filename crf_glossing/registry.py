@@ -0,0 +1,162 @@
+'''Registry of the glossing models of several languages.
+
+Each language code maps to a saved GlossingModel directory (see
+GlossingModel.save). Models are loaded on first use, and only a bounded
+working set stays resident: when the estimated memory footprint of the
+loaded models exceeds the budget, the least recently used ones are evicted
+(and reloaded when needed again).
+
+    registry = ModelRegistry.from_directory('models', max_bytes=2 * 2**30) # models/git, models/usp, ...
+    glosses = registry.get('git').gloss_batch(['ap yukw-hl'])
+    print(registry.stats())
+'''
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from crf_glossing.model import GlossingModel, CONFIG_FILE
+
+
+def model_footprint(model):
+    '''Estimated memory footprint (bytes) of a loaded model.
+
+    The crfsuite tagger holds the whole model file in memory; the majority
+    dictionary is measured with its strings.'''
+    size = os.path.getsize(model.model_path)
+    dictionary = model.majority_dictionary
+    size += sys.getsizeof(dictionary)
+    size += sum(sys.getsizeof(morph) + sys.getsizeof(gloss) for morph, gloss in dictionary.items())
+    return size
+
+
+class ModelRegistry:
+    '''Lazily loaded glossing models of several languages, with LRU eviction.
+
+    Thread-safe: concurrent first requests for a language load it only once.
+
+    Parameters
+    ----------
+    directories : dict {language: directory}
+        Saved GlossingModel directory of each language
+    max_bytes : int
+        Memory budget of the resident models (None: unbounded). The most
+        recently used model always stays resident, even above the budget.
+    loader : function
+        Loads a model from its directory (GlossingModel.load by default)
+    footprint : function
+        Estimated memory footprint (bytes) of a loaded model
+    '''
+    def __init__(self, directories=None, max_bytes=None, loader=GlossingModel.load, footprint=model_footprint):
+        self.directories = dict(directories or dict())
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.footprint = footprint
+        self.resident = OrderedDict() # language -> (model, footprint), least recently used first
+        self.resident_bytes = 0
+        self._lock = threading.Lock()
+        self._loading = dict() # language -> lock held while the model is loaded
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+        self.load_seconds = 0.0
+
+    @classmethod
+    def from_directory(cls, root, **kwargs):
+        '''Registry of all the models saved in the subdirectories of root (named by language).'''
+        directories = {name: os.path.join(root, name) for name in sorted(os.listdir(root))
+                       if os.path.isfile(os.path.join(root, name, CONFIG_FILE))}
+        return cls(directories, **kwargs)
+
+    def register(self, language, directory):
+        '''Add (or replace) the model directory of a language.'''
+        with self._lock:
+            self.directories[language] = directory
+            self._drop(language)
+
+    def __contains__(self, language):
+        return language in self.directories
+
+    def languages(self):
+        return sorted(self.directories)
+
+    def get(self, language):
+        '''Model of a language, loaded if it is not resident.'''
+        with self._lock:
+            model = self._touch(language)
+            if model is not None:
+                return model
+            if language not in self.directories:
+                raise KeyError(f'No model registered for the language {language}.')
+            loading = self._loading.setdefault(language, threading.Lock())
+        with loading: # Only one thread loads a given language
+            with self._lock:
+                model = self._touch(language)
+                if model is not None: # Loaded by another thread meanwhile
+                    return model
+                self.n_misses += 1
+                directory = self.directories[language]
+            start = time.perf_counter()
+            model = self.loader(directory)
+            size = self.footprint(model)
+            with self._lock:
+                self.load_seconds += time.perf_counter() - start
+                self._drop(language)
+                self.resident[language] = (model, size)
+                self.resident_bytes += size
+                self._evict()
+        return model
+
+    def gloss_batch(self, requests):
+        '''Gloss a batch of (language, sentence) pairs; returns the gloss lines in order.
+
+        The sentences are grouped by language, and each model glosses its group at once.'''
+        groups = dict()
+        for i, (language, sentence) in enumerate(requests):
+            groups.setdefault(language, []).append((i, sentence))
+        glosses = [None] * len(requests)
+        for language, group in groups.items():
+            for (i, _), gloss in zip(group, self.get(language).gloss_batch([sentence for _, sentence in group])):
+                glosses[i] = gloss
+        return glosses
+
+    def _touch(self, language):
+        '''Resident model of a language (marked as the most recently used), or None.'''
+        entry = self.resident.get(language)
+        if entry is None:
+            return None
+        self.resident.move_to_end(language)
+        self.n_hits += 1
+        return entry[0]
+
+    def _drop(self, language):
+        entry = self.resident.pop(language, None)
+        if entry is not None:
+            self.resident_bytes -= entry[1]
+
+    def _evict(self):
+        '''Evict the least recently used models until the budget is met.'''
+        if self.max_bytes is None:
+            return
+        while self.resident_bytes > self.max_bytes and len(self.resident) > 1:
+            _, (_, size) = self.resident.popitem(last=False)
+            self.resident_bytes -= size
+            self.n_evictions += 1
+
+    def stats(self):
+        '''Hit, miss, eviction, and load time statistics, and the resident models.'''
+        with self._lock:
+            n_requests = self.n_hits + self.n_misses
+            return {
+                'hits': self.n_hits,
+                'misses': self.n_misses,
+                'hit_rate': self.n_hits / n_requests if n_requests else None,
+                'evictions': self.n_evictions,
+                'load_seconds': self.load_seconds,
+                'mean_load_seconds': self.load_seconds / self.n_misses if self.n_misses else None,
+                'resident': list(self.resident),
+                'resident_bytes': self.resident_bytes,
+                'max_bytes': self.max_bytes,
+                'registered': len(self.directories),
+            }
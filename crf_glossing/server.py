@@ -0,0 +1,309 @@
+'''Local HTTP glossing service with dynamic micro-batching.
+
+Usage (from the repository root):
+    python -m crf_glossing.server --model MODEL_DIRECTORY --port 8000
+    python -m crf_glossing.server --model MODEL_DIRECTORY --cache-size 100000 # Repeated sentences are not tagged again
+    python -m crf_glossing.server --models-dir MODELS_DIRECTORY --max-memory-mb 2048 # One subdirectory per language
+
+Endpoints:
+    POST /gloss    {"sentence": "ap yukw-hl"} or {"sentences": [...]}
+                   (with "translation": "..." or "translations": [...] for the models using
+                   the translation as features, and "language": "git" if several models are served)
+                   -> {"glosses": [...], "latency_ms": ...}
+    GET /metrics   latency, batch size, and queue depth statistics (and model registry and prediction
+                   cache statistics)
+    GET /health
+'''
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from crf_glossing.model import GlossingModel
+from crf_glossing.prediction_cache import PredictionCache
+from crf_glossing.registry import ModelRegistry
+
+
+class ServiceMetrics:
+    '''Per-request latency, batch size, and queue depth statistics.
+
+    Parameters
+    ----------
+    window : int
+        Number of recent requests (and batches) kept to compute the latency percentiles
+    '''
+    def __init__(self, window=10000):
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_errors = 0
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def record_request(self, latency):
+        self.n_requests += 1
+        self.latencies.append(latency)
+
+    def record_batch(self, batch_size):
+        self.n_batches += 1
+        self.batch_sizes.append(batch_size)
+
+    def record_queue_depth(self, queue_depth):
+        self.queue_depth = queue_depth
+        self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def snapshot(self):
+        '''Current statistics (latencies in milliseconds).'''
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            'requests': self.n_requests,
+            'batches': self.n_batches,
+            'errors': self.n_errors,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+                           'mean': 1000 * sum(latencies) / len(latencies) if latencies else 0.0},
+            'mean_batch_size': sum(self.batch_sizes) / len(self.batch_sizes) if self.batch_sizes else 0.0,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+        }
+
+
+class MicroBatcher:
+    '''Collects concurrent requests into small batches within a latency budget.
+
+    A batch is sent to gloss_function as soon as it has max_batch_size sentences,
+    or max_delay seconds after its first sentence arrived. Batches run in a
+    thread pool (GlossingModel keeps one tagger per thread).
+
+    Parameters
+    ----------
+    gloss_function : function
+        Glosses a list of sentences (e.g., GlossingModel.gloss_batch)
+    max_batch_size : int
+        Maximum number of sentences per batch
+    max_delay : float
+        Maximum time (in seconds) a sentence waits for its batch to fill
+    n_workers : int
+        Number of batches processed concurrently
+    '''
+    def __init__(self, gloss_function, max_batch_size=32, max_delay=0.005, n_workers=2, metrics=None):
+        self.gloss_function = gloss_function
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.n_workers = n_workers
+        self.metrics = metrics if metrics is not None else ServiceMetrics()
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=n_workers)
+        self.workers = []
+
+    def start(self):
+        '''Start the batching workers (in the running event loop).'''
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._run()) for _ in range(self.n_workers)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, sentence):
+        '''Gloss one sentence (returns its gloss line).'''
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((sentence, future))
+        self.metrics.record_queue_depth(self.queue.qsize())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.metrics.record_queue_depth(self.queue.qsize())
+            self.metrics.record_batch(len(batch))
+
+            sentences = [sentence for sentence, _ in batch]
+            try:
+                glosses = await loop.run_in_executor(self.executor, self.gloss_function, sentences)
+            except Exception:
+                # One bad sentence should not fail its neighbours: each sentence is glossed on its own
+                await self._run_each(batch)
+                continue
+            for (_, future), gloss in zip(batch, glosses):
+                if not future.done(): # The client may have gone away
+                    future.set_result(gloss)
+
+    async def _run_each(self, batch):
+        '''Gloss the sentences of a failed batch one by one: only the failing ones get the error.'''
+        loop = asyncio.get_running_loop()
+        for sentence, future in batch:
+            try:
+                gloss = (await loop.run_in_executor(self.executor, self.gloss_function, [sentence]))[0]
+            except Exception as error:
+                self.metrics.n_errors += 1
+                if not future.done():
+                    future.set_exception(error)
+                continue
+            if not future.done():
+                future.set_result(gloss)
+
+
+class GlossingServer:
+    '''Minimal asyncio HTTP/1.1 server around a MicroBatcher.
+
+    With a ModelRegistry, the batcher glosses (language, sentence) pairs
+    (see ModelRegistry.gloss_batch) and each request names its language.
+    The statistics of the prediction cache (if any) are added to the metrics.'''
+    def __init__(self, batcher, host='127.0.0.1', port=8000, registry=None, prediction_cache=None):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.prediction_cache = prediction_cache
+
+    async def serve_forever(self):
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f'Glossing service listening on http://{self.host}:{self.port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True: # Keep-alive: several requests per connection
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self.route(method, path, body)
+                payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                writer.write((f'HTTP/1.1 {status}\r\nContent-Type: application/json; charset=utf-8\r\n'
+                              f'Content-Length: {len(payload)}\r\n'
+                              f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n').encode('latin-1'))
+                writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        '''Return the status and the (JSON) response of a request.'''
+        if method == 'GET' and path == '/health':
+            return '200 OK', {'status': 'ok'}
+        if method == 'GET' and path == '/metrics':
+            metrics = self.batcher.metrics.snapshot()
+            if self.registry is not None:
+                metrics['registry'] = self.registry.stats()
+            if self.prediction_cache is not None:
+                metrics['prediction_cache'] = self.prediction_cache.stats()
+            return '200 OK', metrics
+        if method == 'POST' and path == '/gloss':
+            start = time.perf_counter()
+            try:
+                request = json.loads(body.decode('utf-8'))
+                if 'sentence' in request:
+                    sentences = [request['sentence']]
+                    translations = [request['translation']] if 'translation' in request else None
+                else:
+                    sentences = request['sentences']
+                    translations = request.get('translations')
+                if not all(isinstance(sentence, str) for sentence in sentences):
+                    raise TypeError
+                if translations is not None:
+                    if len(translations) != len(sentences) or not all(isinstance(t, str) for t in translations):
+                        raise TypeError
+                    sentences = [(sentence, translation) for sentence, translation in zip(sentences, translations)]
+                if self.registry is not None:
+                    language = request['language']
+                    if language not in self.registry:
+                        return '404 Not Found', {'error': f'Unknown language: {language}'}
+                    sentences = [(language, sentence) for sentence in sentences]
+            except (ValueError, KeyError, TypeError):
+                expected = '{"sentence": str[, "translation": str]} or {"sentences": [str][, "translations": [str]]}'
+                if self.registry is not None:
+                    expected = expected.replace('{', '{"language": str, ')
+                return '400 Bad Request', {'error': f'Expected {expected}.'}
+            try:
+                glosses = await asyncio.gather(*[self.batcher.submit(sentence) for sentence in sentences])
+            except Exception as error:
+                return '500 Internal Server Error', {'error': str(error)}
+            latency = time.perf_counter() - start
+            self.batcher.metrics.record_request(latency)
+            return '200 OK', {'glosses': glosses, 'latency_ms': 1000 * latency}
+        return '404 Not Found', {'error': f'Unknown endpoint: {method} {path}'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local HTTP glossing service.')
+    model_group = parser.add_mutually_exclusive_group(required=True)
+    model_group.add_argument('--model', help='Directory of a saved GlossingModel')
+    model_group.add_argument('--models-dir', help='Directory with one saved GlossingModel per language')
+    parser.add_argument('--max-memory-mb', type=float, default=None,
+                        help='Memory budget of the resident models (with --models-dir)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=32, help='Maximum number of sentences per batch')
+    parser.add_argument('--max-delay-ms', type=float, default=5.0, help='Latency budget to fill a batch (ms)')
+    parser.add_argument('--workers', type=int, default=2, help='Number of batches tagged concurrently')
+    parser.add_argument('--backoff', action='store_true',
+                        help='Gloss the unknown stems with the closest known morpheme (instead of UNK)')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='Number of glossed sentences cached (shared by all the models; 0: no cache)')
+    args = parser.parse_args()
+
+    prediction_cache = PredictionCache(args.cache_size) if args.cache_size > 0 else None
+    registry = None
+    if args.models_dir is not None:
+        max_bytes = None if args.max_memory_mb is None else int(args.max_memory_mb * 2 ** 20)
+        registry = ModelRegistry.from_directory(args.models_dir, max_bytes=max_bytes,
+                                                loader=partial(GlossingModel.load, prediction_cache=prediction_cache,
+                                                               backoff=args.backoff))
+        print(f'Languages: {", ".join(registry.languages())}')
+        gloss_function = registry.gloss_batch
+    else:
+        gloss_function = GlossingModel.load(args.model, prediction_cache=prediction_cache,
+                                            backoff=args.backoff).gloss_batch
+    batcher = MicroBatcher(gloss_function, max_batch_size=args.max_batch_size,
+                           max_delay=args.max_delay_ms / 1000, n_workers=args.workers)
+    try:
+        asyncio.run(GlossingServer(batcher, host=args.host, port=args.port, registry=registry,
+                                   prediction_cache=prediction_cache).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,16 @@
 """Code from the SIGMORPHON 2023 Shared Task on Interlinear Glossing: https://github.com/sigmorphon/2023glossingST/ ."""
 '''Modified to remove BLEU score, which required additional packages.'''
 
-from typing import List
-from data import load_data_file #IGTLine, 
+from typing import List, Optional, Sequence, Tuple
+from itertools import zip_longest
+try:
+    from data import load_data_file, iter_data_file, IGTLine
+    import instrument
+    import utils
+except ImportError: # Imported from the crf_glossing package
+    from crf_glossing.data import load_data_file, iter_data_file, IGTLine
+    import crf_glossing.instrument as instrument
+    import crf_glossing.utils as utils
 # from torchtext.data.metrics import bleu_score
 import click
 import json
@@ -84,24 +92,110 @@ def eval_word_glosses(pred_words: List[List[str]], gold_words: List[List[str]]):
     return {'word_level': word_eval} #, 'bleu': bleu}
 
 
-@click.command()
-@click.option("--pred", help="File containing predicted IGT", type=click.Path(exists=True), required=True)
-@click.option("--gold", help="File containing gold-standard IGT", type=click.Path(exists=True), required=True)
-def evaluate_igt(pred: str, gold: str):
-    """Performs evaluation of a predicted IGT file"""
-
-    pred = load_data_file(pred)
-    gold = load_data_file(gold)
-
-    pred_words = [line.gloss_list() for line in pred]
-    gold_words = [line.gloss_list() for line in gold]
-    word_eval = eval_accuracy(pred_words, gold_words)
+class StreamingEvaluator:
+    """Computes all the metrics (word level, morpheme level, stems/grams) in one pass over the entries.
+
+    Gives the same results as eval_accuracy and eval_stems_grams, in constant memory."""
+    def __init__(self):
+        self.levels = {level: {'correct': 0, 'tokens': 0, 'summed_accuracies': 0, 'entries': 0}
+                       for level in ['word_level', 'morpheme_level']}
+        self.perf = {'stem': {'correct': 0, 'pred': 0, 'gold': 0}, 'gram': {'correct': 0, 'pred': 0, 'gold': 0}}
+
+    def update(self, pred_line: Optional[IGTLine], gold_line: IGTLine):
+        """Adds one gold entry and its prediction (None if the prediction file is shorter)."""
+        gold_words = gold_line.gloss_list()
+        gold_morphemes = gold_line.gloss_list(segmented=True)
+        if pred_line is None: # Counted as an entry, but not in the token counts (as eval_accuracy)
+            self.levels['word_level']['entries'] += 1
+            self.levels['morpheme_level']['entries'] += 1
+            return
+        pred_morphemes = pred_line.gloss_list(segmented=True)
+        self._update_accuracy('word_level', pred_line.gloss_list(), gold_words)
+        self._update_accuracy('morpheme_level', pred_morphemes, gold_morphemes)
+
+        for token_index in range(len(gold_morphemes)):
+            token_type = 'gram' if gold_morphemes[token_index].isupper() else 'stem'
+            self.perf[token_type]['gold'] += 1
+            if token_index < len(pred_morphemes):
+                pred_token_type = 'gram' if pred_morphemes[token_index].isupper() else 'stem'
+                self.perf[pred_token_type]['pred'] += 1
+                if pred_morphemes[token_index] == gold_morphemes[token_index]:
+                    self.perf[token_type]['correct'] += 1
+
+    def _update_accuracy(self, level: str, entry_pred: List[str], entry_gold: List[str]):
+        entry_correct_predictions = 0
+        for token_index in range(len(entry_gold)):
+            if token_index < len(entry_pred) and entry_pred[token_index] == entry_gold[token_index] and entry_pred[token_index] != '[UNK]':
+                entry_correct_predictions += 1
+        counts = self.levels[level]
+        counts['summed_accuracies'] += entry_correct_predictions / len(entry_gold)
+        counts['correct'] += entry_correct_predictions
+        counts['tokens'] += len(entry_gold)
+        counts['entries'] += 1
+
+    def results(self) -> dict:
+        """Returns the metrics in the same format as evaluate_igt."""
+        all_eval = {level: {'average_accuracy': counts['summed_accuracies'] / counts['entries'],
+                            'accuracy': counts['correct'] / counts['tokens']}
+                    for level, counts in self.levels.items()}
+        classes = dict()
+        for token_type, perf in self.perf.items():
+            type_perf = {'prec': 0 if perf['pred'] == 0 else perf['correct'] / perf['pred'],
+                         'rec': perf['correct'] / perf['gold']}
+            if (type_perf['prec'] + type_perf['rec']) == 0:
+                type_perf['f1'] = 0
+            else:
+                type_perf['f1'] = 2 * (type_perf['prec'] * type_perf['rec']) / (type_perf['prec'] + type_perf['rec'])
+            classes[token_type] = type_perf
+        all_eval['classes'] = classes
+        return all_eval
+
+
+def evaluate_pair(pred: str, gold: str) -> dict:
+    """Evaluates a predicted IGT file against a gold file in a single streaming pass."""
+    evaluator = StreamingEvaluator()
+    with instrument.stage('evaluate') as current_stage:
+        n_entries = 0
+        for pred_line, gold_line in zip_longest(iter_data_file(pred), iter_data_file(gold)):
+            if gold_line is None: # Extra predictions are ignored
+                break
+            evaluator.update(pred_line, gold_line)
+            n_entries += 1
+        current_stage.items = n_entries
+    return evaluator.results()
+
+
+def _evaluate_pair(pair: Tuple[str, str]) -> dict:
+    return evaluate_pair(*pair)
+
+
+def evaluate_files(pairs: Sequence[Tuple[str, str]], n_jobs: Optional[int] = None) -> List[dict]:
+    """Evaluates many (pred, gold) file pairs (e.g., systems x languages), in parallel."""
+    pairs = list(pairs)
+    all_results = utils.map_files(_evaluate_pair, pairs, n_jobs=n_jobs)
+    return [{'pred': pred, 'gold': gold, 'results': results} for (pred, gold), results in zip(pairs, all_results)]
 
-    pred_morphemes = [line.gloss_list(segmented=True) for line in pred]
-    gold_morphemes = [line.gloss_list(segmented=True) for line in gold]
 
-    all_eval = {'word_level': word_eval, **eval_morpheme_glosses(pred_morphemes=pred_morphemes, gold_morphemes=gold_morphemes)}
-    print(json.dumps(all_eval, sort_keys=True, indent=4))
+@click.command()
+@click.option("--pred", help="File(s) containing predicted IGT (repeat the option for several files)", type=click.Path(exists=True), required=True, multiple=True)
+@click.option("--gold", help="File(s) containing gold-standard IGT (one for all predictions, or one per prediction)", type=click.Path(exists=True), required=True, multiple=True)
+@click.option("--output", help="Path of the combined JSON report", type=click.Path(), default=None)
+@click.option("--jobs", help="Number of files evaluated in parallel (default: all CPUs)", type=int, default=None)
+def evaluate_igt(pred: Tuple[str], gold: Tuple[str], output: Optional[str], jobs: Optional[int]):
+    """Performs evaluation of predicted IGT files"""
+    if len(gold) == 1:
+        gold = gold * len(pred)
+    if len(gold) != len(pred):
+        raise click.BadParameter('Give either one gold file or one gold file per prediction file.', param_hint='--gold')
+
+    report = evaluate_files(list(zip(pred, gold)), n_jobs=jobs)
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as out_file:
+            json.dump(report, out_file, sort_keys=True, indent=4)
+    if len(report) == 1:
+        print(json.dumps(report[0]['results'], sort_keys=True, indent=4))
+    else:
+        print(json.dumps(report, sort_keys=True, indent=4))
 
 
 if __name__ == '__main__':
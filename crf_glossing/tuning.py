@@ -0,0 +1,170 @@
+'''Hyperparameter search with k-fold cross-validation.
+
+The training corpus is featurized once; the (configuration, fold) pairs are
+then trained and scored in parallel across a process pool, every worker
+reading the same feature sequences (inherited at start, never recomputed).
+Each fold is scored with the simple_eval metrics, after majority labelling
+with the lexicon of the training folds.
+
+    grid = {'c1': [0.01, 0.1, 1.0], 'c2': [0.01, 0.1], 'max_iterations': [50, 100]}
+    model, cv_results = tune(train_corpus, grid, 'model.crfsuite', n_folds=5)
+'''
+import itertools
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sklearn_crfsuite
+
+import crf_glossing.features as cgfeat
+import crf_glossing.instrument as instrument
+import crf_glossing.majority_label as ml
+import crf_glossing.process_file as cgpf
+from crf_glossing.data import IGTLine
+from crf_glossing.model import GlossingModel, MODEL_FILE, crf_params
+from crf_glossing.simple_eval import StreamingEvaluator
+
+
+DEFAULT_METRIC = ('morpheme_level', 'accuracy')
+
+_shared = dict() # Features and units of the corpus in each worker (see _init_worker)
+
+
+def parameter_grid(grid):
+    '''All the configurations (list of dict) of a grid {parameter: [values]}.
+
+    A list of grids (or of configurations) is also accepted.'''
+    if isinstance(grid, dict):
+        grid = [grid]
+    configurations = []
+    for sub_grid in grid:
+        names = sorted(sub_grid)
+        values = [sub_grid[name] if isinstance(sub_grid[name], (list, tuple)) else [sub_grid[name]]
+                  for name in names]
+        configurations.extend(dict(zip(names, combination)) for combination in itertools.product(*values))
+    return configurations
+
+def kfold_indices(n_items, n_folds=5, seed=0):
+    '''Test indices of each fold (shuffled with the seed, then dealt round-robin).'''
+    assert 2 <= n_folds <= n_items, f'Cannot split {n_items} sentences into {n_folds} folds.'
+    indices = list(range(n_items))
+    random.Random(seed).shuffle(indices)
+    return [sorted(indices[fold::n_folds]) for fold in range(n_folds)]
+
+def get_metric(results, metric=DEFAULT_METRIC):
+    '''Value of a (nested) metric of the simple_eval results, e.g., ('classes', 'stem', 'f1').'''
+    for key in metric:
+        results = results[key]
+    return results
+
+
+def _init_worker(X, y, units):
+    _shared['X'] = X
+    _shared['y'] = y
+    _shared['units'] = units
+
+def _evaluate_fold(task):
+    '''Train a configuration on all folds but one and score it on the held-out fold.'''
+    config_index, params, fold_index, test_indices = task
+    X, y, units = _shared['X'], _shared['y'], _shared['units']
+    start = time.perf_counter()
+    held_out = set(test_indices)
+    train_indices = [i for i in range(len(X)) if i not in held_out]
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        crf = sklearn_crfsuite.CRF(model_filename=os.path.join(model_dir, MODEL_FILE), **params)
+        crf.fit([X[i] for i in train_indices], [y[i] for i in train_indices])
+        y_pred = crf.predict([X[i] for i in test_indices])
+
+    lexicon = ml.MajorityLexicon.from_corpus(units[i] for i in train_indices)
+    test_units = [units[i] for i in test_indices]
+    evaluator = StreamingEvaluator()
+    for labels, sentence in zip(ml.iter_majority_label(y_pred, lexicon, test_units), test_units):
+        gold_line = IGTLine('', None, cgpf.pred_to_igt_format(sentence.split_gloss), None)
+        pred_line = IGTLine('', None, cgpf.pred_to_igt_format(labels), None)
+        evaluator.update(pred_line, gold_line)
+    return config_index, fold_index, evaluator.results(), time.perf_counter() - start
+
+
+def cross_validate(X, y, units, configurations, n_folds=5, n_jobs=None, seed=0, metric=DEFAULT_METRIC):
+    '''Score each configuration with k-fold cross-validation on featurized sentences.
+
+    X, y: features and CRF labels of each sentence (see corpus2features and sent2labels).
+    units: cgpf.Units (or Sentence objects) of each sentence, for the majority labelling and the gold glosses.
+    n_jobs: number of processes (None: all CPUs); each one trains one (configuration, fold) at a time.
+
+    Returns one entry per configuration: parameters, mean and standard deviation of the metric,
+    and the results of each fold.'''
+    units = [cgpf.Units(list(sentence.split_source), list(sentence.split_gloss)) for sentence in units]
+    assert len(X) == len(y) == len(units), f'Number of sentences do not match: {len(X)}, {len(y)}, and {len(units)}.'
+    unique = dict() # Configurations that only differ by unsupported parameters are the same
+    for params in configurations:
+        params = crf_params(**params)
+        unique.setdefault(tuple(sorted(params.items())), params)
+    configurations = list(unique.values())
+    folds = kfold_indices(len(X), n_folds, seed=seed)
+    tasks = [(config_index, params, fold_index, test_indices)
+             for config_index, params in enumerate(configurations)
+             for fold_index, test_indices in enumerate(folds)]
+    # Longest trainings first, so that the last tasks do not leave workers idle
+    tasks.sort(key=lambda task: -task[1].get('max_iterations', 0))
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, len(tasks))
+    with instrument.stage('cross_validate', len(tasks)):
+        if n_jobs <= 1:
+            _init_worker(X, y, units)
+            try:
+                fold_results = [_evaluate_fold(task) for task in tasks]
+            finally:
+                _shared.clear()
+        else: # The features are handed to each worker once, not with every task
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                     initargs=(X, y, units)) as executor:
+                fold_results = list(executor.map(_evaluate_fold, tasks))
+
+    cv_results = [{'params': params, 'fold_results': [None] * n_folds, 'fold_scores': [None] * n_folds,
+                   'seconds': 0.0} for params in configurations]
+    for config_index, fold_index, results, seconds in fold_results:
+        entry = cv_results[config_index]
+        entry['fold_results'][fold_index] = results
+        entry['fold_scores'][fold_index] = get_metric(results, metric)
+        entry['seconds'] += seconds
+    for entry in cv_results:
+        scores = entry['fold_scores']
+        entry['mean_score'] = sum(scores) / n_folds
+        entry['std_score'] = (sum((score - entry['mean_score']) ** 2 for score in scores) / n_folds) ** 0.5
+    return cv_results
+
+def best_configuration(cv_results):
+    '''Parameters with the best mean score (the first one in case of tie).'''
+    return max(cv_results, key=lambda entry: entry['mean_score'])['params']
+
+
+def tune(train_corpus, grid, model_path, n_folds=5, stem=True, custom_dict=dict(), n_jobs=None,
+         seed=0, metric=DEFAULT_METRIC, features=None):
+    '''Cross-validate a grid of CRF parameters and train the best model on the whole corpus.
+
+    train_corpus: IGT_Corpus (or any sequence of annotated Sentence objects).
+    grid: {parameter: [values]} of sklearn_crfsuite.CRF (e.g., algorithm, c1, c2, max_iterations).
+    model_path: path where the best CRF model is saved.
+    features: (X, y) of the corpus if already computed (e.g., cached); computed once otherwise.
+
+    Returns the best GlossingModel and the cross-validation results (see cross_validate).'''
+    sentences = list(train_corpus)
+    if features is None:
+        crf_sents = cgpf.sentences_to_crf_format(sentences, stem=stem, custom_dict=custom_dict)
+        crf_sents = list(crf_sents)
+        features = (cgfeat.corpus2features(crf_sents, n_jobs=n_jobs), [cgfeat.sent2labels(s) for s in crf_sents])
+    X, y = features
+
+    cv_results = cross_validate(X, y, sentences, parameter_grid(grid), n_folds=n_folds,
+                                n_jobs=n_jobs, seed=seed, metric=metric)
+    crf = sklearn_crfsuite.CRF(model_filename=model_path, **best_configuration(cv_results))
+    with instrument.stage('crf_fit', len(X)):
+        crf.fit(X, y)
+    majority_dictionary = ml.create_majority_dict(sentences)
+    return GlossingModel(model_path, majority_dictionary, stem=stem, custom_dict=custom_dict), cv_results
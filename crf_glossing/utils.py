@@ -1,4 +1,13 @@
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+try:
+    import crf_glossing.instrument as instrument
+except ImportError: # Run as a script from the crf_glossing folder (see simple_eval)
+    import instrument
 
 
 # def delete_value_from_vector(vector, value):
@@ -45,6 +54,62 @@ def flatten_2D(list_of_list):
     '''Flatten a 2D list (list of list).'''
     return [element for element_list in list_of_list for element in element_list]
 
+def _map_chunk(function, chunk, instrumented=False):
+    '''Apply function to a chunk in a worker process; with the aggregates recorded meanwhile if instrumented.'''
+    if not instrumented:
+        return [function(item) for item in chunk], None
+    if not instrument.ENABLED: # Spawned worker: the parent's state is not inherited
+        instrument.enable()
+    before = instrument.snapshot()
+    results = [function(item) for item in chunk]
+    return results, instrument.aggregates_since(before)
+
+def _collect(future, results):
+    chunk_results, aggregates = future.result()
+    results.extend(chunk_results)
+    if aggregates:
+        instrument.merge(aggregates)
+
+def parallel_map(function, items, n_jobs=None, chunksize=None, min_parallel=1000, max_pending=None):
+    '''Apply a (picklable) function to all items across a process pool, keeping the order.
+
+    The items are read lazily and sent to the workers by chunks, with at most
+    max_pending chunks submitted at once, so that a stream (e.g., IGT_Stream) is
+    never fully loaded in memory; only the results are.
+    n_jobs: number of worker processes (None: all CPUs, 1: serial).
+    chunksize: number of items sent to a worker at once (default: 256).
+    max_pending: number of chunks submitted and not collected yet (default: 2 per worker).
+    Inputs with fewer than min_parallel items are processed serially.
+    The aggregated timings (see instrument) recorded in the workers are merged into the parent's.'''
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    items = iter(items)
+    head = list(islice(items, min_parallel))
+    if n_jobs <= 1 or len(head) < min_parallel: # Not worth the pool overhead
+        return [function(item) for item in chain(head, items)]
+    if chunksize is None:
+        chunksize = 256
+    if max_pending is None:
+        max_pending = 2 * n_jobs
+    results = []
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        stream = chain(head, items)
+        for chunk in iter(lambda: list(islice(stream, chunksize)), []):
+            pending.append(executor.submit(_map_chunk, function, chunk, instrument.ENABLED))
+            if len(pending) >= max_pending:
+                _collect(pending.popleft(), results)
+        while pending:
+            _collect(pending.popleft(), results)
+    return results
+
+def map_files(function, tasks, n_jobs=None):
+    '''Apply a (picklable) function to a few heavy tasks (e.g., one per file) across a process pool.
+
+    Each task is sent to a worker on its own; a single task is run serially.
+    Returns the results in order (see parallel_map).'''
+    return parallel_map(function, tasks, n_jobs=n_jobs, chunksize=1, min_parallel=2)
+
 # Save text file
 def save_file(text, path):
     '''Save a text file in the desired path.'''
@@ -0,0 +1,296 @@
+'''Batched Viterbi decoding of a trained crfsuite model with NumPy.
+
+The state and transition weights of the model are exported once into NumPy
+arrays (see ViterbiDecoder.from_model). Sentences are grouped into buckets
+of the same length and each bucket is decoded at once. Sentences can be given
+as features (decode) or directly as morphemes (decode_morphemes, faster: each
+morpheme type is scored once instead of each window position).
+
+The candidate labels of each position can be restricted to the labels seen
+with the morpheme in training (see label_candidates): the dynamic program
+then only runs over these candidates (padded to the largest candidate set of
+the bucket at each position), instead of over the whole label set. Unknown
+morphemes keep all the labels. Unconstrained decoding gives the same labels
+as the crfsuite tagger; constrained decoding can differ from it, since it
+forbids the labels never seen with a known morpheme.
+
+    decoder = ViterbiDecoder.from_model('model.crfsuite')
+    lexicon = MajorityLexicon.from_corpus(train_corpus)
+    candidates = [label_candidates(sentence.split_source, lexicon, decoder) for sentence in test_corpus]
+    y_pred = decoder.decode(X_test, candidates)
+'''
+from collections import defaultdict
+
+import numpy as np
+import pycrfsuite
+
+import crf_glossing.features as cgfeat
+import crf_glossing.instrument as instrument
+import crf_glossing.process_file as cgpf
+
+
+class ViterbiDecoder:
+    '''First-order CRF decoder with the weights of a crfsuite model.
+
+    Parameters
+    ----------
+    labels : list [labels (string)]
+        Labels of the model (in the order of the weight columns)
+    attributes : dict {attribute (string): index}
+        Index of each attribute of the model
+    feature_offsets : numpy array (n_attributes + 1)
+        The state features of attribute a are feature_labels[feature_offsets[a]:feature_offsets[a + 1]]
+    feature_labels, feature_weights : numpy arrays (n_features)
+        Label index and weight of each state feature
+    transitions : numpy array (n_labels, n_labels)
+        Weight of each transition (previous label, label)
+    '''
+    def __init__(self, labels, attributes, feature_offsets, feature_labels, feature_weights, transitions):
+        self.labels = labels
+        self.label_index = {label: i for i, label in enumerate(labels)}
+        self.attributes = attributes
+        self.feature_offsets = feature_offsets
+        self.feature_labels = feature_labels
+        self.feature_weights = feature_weights
+        self.transitions = transitions
+        self._item_cache = dict() # (key, value) of a feature -> (attribute index, value)
+
+    @classmethod
+    def from_model(cls, model_path):
+        '''Export the weights of a crfsuite model file.'''
+        tagger = pycrfsuite.Tagger()
+        tagger.open(model_path)
+        info = tagger.info()
+        tagger.close()
+
+        labels = [label for label, _ in sorted(info.labels.items(), key=lambda item: int(item[1]))]
+        label_index = {label: i for i, label in enumerate(labels)}
+        attributes = {attribute: i for i, (attribute, _) in
+                      enumerate(sorted(info.attributes.items(), key=lambda item: int(item[1])))}
+
+        features = defaultdict(list)
+        for (attribute, label), weight in info.state_features.items():
+            features[attributes[attribute]].append((label_index[label], weight))
+        counts = np.zeros(len(attributes) + 1, dtype=np.int64)
+        for attribute, attribute_features in features.items():
+            counts[attribute + 1] = len(attribute_features)
+        feature_offsets = np.cumsum(counts)
+        feature_labels = np.zeros(feature_offsets[-1], dtype=np.int32)
+        feature_weights = np.zeros(feature_offsets[-1], dtype=np.float64)
+        for attribute, attribute_features in features.items():
+            start = feature_offsets[attribute]
+            for j, (label, weight) in enumerate(attribute_features):
+                feature_labels[start + j] = label
+                feature_weights[start + j] = weight
+
+        transitions = np.zeros((len(labels), len(labels)), dtype=np.float64)
+        for (previous_label, label), weight in info.transitions.items():
+            transitions[label_index[previous_label], label_index[label]] = weight
+        return cls(labels, attributes, feature_offsets, feature_labels, feature_weights, transitions)
+
+    @property
+    def n_labels(self):
+        return len(self.labels)
+
+    def attribute_items(self, features):
+        '''Attribute indices and values of a position (as pycrfsuite converts a feature dict).
+
+        String values become "key:value" attributes of value 1; the other values
+        (booleans, numbers) are the value of the attribute key.'''
+        indices, values = [], []
+        self._add_items(features, indices, values)
+        return indices, values
+
+    def _add_items(self, features, indices, values):
+        item_cache = self._item_cache
+        for item in features.items():
+            attribute = item_cache.get(item)
+            if attribute is None:
+                attribute = item_cache[item] = self._attribute(*item)
+            if attribute[0] >= 0:
+                indices.append(attribute[0])
+                values.append(attribute[1])
+
+    def _attribute(self, key, value):
+        '''(index, value) of a feature, with index -1 for unknown (or zero-valued) attributes.'''
+        if isinstance(value, str):
+            attribute, value = f'{key}:{value}', 1.0
+        else:
+            attribute, value = key, float(value)
+        index = self.attributes.get(attribute)
+        if index is None or value == 0.0: # Unknown attributes have no weight
+            return (-1, 0.0)
+        return (index, value)
+
+    def emissions(self, X):
+        '''State scores (n_positions, n_labels) of all the positions of featurized sentences.'''
+        indices, values, counts = [], [], []
+        for xseq in X:
+            for features in xseq:
+                n_items = len(indices)
+                self._add_items(features, indices, values)
+                counts.append(len(indices) - n_items)
+        n_positions = len(counts)
+        positions = np.repeat(np.arange(n_positions), counts)
+        indices = np.asarray(indices, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+
+        # Expand each attribute into its state features
+        starts = self.feature_offsets[indices]
+        counts = self.feature_offsets[indices + 1] - starts
+        feature_positions = np.repeat(positions, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        features = np.repeat(starts, counts) + offsets
+        scores = self.feature_weights[features] * np.repeat(values, counts)
+        flat = feature_positions * self.n_labels + self.feature_labels[features]
+        return np.bincount(flat, weights=scores, minlength=n_positions * self.n_labels).reshape(n_positions, self.n_labels)
+
+    def morpheme_scores(self, morphs):
+        '''State scores of morpheme types in each role of the window (see features.window2features).
+
+        Returns the scores (n_types, 4, n_labels) of each type as current, previous, second
+        previous, and next morpheme, whether each type is a boundary, and the BOS and EOS scores.'''
+        pieces = [cgfeat.morph_features(morph) for morph in morphs]
+        scores = self.emissions([[piece[0], piece[1], piece[2], piece[3]] for piece in pieces]
+                                + [[{'BOS': True}, {'EOS': True}]])
+        boundary = np.array([piece[4] for piece in pieces], dtype=bool)
+        return scores[:-2].reshape(len(pieces), 4, self.n_labels), boundary, scores[-2], scores[-1]
+
+    def morpheme_emissions(self, ids, morpheme_scores):
+        '''State scores (n_sent, length, n_labels) of sentences of the same length.
+
+        ids: morpheme type of each position (n_sent, length); morpheme_scores: see morpheme_scores.
+        Same scores as emissions on the features of the sentences (sent2features).'''
+        type_scores, boundary, bos, eos = morpheme_scores
+        emissions = type_scores[ids, 0]
+        emissions[:, 1:] += type_scores[ids[:, :-1], 1]
+        if ids.shape[1] > 2: # Second previous morpheme, after a morpheme boundary
+            emissions[:, 2:] += type_scores[ids[:, :-2], 2] * boundary[ids[:, 1:-1]][:, :, None]
+        emissions[:, :-1] += type_scores[ids[:, 1:], 3]
+        emissions[:, 0] += bos
+        emissions[:, -1] += eos
+        return emissions
+
+    def emission_batches(self, X=None, sentences=None, max_bucket_size=1024):
+        '''Group sentences into buckets of the same length, with their state scores (generator).
+
+        The sentences are given as features (X) or as lists of morphemes (sentences, see
+        morpheme_emissions). Yields the indices of the sentences of each bucket and their
+        state scores (n_sent, length, n_labels); empty sentences are not yielded.'''
+        if sentences is not None:
+            types = dict()
+            ids = [[types.setdefault(morph, len(types)) for morph in sentence] for sentence in sentences]
+            morpheme_scores = self.morpheme_scores(list(types))
+            lengths = list(map(len, sentences))
+        else:
+            lengths = list(map(len, X))
+        buckets = defaultdict(list)
+        for i, length in enumerate(lengths):
+            buckets[length].append(i)
+        for length, sentence_indices in buckets.items():
+            if length == 0:
+                continue
+            for start in range(0, len(sentence_indices), max_bucket_size):
+                bucket = sentence_indices[start:start + max_bucket_size]
+                if sentences is not None:
+                    emissions = self.morpheme_emissions(np.array([ids[i] for i in bucket], dtype=np.int64),
+                                                        morpheme_scores)
+                else:
+                    emissions = self.emissions([X[i] for i in bucket]).reshape(len(bucket), length, self.n_labels)
+                yield bucket, emissions
+
+    def decode(self, X, candidates=None):
+        '''Best label sequence of each featurized sentence (as crfsuite's tag).
+
+        candidates: for each sentence, the candidate label indices of each position
+        (None for all the labels), e.g., from label_candidates.'''
+        return self._decode(len(X), self.emission_batches(X=X), candidates)
+
+    def decode_morphemes(self, sentences, candidates=None):
+        '''Best label sequence of each sentence given as a list of morphemes (e.g., split_source).
+
+        Same result as decode on the features of the sentences (sent2features), without
+        building the feature dictionaries: each morpheme type is scored once.'''
+        return self._decode(len(sentences), self.emission_batches(sentences=sentences), candidates)
+
+    def _decode(self, n_sent, batches, candidates=None):
+        y_pred = [[] for _ in range(n_sent)]
+        labels = self.labels
+        with instrument.stage('viterbi', n_sent):
+            for bucket, emissions in batches:
+                bucket_candidates = None if candidates is None else [candidates[i] for i in bucket]
+                paths = self._viterbi(emissions, bucket_candidates)
+                for i, path in zip(bucket, paths):
+                    y_pred[i] = [labels[label] for label in path]
+        return y_pred
+
+    def _viterbi(self, emissions, candidates=None):
+        '''Viterbi over a batch of sentences of the same length; returns the label indices.
+
+        emissions: state scores (n_sent, length, n_labels).'''
+        n_sent, length, _ = emissions.shape
+        rows = np.arange(n_sent)
+
+        # Candidate labels of each position (None: all the labels), padded to the largest
+        # candidate set of the position: (labels (n_sent, k), valid (n_sent, k))
+        position_candidates = []
+        for t in range(length):
+            if candidates is None or all(sentence[t] is None for sentence in candidates):
+                position_candidates.append(None)
+                continue
+            sets = [np.arange(self.n_labels) if sentence[t] is None else sentence[t] for sentence in candidates]
+            k = max(len(label_set) for label_set in sets)
+            labels = np.zeros((n_sent, k), dtype=np.int64)
+            valid = np.zeros((n_sent, k), dtype=bool)
+            for s, label_set in enumerate(sets):
+                labels[s, :len(label_set)] = label_set
+                labels[s, len(label_set):] = label_set[0]
+                valid[s, :len(label_set)] = True
+            position_candidates.append((labels, valid))
+
+        def scores(t):
+            if position_candidates[t] is None:
+                return emissions[:, t, :]
+            labels, valid = position_candidates[t]
+            return np.where(valid, emissions[rows[:, None], t, labels], -np.inf)
+
+        def transitions(t):
+            previous, current = position_candidates[t - 1], position_candidates[t]
+            if previous is None and current is None:
+                return self.transitions[None, :, :]
+            if previous is None:
+                return self.transitions[:, current[0]].transpose(1, 0, 2)
+            if current is None:
+                return self.transitions[previous[0]]
+            return self.transitions[previous[0][:, :, None], current[0][:, None, :]]
+
+        delta = scores(0)
+        backpointers = []
+        for t in range(1, length):
+            total = delta[:, :, None] + transitions(t) # (n_sent, previous k, k)
+            backpointers.append(total.argmax(axis=1))
+            delta = total.max(axis=1) + scores(t)
+
+        # Backtrack (over the candidates, then back to the label indices)
+        path = np.zeros((n_sent, length), dtype=np.int64)
+        path[:, -1] = delta.argmax(axis=1)
+        for t in range(length - 1, 0, -1):
+            path[:, t - 1] = backpointers[t - 1][rows, path[:, t]]
+        for t, position in enumerate(position_candidates):
+            if position is not None:
+                path[:, t] = position[0][rows, path[:, t]]
+        return path.tolist()
+
+
+def label_candidates(split_source, lexicon, decoder, stem=True, custom_dict=dict()):
+    '''Candidate label indices of each morpheme: its CRF labels seen in training.
+
+    lexicon: MajorityLexicon of the training corpus (labels seen with each morpheme).
+    Unknown morphemes (or without any label known to the model) have None (all the labels).'''
+    candidates = []
+    for morph in split_source:
+        labels = {cgpf.gloss_to_crf_label(morph, gloss, stem=stem, custom_dict=custom_dict)
+                  for gloss in lexicon.labels(morph)}
+        indices = sorted(decoder.label_index[label] for label in labels if label in decoder.label_index)
+        candidates.append(np.asarray(indices, dtype=np.int64) if indices else None)
+    return candidates
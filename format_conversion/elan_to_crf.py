@@ -1,36 +1,74 @@
 # elan_to_crf.py
 from pympi.Elan import Eaf
 import argparse
+import os
+import sys
 
-def convert_eaf_to_crf(eaf_path, output_path):
-    eaf = Eaf(eaf_path)
-    tiers = eaf.get_tier_names()
-    
-    # Example: pick tiers manually (edit as needed)
-    transcription_tier = 'transcription'
-    morph_tier = 'morphemes'
-    gloss_tier = 'gloss'
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # To import crf_glossing
+
+import crf_glossing.utils as utils
+from crf_glossing.readers import TierIndex # Shared with ElanReader
+
+
+def align_tiers(eaf, transcription_tier='transcription', morph_tier='morphemes', gloss_tier='gloss', strict=True):
+    '''Morphemes and glosses of each transcription annotation (lists of (morph, gloss) pairs).
+
+    Annotations whose numbers of morphemes and glosses differ are skipped.
+    strict: ignore the annotations which only touch the transcription annotation, as ElanReader
+    (otherwise, they are included, as by Eaf.get_annotation_data_between_times).'''
+    morph_index = TierIndex.from_tier(eaf, morph_tier)
+    gloss_index = TierIndex.from_tier(eaf, gloss_tier)
+    for annotation in eaf.get_annotation_data_for_tier(transcription_tier):
+        start, end = annotation[0], annotation[1]
+        morphs = morph_index.overlapping(start, end, strict=strict)
+        glosses = gloss_index.overlapping(start, end, strict=strict)
 
+        # Ensure aligned counts
+        if len(morphs) != len(glosses):
+            continue
+        yield [(m[2], g[2]) for m, g in zip(morphs, glosses)]
+
+def convert_eaf_to_crf(eaf_path, output_path, transcription_tier='transcription', morph_tier='morphemes',
+                       gloss_tier='gloss', strict=True):
+    eaf = Eaf(eaf_path)
+    n_sentences = 0
     with open(output_path, 'w', encoding='utf-8') as out_f:
-        for annotation in eaf.get_annotation_data_for_tier(transcription_tier):
-            start, end, text = annotation
-            morphs = eaf.get_annotation_data_between_times(morph_tier, start, end)
-            glosses = eaf.get_annotation_data_between_times(gloss_tier, start, end)
-            
-            # Ensure aligned counts
-            if len(morphs) != len(glosses):
-                continue
-            
-            for m, g in zip(morphs, glosses):
-                _, _, morph = m
-                _, _, gloss = g
+        for pairs in align_tiers(eaf, transcription_tier, morph_tier, gloss_tier, strict=strict):
+            for morph, gloss in pairs:
                 out_f.write(f"{morph}\t{gloss}\n")
             out_f.write("\n")
+            n_sentences += 1
+    return n_sentences
+
+def _convert_pair(task):
+    eaf_path, output_path, tiers, strict = task
+    return eaf_path, convert_eaf_to_crf(eaf_path, output_path, *tiers, strict=strict)
+
+def convert_directory(input_dir, output_dir, n_jobs=None, transcription_tier='transcription',
+                      morph_tier='morphemes', gloss_tier='gloss', extension='.txt', strict=True):
+    '''Convert all the .eaf files of a directory (one output file each) across a process pool.'''
+    os.makedirs(output_dir, exist_ok=True)
+    tiers = (transcription_tier, morph_tier, gloss_tier)
+    tasks = [(os.path.join(input_dir, name), os.path.join(output_dir, os.path.splitext(name)[0] + extension), tiers, strict)
+             for name in sorted(os.listdir(input_dir)) if name.lower().endswith('.eaf')]
+    return dict(utils.map_files(_convert_pair, tasks, n_jobs=n_jobs))
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('eaf_file', help='Path to input EAF file')
-    parser.add_argument('output_file', help='Path to output CRF format file')
+    parser.add_argument('eaf_file', help='Path to input EAF file (or directory of EAF files)')
+    parser.add_argument('output_file', help='Path to output CRF format file (or output directory)')
+    parser.add_argument('--transcription-tier', default='transcription')
+    parser.add_argument('--morph-tier', default='morphemes')
+    parser.add_argument('--gloss-tier', default='gloss')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of files converted in parallel (directory)')
+    parser.add_argument('--touching', action='store_true',
+                        help='Include the annotations which only touch a transcription annotation (as pympi)')
     args = parser.parse_args()
-    
-    convert_eaf_to_crf(args.eaf_file, args.output_file)
+
+    tiers = dict(transcription_tier=args.transcription_tier, morph_tier=args.morph_tier, gloss_tier=args.gloss_tier,
+                 strict=not args.touching)
+    if os.path.isdir(args.eaf_file):
+        converted = convert_directory(args.eaf_file, args.output_file, n_jobs=args.jobs, **tiers)
+        print(f'{len(converted)} files converted ({sum(converted.values())} sentences).')
+    else:
+        convert_eaf_to_crf(args.eaf_file, args.output_file, **tiers)
@@ -1,27 +1,106 @@
 # Convert pipeline output (predictions) into an ELAN .eaf file
-import pympi
+# Streaming: the EAF file is written one sentence at a time (the annotations of
+# each tier go to a temporary file until the time slots are known), so large
+# outputs are converted in bounded memory, and several files can be converted at once.
+from xml.sax.saxutils import escape, quoteattr
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
 
-eaf = pympi.Elan.Eaf()
-eaf.add_tier('tokens')
-eaf.add_tier('gloss')
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # To import crf_glossing
 
-with open("pipeline_output.txt", "r", encoding="utf-8") as f:
+import crf_glossing.utils as utils
+
+EAF_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<ANNOTATION_DOCUMENT AUTHOR="" DATE="{date}" FORMAT="3.0" VERSION="3.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://www.mpi.nl/tools/elan/EAFv3.0.xsd">
+    <HEADER MEDIA_FILE="" TIME_UNITS="milliseconds"/>
+'''
+EAF_FOOTER = '''    <LINGUISTIC_TYPE GRAPHIC_REFERENCES="false" LINGUISTIC_TYPE_ID="default-lt" TIME_ALIGNABLE="true"/>
+</ANNOTATION_DOCUMENT>
+'''
+ANNOTATION = '''        <ANNOTATION>
+            <ALIGNABLE_ANNOTATION ANNOTATION_ID="a{id}" TIME_SLOT_REF1="ts{start}" TIME_SLOT_REF2="ts{end}">
+                <ANNOTATION_VALUE>{value}</ANNOTATION_VALUE>
+            </ALIGNABLE_ANNOTATION>
+        </ANNOTATION>
+'''
+
+
+def iter_pipeline_blocks(lines):
+    '''Sentences (lists of (token, gloss) pairs) of a pipeline output file.'''
     block = []
-    time = 0
-    step = 1000
-    for line in f:
+    for line in lines:
         if line.strip() == "":
             if block:
-                start, end = time, time + step
-                tokens = [w for w, _ in block]
-                glosses = [g for _, g in block]
-                eaf.add_annotation('tokens', start, end, '\t'.join(tokens))
-                eaf.add_annotation('gloss', start, end, '\t'.join(glosses))
+                yield block
                 block = []
-                time += step
         else:
             w, g = line.strip().split('\t')
             block.append((w, g))
+    if block:
+        yield block
+
+def write_eaf(blocks, output_path, step=1000, tiers=('tokens', 'gloss')):
+    '''Write the sentences (lists of (token, gloss) pairs) to an EAF file, one annotation per sentence
+    and tier, each sentence lasting step milliseconds. Returns the number of sentences.'''
+    tier_files = [tempfile.TemporaryFile('w+', encoding='utf-8') for _ in tiers]
+    try:
+        n_sentences = 0
+        for block in blocks:
+            for t, tier_file in enumerate(tier_files):
+                value = '\t'.join(pair[t] for pair in block)
+                tier_file.write(ANNOTATION.format(id=n_sentences * len(tiers) + t + 1, start=n_sentences + 1,
+                                                  end=n_sentences + 2, value=escape(value)))
+            n_sentences += 1
+
+        with open(output_path, "w", encoding="utf-8") as out:
+            out.write(EAF_HEADER.format(date=time.strftime('%Y-%m-%dT%H:%M:%S%z')))
+            out.write('    <TIME_ORDER>\n')
+            for i in range(n_sentences + 1 if n_sentences else 0):
+                out.write(f'        <TIME_SLOT TIME_SLOT_ID="ts{i + 1}" TIME_VALUE="{i * step}"/>\n')
+            out.write('    </TIME_ORDER>\n')
+            for tier, tier_file in zip(tiers, tier_files):
+                out.write(f'    <TIER LINGUISTIC_TYPE_REF="default-lt" TIER_ID={quoteattr(tier)}>\n')
+                tier_file.seek(0)
+                shutil.copyfileobj(tier_file, out)
+                out.write('    </TIER>\n')
+            out.write(EAF_FOOTER)
+    finally:
+        for tier_file in tier_files:
+            tier_file.close()
+    return n_sentences
+
+def convert_pipeline_file(input_path, output_path, step=1000):
+    '''Convert a pipeline output file to an EAF file; returns the number of sentences.'''
+    with open(input_path, "r", encoding="utf-8") as f:
+        return write_eaf(iter_pipeline_blocks(f), output_path, step=step)
+
+def _convert_pair(task):
+    input_path, output_path, step = task
+    return input_path, convert_pipeline_file(input_path, output_path, step=step)
+
+def convert_files(input_paths, output_dir, n_jobs=None, step=1000):
+    '''Convert several pipeline output files (one .eaf file each in output_dir) across a process pool.'''
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + '.eaf'), step)
+             for path in input_paths]
+    return dict(utils.map_files(_convert_pair, tasks, n_jobs=n_jobs))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', nargs='*', default=['pipeline_output.txt'], help='Pipeline output file(s)')
+    parser.add_argument('-o', '--output', default='predicted.eaf',
+                        help='Output .eaf file (one input) or output directory (several inputs, or existing directory)')
+    parser.add_argument('--step', type=int, default=1000, help='Duration of each sentence (milliseconds)')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of files converted in parallel')
+    args = parser.parse_args()
 
-eaf.to_file("predicted.eaf")
-print("ELAN file saved: predicted.eaf")
+    if len(args.input) == 1 and not os.path.isdir(args.output):
+        convert_pipeline_file(args.input[0], args.output, step=args.step)
+        print(f"ELAN file saved: {args.output}")
+    else:
+        converted = convert_files(args.input, args.output, n_jobs=args.jobs, step=args.step)
+        print(f'{len(converted)} ELAN files saved in {args.output} ({sum(converted.values())} sentences).')
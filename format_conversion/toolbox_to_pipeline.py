@@ -1,21 +1,64 @@
 # Convert \t, \m, \g lines into SIGMORPHON format
-import re
-
-with open("toolbox_input.txt", "r", encoding="utf-8") as f:
-    content = f.read()
-
-blocks = re.split(r'\n(?=\\t)', content.strip())
-
-with open("pipeline_input.txt", "w", encoding="utf-8") as out:
-    for block in blocks:
-        lines = block.strip().split("\n")
-        m_line = next((l[3:].strip() for l in lines if l.startswith("\\m")), "")
-        g_line = next((l[3:].strip() for l in lines if l.startswith("\\g")), "")
-        tokens = m_line.split()
-        glosses = g_line.split()
-        if len(tokens) != len(glosses):
-            print("Warning: token/gloss mismatch, skipping block.")
-            continue
-        for tok, gloss in zip(tokens, glosses):
-            out.write(f"{tok}\t{gloss}\n")
-        out.write("\n")
+# Streaming: the Toolbox file is read one record at a time, so large archives
+# are converted in bounded memory, and several files can be converted at once.
+import argparse
+import os
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # To import crf_glossing
+
+import crf_glossing.utils as utils
+from crf_glossing.readers import iter_toolbox_records # Shared with ToolboxReader
+
+
+def record_to_pairs(record):
+    '''(token, gloss) pairs of the \\m and \\g lines of a record; None if their lengths do not match.'''
+    m_line = next((l[3:].strip() for l in record if l.startswith("\\m")), "")
+    g_line = next((l[3:].strip() for l in record if l.startswith("\\g")), "")
+    tokens = m_line.split()
+    glosses = g_line.split()
+    if len(tokens) != len(glosses):
+        return None
+    return list(zip(tokens, glosses))
+
+def convert_toolbox_file(input_path, output_path):
+    '''Convert a Toolbox file to the pipeline format; returns the numbers of converted and skipped records.'''
+    n_converted, n_skipped = 0, 0
+    with open(input_path, "r", encoding="utf-8") as f, open(output_path, "w", encoding="utf-8") as out:
+        for record in iter_toolbox_records(f):
+            pairs = record_to_pairs(record)
+            if pairs is None:
+                print(f"Warning: token/gloss mismatch, skipping block ({input_path}, record {n_converted + n_skipped + 1}).")
+                n_skipped += 1
+                continue
+            for tok, gloss in pairs:
+                out.write(f"{tok}\t{gloss}\n")
+            out.write("\n")
+            n_converted += 1
+    return n_converted, n_skipped
+
+def _convert_pair(paths):
+    return paths[0], convert_toolbox_file(*paths)
+
+def convert_files(input_paths, output_dir, n_jobs=None, extension='.txt'):
+    '''Convert several Toolbox files (one output file each in output_dir) across a process pool.'''
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + extension))
+             for path in input_paths]
+    return dict(utils.map_files(_convert_pair, tasks, n_jobs=n_jobs))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', nargs='*', default=['toolbox_input.txt'], help='Toolbox file(s)')
+    parser.add_argument('-o', '--output', default='pipeline_input.txt',
+                        help='Output file (one input) or output directory (several inputs, or existing directory)')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of files converted in parallel')
+    args = parser.parse_args()
+
+    if len(args.input) == 1 and not os.path.isdir(args.output):
+        n_converted, n_skipped = convert_toolbox_file(args.input[0], args.output)
+        print(f'{n_converted} records converted, {n_skipped} skipped.')
+    else:
+        converted = convert_files(args.input, args.output, n_jobs=args.jobs)
+        print(f'{len(converted)} files converted ({sum(n for n, _ in converted.values())} records, '
+              f'{sum(n for _, n in converted.values())} skipped).')
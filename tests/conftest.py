@@ -0,0 +1,38 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import crf_glossing.process_file as cgpf
+from crf_glossing.model import GlossingModel, MODEL_FILE
+
+TRAIN_FILE = os.path.join(ROOT, 'demonstration', 'git-train-track2-uncovered')
+TEST_FILE = os.path.join(ROOT, 'demonstration', 'git-test-track2-uncovered')
+
+
+def load_script(name):
+    '''Import a script of format_conversion (a folder of scripts, not a package).'''
+    scripts = os.path.join(ROOT, 'format_conversion')
+    if scripts not in sys.path:
+        sys.path.append(scripts) # Importable by name, so that the worker processes can unpickle its functions
+    return importlib.import_module(name)
+
+@pytest.fixture(scope='session')
+def train_sentences():
+    return list(cgpf.IGT_Stream(TRAIN_FILE))
+
+@pytest.fixture(scope='session')
+def test_sentences():
+    return list(cgpf.IGT_Stream(TEST_FILE, test=True))
+
+@pytest.fixture(scope='session')
+def model(train_sentences, tmp_path_factory):
+    '''Model trained on the demonstration data (few iterations, to keep the tests fast).'''
+    directory = tmp_path_factory.mktemp('model')
+    model = GlossingModel.train(train_sentences, str(directory / MODEL_FILE), n_jobs=1, max_iterations=30)
+    model.save(str(directory))
+    return model
@@ -0,0 +1,47 @@
+import pytest
+
+from crf_glossing.batching import batched_predict, length_batches, windows
+
+
+@pytest.mark.parametrize('length, max_length, overlap', [(1, 4, 2), (10, None, 16), (10, 10, 4), (11, 10, 4),
+                                                         (37, 8, 0), (37, 8, 3), (37, 8, 7), (100, 12, 8)])
+def test_windows_tile_the_sentence(length, max_length, overlap):
+    sentence_windows = windows(length, max_length, overlap)
+    assert sentence_windows[0][2] == 0 and sentence_windows[-1][3] == length
+    for (start, end, keep_start, keep_end), following in zip(sentence_windows, sentence_windows[1:] + [None]):
+        assert start <= keep_start < keep_end <= end
+        if max_length is not None:
+            assert end - start <= max_length
+        if following is not None:
+            assert following[2] == keep_end # Contiguous kept ranges
+
+def test_windows_overlap_too_large():
+    with pytest.raises(AssertionError):
+        windows(20, max_length=8, overlap=8)
+
+def test_length_batches():
+    segments = [(i, 0, length) for i, length in enumerate([5, 1, 3, 8, 2])]
+    batches = list(length_batches(segments, batch_size=2))
+    assert [[i for i, _, _ in batch] for batch in batches] == [[1, 4], [2, 0], [3]]
+
+def test_batched_predict_identity():
+    '''Each position keeps its own label, in order, whatever the windows and batches.'''
+    sequences = [[f'{i}:{t}' for t in range(length)] for i, length in enumerate([0, 1, 7, 30, 13, 64, 2])]
+    predict = lambda batch: [list(sequence) for sequence in batch]
+    for max_length, overlap in [(None, 16), (8, 4), (12, 8), (5, 0)]:
+        assert batched_predict(predict, sequences, max_length=max_length, overlap=overlap, batch_size=3) == sequences
+
+def test_batched_predict_aligned():
+    sequences = [list(range(length)) for length in (3, 20, 9)]
+    aligned = [[-position for position in sequence] for sequence in sequences]
+    predict = lambda batch, batch_aligned: [[x + y for x, y in zip(sequence, other)]
+                                            for sequence, other in zip(batch, batch_aligned)]
+    assert batched_predict(predict, sequences, max_length=6, overlap=2, aligned=aligned) == \
+        [[0] * len(sequence) for sequence in sequences]
+
+def test_batched_predict_matches_whole_sentences(model, test_sentences):
+    X_test = model.featurize(test_sentences)
+    assert max(len(features) for features in X_test) > 12 # Some sentences are split
+    y_pred = model.predict(X_test)
+    assert batched_predict(model.predict, X_test, batch_size=5) == y_pred
+    assert batched_predict(model.predict, X_test, max_length=12, overlap=8, batch_size=5) == y_pred
@@ -0,0 +1,106 @@
+import os
+import shutil
+
+import pycrfsuite
+import pytest
+
+import crf_glossing.cli as cli
+import crf_glossing.process_file as cgpf
+from crf_glossing.artifacts import ArtifactCache, artifact_key
+from conftest import TEST_FILE, TRAIN_FILE
+
+
+def cached_files(cache_dir, kind):
+    directory = os.path.join(cache_dir, kind)
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+def test_artifact_keys(tmp_path):
+    assert artifact_key('model', features='a', crf_params={'c1': 0.1}) == \
+        artifact_key('model', crf_params={'c1': 0.1}, features='a')
+    assert artifact_key('model', features='a', crf_params={'c1': 0.1}) != \
+        artifact_key('model', features='a', crf_params={'c1': 0.2})
+    assert artifact_key('model', features='a') != artifact_key('features', features='a')
+
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    edited_file = tmp_path / 'train.txt'
+    shutil.copyfile(TRAIN_FILE, edited_file)
+    _, key = cache.corpus(str(edited_file))
+    assert cache.corpus(str(edited_file))[1] == key
+    assert cache.corpus(str(edited_file), lower=False)[1] != key # Other options
+    with open(edited_file, 'a', encoding='utf-8') as out_file: # Other content
+        out_file.write('\n\\t x\n\\m x\n\\g X\n\\l x\n')
+    assert cache.corpus(str(edited_file))[1] != key
+
+def test_failed_builds_leave_no_artifact(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+
+    def failing_build(*args):
+        raise RuntimeError('Interrupted')
+
+    with pytest.raises(RuntimeError):
+        cache.pickled('features', 'key', failing_build)
+    with pytest.raises(Exception): # A lambda cannot be pickled: fails while writing
+        cache.pickled('features', 'key', lambda: [lambda: None])
+    assert cached_files(cache.root, 'features') == []
+
+    def partial_build(directory):
+        with open(os.path.join(directory, 'model.crfsuite'), 'w') as out_file:
+            out_file.write('partial')
+        raise RuntimeError('Interrupted')
+
+    with pytest.raises(RuntimeError):
+        cache.directory('model', 'key', partial_build)
+    assert cached_files(cache.root, 'model') == []
+    assert cache.pickled('features', 'key', lambda: [1, 2]) == [1, 2]
+    assert cache.pickled('features', 'key', failing_build) == [1, 2] # Cached
+    assert cached_files(cache.root, 'features') == ['key.pkl']
+
+def test_predict_reuses_upstream_artifacts(tmp_path, capsys, test_sentences):
+    cache_dir = str(tmp_path / 'cache')
+    options = ['--cache-dir', cache_dir, '--jobs', '1']
+    training = ['--train', TRAIN_FILE, '--max-iterations', '5']
+    output = str(tmp_path / 'prediction.txt')
+    cli.main(options + ['predict', '--test', TEST_FILE, '--output', output] + training)
+    assert capsys.readouterr().err.count('Training the CRF') == 1
+    with open(output, 'r', encoding='utf-8') as in_file:
+        assert len(list(cgpf.iter_blocks(in_file))) == len(test_sentences)
+    models, features = cached_files(cache_dir, 'model'), cached_files(cache_dir, 'features')
+
+    other_test = str(tmp_path / 'test.txt')
+    with open(TEST_FILE, 'r', encoding='utf-8') as in_file:
+        blocks = list(cgpf.iter_blocks(in_file))
+    with open(other_test, 'w', encoding='utf-8') as out_file:
+        out_file.write('\n\n'.join(blocks[:5]) + '\n')
+    cli.main(options + ['predict', '--test', other_test, '--output', output] + training)
+    assert 'Training the CRF' not in capsys.readouterr().err # Only the test file changed
+    assert cached_files(cache_dir, 'model') == models
+    assert len(cached_files(cache_dir, 'features')) == len(features) + 1
+
+    cli.main(options + ['train', '--c1', '0.2'] + training) # New model, same training features
+    assert capsys.readouterr().err.count('Training the CRF') == 1
+    assert len(cached_files(cache_dir, 'model')) == len(models) + 1
+    assert len(cached_files(cache_dir, 'features')) == len(features) + 1
+
+def test_evaluate(tmp_path, capsys):
+    report_path = str(tmp_path / 'report.json')
+    cli.main(['--cache-dir', str(tmp_path / 'cache'), 'evaluate', '--pred', TEST_FILE, TEST_FILE,
+              '--gold', TEST_FILE, '--output', report_path])
+    assert os.path.exists(report_path)
+    assert '"accuracy": 1.0' in capsys.readouterr().out
+
+def test_pruned_model_key(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    full = cli.train_model(cache, TRAIN_FILE, n_jobs=1, max_iterations=5)
+    pruned = cli.train_model(cache, TRAIN_FILE, n_jobs=1, min_attribute_freq=2, max_iterations=5)
+    assert os.path.dirname(pruned.model_path) != os.path.dirname(full.model_path)
+    assert len(cached_files(cache.root, 'model')) == 2
+    assert len(cached_files(cache.root, 'features')) == 1 # The pruning reuses the cached features
+    assert cli.train_model(cache, TRAIN_FILE, n_jobs=1, min_attribute_freq=2, max_iterations=5).model_path == \
+        pruned.model_path
+
+    def n_attributes(model):
+        tagger = pycrfsuite.Tagger()
+        tagger.open(model.model_path)
+        return len(tagger.info().attributes)
+
+    assert n_attributes(pruned) < n_attributes(full)
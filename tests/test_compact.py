@@ -0,0 +1,22 @@
+import crf_glossing.majority_label as ml
+from crf_glossing.compact import Compact_IGT_Corpus
+
+
+def test_compact_corpus_matches_sentences(train_sentences, test_sentences):
+    for sentences, test in ((train_sentences, False), (test_sentences, True)):
+        corpus = Compact_IGT_Corpus(sentences, test=test)
+        assert len(corpus) == len(sentences)
+        for stem in (True, False):
+            assert corpus.convert_to_crf_format(stem=stem) == [sentence.to_crf_format(stem=stem)
+                                                               for sentence in sentences]
+        for compact_sentence, sentence in zip(corpus, sentences):
+            assert compact_sentence.split_source == sentence.split_source
+            assert compact_sentence.split_translation == sentence.split_translation
+
+def test_compact_majority_label(model, test_sentences):
+    corpus = Compact_IGT_Corpus(test_sentences, test=True)
+    y_pred = model.predict(model.featurize(test_sentences))
+    assert ml.apply_majority_label(y_pred, model.majority_dictionary, corpus) == \
+        ml.apply_majority_label(y_pred, model.majority_dictionary, test_sentences)
+    assert ml.apply_majority_label(y_pred, model.majority_dictionary, corpus, backoff=model.backoff_lexicon()) == \
+        ml.apply_majority_label(y_pred, model.majority_dictionary, test_sentences, backoff=model.backoff_lexicon())
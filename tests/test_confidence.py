@@ -0,0 +1,52 @@
+import numpy as np
+import pycrfsuite
+import pytest
+
+import crf_glossing.majority_label as ml
+from crf_glossing.compact import Compact_IGT_Corpus
+from crf_glossing.confidence import LabelScores, top_k_marginals
+from crf_glossing.viterbi import ViterbiDecoder
+
+
+@pytest.fixture(scope='module')
+def decoder(model):
+    return ViterbiDecoder.from_model(model.model_path)
+
+def tagger_marginals(model, X):
+    '''Marginal probability of every label at each position, computed by crfsuite.'''
+    tagger = pycrfsuite.Tagger()
+    tagger.open(model.model_path)
+    labels = tagger.labels()
+    sentence_marginals = []
+    for features in X:
+        tagger.set(features)
+        sentence_marginals.append([{label: tagger.marginal(label, t) for label in labels}
+                                   for t in range(len(features))])
+    tagger.close()
+    return sentence_marginals
+
+def test_top_k_marginals_match_crfsuite(model, decoder, test_sentences):
+    '''Within 1e-5: the probabilities are stored as float32.'''
+    X = model.featurize(test_sentences)
+    expected = tagger_marginals(model, X)
+    for scores in (top_k_marginals(decoder, X=X, k=3),
+                   top_k_marginals(decoder, [list(sentence.split_source) for sentence in test_sentences], k=3)):
+        assert len(scores) == len(X)
+        for i, sentence_marginals in enumerate(expected):
+            for position, expected_marginals in zip(scores.sentence_labels(i), sentence_marginals):
+                top = sorted(expected_marginals.values(), reverse=True)[:3]
+                assert [probability for _, probability in position] == pytest.approx(top, abs=1e-5)
+                for label, probability in position:
+                    assert probability == pytest.approx(expected_marginals[label], abs=1e-5)
+
+def test_label_scores(model, decoder, test_sentences, tmp_path):
+    scores = top_k_marginals(decoder, [list(sentence.split_source) for sentence in test_sentences], k=2)
+    path = str(tmp_path / 'scores.npz')
+    scores.save(path)
+    loaded = LabelScores.load(path)
+    assert loaded.sentence_labels(0) == scores.sentence_labels(0)
+
+    relabelled = scores.apply_majority_label(model.majority_dictionary, test_sentences)
+    assert relabelled.best() == ml.apply_majority_label(scores.best(), model.majority_dictionary, test_sentences)
+    compact = scores.apply_majority_label(model.majority_dictionary, Compact_IGT_Corpus(test_sentences, test=True))
+    assert np.array_equal(compact.label_ids, relabelled.label_ids) and compact.labels == relabelled.labels
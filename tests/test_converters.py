@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+from conftest import load_script
+
+Eaf = pytest.importorskip('pympi.Elan').Eaf
+
+TOOLBOX = '''\\_sh v3.0  Text
+
+\\t Nakwhl hlidaa.
+\\m 'nakw -hl hli- daa
+\\g long -CN PART- SPT
+\\l A long time ago.
+
+\\t Ii na.
+\\m ii n
+\\g CCNJ
+\\l Mismatch.
+
+\\t Ii hahla'lsdi'y.
+\\m ii hahla'lst
+\\m -'y
+\\g CCNJ work -1SG.II
+'''
+
+
+def regex_toolbox_to_pipeline(content):
+    '''Output of the original (whole-file, regex-based) toolbox_to_pipeline.py.'''
+    output = []
+    for block in re.split(r'\n(?=\\t)', content.strip()):
+        lines = block.strip().split('\n')
+        m_line = next((l[3:].strip() for l in lines if l.startswith('\\m')), '')
+        g_line = next((l[3:].strip() for l in lines if l.startswith('\\g')), '')
+        tokens, glosses = m_line.split(), g_line.split()
+        if len(tokens) != len(glosses):
+            continue
+        output.extend(f'{token}\t{gloss}\n' for token, gloss in zip(tokens, glosses))
+        output.append('\n')
+    return ''.join(output)
+
+def test_toolbox_to_pipeline(tmp_path):
+    toolbox_to_pipeline = load_script('toolbox_to_pipeline')
+    contents = [TOOLBOX, TOOLBOX.replace('\\m -\'y\n', '').replace(' -1SG.II', '') + '\n\n',
+                TOOLBOX.replace('\n', '\r\n')]
+    paths = []
+    for i, content in enumerate(contents):
+        paths.append(tmp_path / f'toolbox{i}.txt')
+        paths[-1].write_bytes(content.encode('utf-8'))
+    for path in paths:
+        output_path = tmp_path / 'output.txt'
+        toolbox_to_pipeline.convert_toolbox_file(str(path), str(output_path))
+        content = path.read_bytes().decode('utf-8').replace('\r\n', '\n')
+        assert output_path.read_text(encoding='utf-8') == regex_toolbox_to_pipeline(content)
+
+    converted = toolbox_to_pipeline.convert_files([str(path) for path in paths], str(tmp_path / 'out'), n_jobs=2)
+    assert list(converted) == [str(path) for path in paths] # In order
+    assert converted[str(paths[0])] == (2, 2) # Header and first record; two mismatches (only the first \m line is read)
+
+def test_pipeline_to_elan(tmp_path):
+    pipeline_to_elan = load_script('pipeline_to_elan')
+    input_path = tmp_path / 'predictions.txt'
+    input_path.write_text('ni-\tPROG-\nyukw\twalk & run\n\nhla\tnow\n\n\nii\tCCNJ\nn\t1.I', encoding='utf-8') # No final blank line
+    output_path = str(tmp_path / 'predictions.eaf')
+    assert pipeline_to_elan.convert_pipeline_file(str(input_path), output_path, step=500) == 3
+
+    eaf = Eaf(output_path)
+    assert set(eaf.get_tier_names()) == {'tokens', 'gloss'}
+    assert sorted(eaf.get_annotation_data_for_tier('tokens')) == \
+        [(0, 500, 'ni-\tyukw'), (500, 1000, 'hla'), (1000, 1500, 'ii\tn')]
+    assert sorted(eaf.get_annotation_data_for_tier('gloss')) == \
+        [(0, 500, 'PROG-\twalk & run'), (500, 1000, 'now'), (1000, 1500, 'CCNJ\t1.I')]
+
+    empty_path = tmp_path / 'empty.txt'
+    empty_path.write_text('', encoding='utf-8')
+    converted = pipeline_to_elan.convert_files([str(input_path), str(empty_path)], str(tmp_path / 'out'), n_jobs=2)
+    assert converted == {str(input_path): 3, str(empty_path): 0}
+    assert Eaf(str(tmp_path / 'out' / 'empty.eaf')).get_annotation_data_for_tier('tokens') == []
+
+def test_elan_to_crf_directory(tmp_path):
+    elan_to_crf = load_script('elan_to_crf')
+    input_dir = tmp_path / 'eaf'
+    input_dir.mkdir()
+    for name, n_sent in (('a', 1), ('b', 2)):
+        eaf = Eaf()
+        for tier in ('transcription', 'morphemes', 'gloss'):
+            eaf.add_tier(tier)
+        for i in range(n_sent):
+            eaf.add_annotation('transcription', 1000 * i, 1000 * (i + 1), f'{name}{i}')
+            eaf.add_annotation('morphemes', 1000 * i, 1000 * (i + 1), f'{name}{i}')
+            eaf.add_annotation('gloss', 1000 * i, 1000 * (i + 1), f'G{i}')
+        eaf.to_file(str(input_dir / f'{name}.eaf'))
+    converted = elan_to_crf.convert_directory(str(input_dir), str(tmp_path / 'out'), n_jobs=2)
+    assert converted == {str(input_dir / 'a.eaf'): 1, str(input_dir / 'b.eaf'): 2}
+    assert (tmp_path / 'out' / 'b.txt').read_text(encoding='utf-8') == 'b0\tG0\n\nb1\tG1\n\n'
@@ -0,0 +1,35 @@
+import os
+
+import crf_glossing.corpus_cache as corpus_cache
+from crf_glossing.compact import Compact_IGT_Corpus
+from conftest import TEST_FILE, TRAIN_FILE
+
+
+def test_save_load_round_trip(train_sentences, tmp_path):
+    corpus = Compact_IGT_Corpus(train_sentences)
+    path = str(tmp_path / 'train.igtc')
+    corpus_cache.save_corpus(corpus, path)
+    loaded = corpus_cache.load_corpus(path)
+    assert isinstance(loaded.morph_ids, memoryview) # Memory-mapped, not parsed again
+    assert not loaded.test and len(loaded) == len(corpus)
+    assert loaded.convert_to_crf_format() == corpus.convert_to_crf_format()
+    assert [sentence.split_translation for sentence in loaded] == [sentence.split_translation for sentence in corpus]
+    assert os.listdir(tmp_path) == ['train.igtc'] # No temporary file left
+
+def test_load_or_parse(tmp_path, test_sentences):
+    cache_dir = str(tmp_path / 'cache')
+    corpus = corpus_cache.load_or_parse(TEST_FILE, cache_dir, test=True)
+    assert corpus.test
+    assert [sentence.split_source for sentence in corpus] == [sentence.split_source for sentence in test_sentences]
+    cache_files = os.listdir(cache_dir)
+    assert len(cache_files) == 1
+    cached_mtime = os.path.getmtime(os.path.join(cache_dir, cache_files[0]))
+
+    again = corpus_cache.load_or_parse(TEST_FILE, cache_dir, test=True) # Hit: not written again
+    assert os.listdir(cache_dir) == cache_files
+    assert os.path.getmtime(os.path.join(cache_dir, cache_files[0])) == cached_mtime
+    assert again.convert_to_crf_format() == corpus.convert_to_crf_format()
+
+    corpus_cache.load_or_parse(TEST_FILE, cache_dir, test=True, lower=False) # Other options: other key
+    corpus_cache.load_or_parse(TRAIN_FILE, cache_dir) # Other content: other key
+    assert len(os.listdir(cache_dir)) == 3
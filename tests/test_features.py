@@ -0,0 +1,73 @@
+import pytest
+
+import crf_glossing.features as cgfeat
+import crf_glossing.process_file as cgpf
+from crf_glossing.model import GlossingModel
+
+
+def test_empty_translation_has_no_features():
+    sentence = cgpf.Sentence('ap yukw-hl', '', '', test=True)
+    assert sentence.split_translation == ['']
+    assert cgfeat.translation_features(sentence.split_translation) == dict()
+    crf_sentence = sentence.to_crf_format()
+    assert cgfeat.sent2features(crf_sentence, translation=['']) == cgfeat.sent2features(crf_sentence)
+
+def test_hashed_features_bounded():
+    sentence = [('ap', 'stem'), ('yukw', 'stem'), ('-', '-'), ('hl', 'CN')]
+    hashed = cgfeat.sent2features(sentence, translation=['he', 'walks'], hash_size=16)
+    assert all(key.startswith('h') and int(key[1:]) < 16 for features in hashed for key in features)
+    # Stable across calls (and processes: crc32)
+    assert hashed == cgfeat.sent2features(sentence, translation=['he', 'walks'], hash_size=16)
+
+def test_translation_model_uses_translation(train_sentences, test_sentences, tmp_path):
+    model = GlossingModel.train(train_sentences, str(tmp_path / 'model.crfsuite'), n_jobs=1, max_iterations=10,
+                                translation=True, hash_size=4096)
+    pairs = [(sentence.source, sentence.raw_translation) for sentence in test_sentences]
+    assert model.gloss_batch(pairs) == model.gloss_batch(test_sentences)
+    with pytest.raises(ValueError):
+        model.gloss_batch([sentence.source for sentence in test_sentences])
+
+def test_prune_features():
+    X = [[{'morph': 'ap', 'bias': 1.0, 'is_stem': True, 'length': 2}, {'morph': 'yukw', 'bias': 1.0}],
+         [{'morph': 'ap', 'bias': 1.0, 'is_stem': False, 'length': 2}]]
+    pruned = cgfeat.prune_features(X, min_freq=2)
+    assert pruned == [[{'morph': 'ap', 'bias': 1.0, 'is_stem': True, 'length': 2}, {'bias': 1.0}],
+                      [{'morph': 'ap', 'bias': 1.0, 'is_stem': False, 'length': 2}]]
+    assert cgfeat.prune_features(X, min_freq=3) == [[{'bias': 1.0, 'is_stem': True, 'length': 2}, {'bias': 1.0}],
+                                                    [{'bias': 1.0, 'is_stem': False, 'length': 2}]]
+    assert cgfeat.prune_features(X, min_freq=1) is X
+    # Frequencies of other (training) features
+    assert cgfeat.prune_features(X, min_freq=2, frequencies=cgfeat.attribute_frequencies(X + X))[0][1] == \
+        {'morph': 'yukw', 'bias': 1.0}
+
+def test_cached_features_unchanged():
+    '''Features of the morpheme cache, frozen from the former (uncached) morph2features.'''
+    sentence = [('Ap', 'stem'), ('yukw', 'stem'), ('-', '-'), ('hl', 'CN'), ('2', 'stem')]
+    expected = [
+        {'bias': 1.0, 'morph.lower()': 'ap', 'morph.istitle()': True, 'morph.isdigit()': False,
+         'morph.length': 2, 'morph.is_boundary': False, 'BOS': True,
+         '+1:morph.lower()': 'yukw', '+1:morph.length': 4},
+        {'bias': 1.0, 'morph.lower()': 'yukw', 'morph.istitle()': False, 'morph.isdigit()': False,
+         'morph.length': 4, 'morph.is_boundary': False,
+         '-1:morph.lower()': 'ap', '-1:morph.length': 2, '-1:morph.is_boundary': False,
+         '+1:morph.lower()': '-', '+1:morph.length': 1},
+        {'bias': 1.0, 'morph.lower()': '-', 'morph.istitle()': False, 'morph.isdigit()': False,
+         'morph.length': 1, 'morph.is_boundary': True,
+         '-1:morph.lower()': 'yukw', '-1:morph.length': 4, '-1:morph.is_boundary': False,
+         '+1:morph.lower()': 'hl', '+1:morph.length': 2},
+        {'bias': 1.0, 'morph.lower()': 'hl', 'morph.istitle()': False, 'morph.isdigit()': False,
+         'morph.length': 2, 'morph.is_boundary': False,
+         '-1:morph.lower()': '-', '-1:morph.length': 1, '-1:morph.is_boundary': True,
+         '-2:morph.lower()': 'yukw', '-2:morph.length': 4,
+         '+1:morph.lower()': '2', '+1:morph.length': 1},
+        {'bias': 1.0, 'morph.lower()': '2', 'morph.istitle()': False, 'morph.isdigit()': True,
+         'morph.length': 1, 'morph.is_boundary': False,
+         '-1:morph.lower()': 'hl', '-1:morph.length': 2, '-1:morph.is_boundary': False, 'EOS': True},
+    ]
+    assert cgfeat.sent2features(sentence) == expected
+    assert [cgfeat.morph2features(sentence, i) for i in range(len(sentence))] == expected
+    cgfeat.sent2features(sentence)[0]['bias'] = 0.0 # The cached pieces are copied, not shared
+    assert cgfeat.sent2features(sentence) == expected
+    assert cgfeat.sent2features([('ap', 'stem')]) == [
+        {'bias': 1.0, 'morph.lower()': 'ap', 'morph.istitle()': False, 'morph.isdigit()': False,
+         'morph.length': 2, 'morph.is_boundary': False, 'BOS': True, 'EOS': True}]
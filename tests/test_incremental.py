@@ -0,0 +1,75 @@
+import os
+import re
+
+import pytest
+
+import crf_glossing.process_file as cgpf
+from crf_glossing.incremental import FeatureStore, IncrementalTrainer
+from crf_glossing.model import GlossingModel, MODEL_FILE
+from conftest import TRAIN_FILE
+
+
+@pytest.fixture(scope='module')
+def blocks():
+    with open(TRAIN_FILE, 'r', encoding='utf-8') as corpus_file:
+        return list(cgpf.iter_blocks(corpus_file))
+
+def edit(block):
+    '''Change the gloss of the first morpheme of a block.'''
+    return re.sub(r'^(\\g )[^- ]+', r'\1edited', block, flags=re.MULTILINE)
+
+def lines(blocks):
+    return '\n\n'.join(blocks).split('\n')
+
+def assert_same_model(model, blocks, tmp_path, test_sentences):
+    reference = GlossingModel.train(list(cgpf.IGT_Stream(lines(blocks))), str(tmp_path / 'reference.crfsuite'),
+                                    n_jobs=1, max_iterations=30)
+    assert model.majority_dictionary == reference.majority_dictionary
+    assert model.label_batch(test_sentences) == reference.label_batch(test_sentences)
+
+def test_feature_store(tmp_path):
+    store = FeatureStore(str(tmp_path / 'store.sqlite'))
+    store.add((f'key{i}', i, [str(i)], [{'bias': 1.0}] * i) for i in range(1200))
+    assert len(store) == 1200 and 'key3' in store and 'other' not in store
+    keys = ['key5', 'key1100', 'key5', 'key0'] * 200 # Several batches, repeated keys
+    assert list(store.column('units', keys)) == [int(key[3:]) for key in keys]
+    assert list(store.column('labels', [])) == []
+    store.delete(['key5'])
+    assert len(store) == 1199 and 'key5' not in store
+    store.close()
+
+def test_update_matches_full_training(blocks, tmp_path, test_sentences):
+    directory = str(tmp_path / 'incremental')
+    trainer = IncrementalTrainer(directory, n_jobs=1, max_iterations=30)
+    trainer.update(lines(blocks[:20]))
+
+    appended = blocks[:25] # New sentences after the previous corpus
+    model = trainer.append(lines(appended[20:]))
+    assert_same_model(model, appended, tmp_path, test_sentences)
+
+    edited = [edit(blocks[0])] + blocks[2:12] + blocks[25:] + blocks[12:24] # Edited, removed, and moved
+    model = IncrementalTrainer(directory, n_jobs=1, max_iterations=30).update(lines(edited))
+    assert_same_model(model, edited, tmp_path, test_sentences)
+
+def test_unchanged_corpus_not_retrained(blocks, tmp_path):
+    directory = str(tmp_path / 'incremental')
+    IncrementalTrainer(directory, n_jobs=1, max_iterations=5).update(lines(blocks[:10]))
+    model_path = os.path.join(directory, MODEL_FILE)
+    trained = os.stat(model_path).st_mtime_ns
+
+    trainer = IncrementalTrainer(directory, n_jobs=1, max_iterations=5)
+    trainer._train = lambda *args: pytest.fail('The CRF was retrained.')
+    trainer.update(lines(blocks[:10]))
+    assert os.stat(model_path).st_mtime_ns == trained
+
+    retrainer = IncrementalTrainer(directory, n_jobs=1, max_iterations=6) # Other parameters: retrained
+    retrainer.update(lines(blocks[:10]))
+    assert os.stat(model_path).st_mtime_ns != trained
+
+def test_reordered_ties(tmp_path):
+    '''Ties are broken by the order of the updated corpus, as by a full count.'''
+    first = '\\t x\n\\m x\n\\g P\n\\l first'
+    second = '\\t x\n\\m x\n\\g Q\n\\l second'
+    trainer = IncrementalTrainer(str(tmp_path / 'incremental'), n_jobs=1, max_iterations=5)
+    assert trainer.update(lines([first, second])).majority_dictionary == {'x': 'P'}
+    assert trainer.update(lines([second, first])).majority_dictionary == {'x': 'Q'}
@@ -0,0 +1,29 @@
+import pytest
+
+import crf_glossing.features as cgfeat
+import crf_glossing.instrument as instrument
+import crf_glossing.process_file as cgpf
+from conftest import TRAIN_FILE
+
+
+@pytest.fixture
+def instrumented():
+    instrument.reset()
+    instrument.enable()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+def test_worker_aggregates_merged(instrumented, train_sentences):
+    crf_corpus = [sentence.to_crf_format(stem=True) for sentence in train_sentences]
+    X = cgfeat.corpus2features(crf_corpus, n_jobs=2, chunksize=4, min_parallel=1)
+    stats = instrument.summary()
+    assert stats['sent2features']['calls'] == len(crf_corpus)
+    assert stats['sent2features']['items'] == sum(len(features) for features in X)
+    assert stats['corpus2features']['calls'] == 1
+
+def test_stream_parsing_timed(instrumented):
+    sentences = list(cgpf.IGT_Stream(TRAIN_FILE))
+    stats = instrument.summary()
+    assert stats['parse_stream']['calls'] == len(sentences)
+    assert stats['parse_stream']['aggregated']
@@ -0,0 +1,37 @@
+import os
+
+import crf_glossing.majority_label as ml
+from crf_glossing.lexicon import BackoffLexicon
+from crf_glossing.model import GlossingModel, COUNTS_FILE
+
+
+DICTIONARY = {'kata': 'house', 'kate': 'dog', 'hl': 'CN', '-': '-', 'yukw': 'walk', 'amxsiwaa': 'white.person'}
+
+
+def test_known_morpheme():
+    assert BackoffLexicon(DICTIONARY).get('yukw') == 'walk'
+
+def test_grammatical_glosses_not_indexed():
+    lexicon = BackoffLexicon(DICTIONARY)
+    assert 'hl' not in lexicon.glosses and '-' not in lexicon.glosses
+    assert lexicon.get('hlx') == 'UNK'
+
+def test_edit_distance_ties():
+    assert BackoffLexicon(DICTIONARY).get('katu') == 'house' # Alphabetical order
+    assert BackoffLexicon(DICTIONARY, frequencies={'kata': 1, 'kate': 5}).get('katu') == 'dog'
+
+def test_prefix_and_suffix():
+    lexicon = BackoffLexicon(DICTIONARY)
+    assert lexicon.get('amxsiwaadiit') == 'white.person'
+    assert lexicon.get('diitamxsiwaa') == 'white.person'
+    assert lexicon.get('zzzz', default='?') == '?'
+
+def test_model_backoff_uses_saved_frequencies(model, tmp_path, train_sentences, test_sentences):
+    model.save(str(tmp_path))
+    lexicon = ml.MajorityLexicon.from_corpus(train_sentences)
+    lexicon.save(os.path.join(str(tmp_path), COUNTS_FILE))
+    loaded = GlossingModel.load(str(tmp_path), backoff=True)
+    assert loaded.backoff.deletion_index.weights == {morph: lexicon.frequency(morph)
+                                                     for morph in loaded.backoff.glosses}
+    glosses = ' '.join(loaded.gloss_batch(test_sentences))
+    assert glosses.count('UNK') < ' '.join(model.gloss_batch(test_sentences)).count('UNK')
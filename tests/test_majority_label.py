@@ -0,0 +1,76 @@
+import random
+from collections import Counter
+
+import pytest
+
+import crf_glossing.majority_label as ml
+from crf_glossing.process_file import Units
+
+
+def reference_majority_dict(sentences):
+    '''Majority dictionary as counted by the original create_majority_dict.'''
+    counter = Counter((morph, gloss) for sentence in sentences
+                      for morph, gloss in zip(sentence.split_source, sentence.split_gloss))
+    majority_dict = dict()
+    for morph, labels in ml.reshape_counter(counter).items():
+        best, best_count = labels[0]
+        for label, count in labels[1:]:
+            if count > best_count:
+                best, best_count = label, count
+        majority_dict[morph] = best
+    return majority_dict
+
+def random_sentences(n_sent, seed):
+    '''Sentences of few morphemes and labels, so that most majority labels are ties.'''
+    generator = random.Random(seed)
+    return [Units([generator.choice('abc') for _ in range(4)], [generator.choice('XYZ') for _ in range(4)])
+            for _ in range(n_sent)]
+
+def fresh_counts(sentences):
+    counts = dict()
+    for sentence in sentences:
+        for morph, gloss in zip(sentence.split_source, sentence.split_gloss):
+            counts.setdefault(morph, Counter())[gloss] += 1
+    return counts
+
+def test_create_majority_dict(train_sentences):
+    assert ml.create_majority_dict(train_sentences) == reference_majority_dict(train_sentences)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_added_sentences_match_a_fresh_count(seed):
+    sentences = random_sentences(10, seed)
+    assert ml.MajorityLexicon.from_corpus(sentences).to_dict() == reference_majority_dict(sentences)
+    lexicon = ml.MajorityLexicon.from_corpus(sentences[:4])
+    for sentence in sentences[4:]:
+        lexicon.add_sentence(sentence)
+    assert lexicon.to_dict() == reference_majority_dict(sentences)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_removed_sentences(seed):
+    '''After removals, the counts are exact and the majority label is one of the most frequent.'''
+    sentences = random_sentences(10, seed)
+    lexicon = ml.MajorityLexicon.from_corpus(sentences)
+    removed = set(random.Random(seed).sample(range(10), 4))
+    for i in sorted(removed):
+        lexicon.remove_sentence(sentences[i])
+    remaining = [sentence for i, sentence in enumerate(sentences) if i not in removed]
+    counts = fresh_counts(remaining)
+    assert {morph: dict(labels) for morph, labels in lexicon.counts.items()} == \
+        {morph: dict(labels) for morph, labels in counts.items()}
+    expected = reference_majority_dict(remaining)
+    for morph, labels in counts.items():
+        best_count = max(labels.values())
+        assert labels[lexicon[morph]] == best_count
+        if list(labels.values()).count(best_count) == 1: # No tie: same label as a fresh count
+            assert lexicon[morph] == expected[morph]
+    assert ml.MajorityLexicon.from_corpus(remaining).to_dict() == expected
+
+def test_save_load(tmp_path):
+    lexicon = ml.MajorityLexicon.from_corpus(random_sentences(10, 0))
+    lexicon.save(str(tmp_path / 'counts.json'))
+    loaded = ml.MajorityLexicon.load(str(tmp_path / 'counts.json'))
+    assert loaded.counts == lexicon.counts and loaded.to_dict() == lexicon.to_dict()
+    for sentence in random_sentences(5, 1): # Same tie-breaking after reloading
+        lexicon.add_sentence(sentence)
+        loaded.add_sentence(sentence)
+    assert loaded.to_dict() == lexicon.to_dict()
@@ -0,0 +1,30 @@
+from crf_glossing.model import GlossingModel
+import crf_glossing.majority_label as ml
+
+
+def test_train_from_generator(train_sentences, tmp_path):
+    '''A one-shot iterator is read once: the majority dictionary is not empty.'''
+    model = GlossingModel.train((sentence for sentence in train_sentences), str(tmp_path / 'model.crfsuite'),
+                                n_jobs=1, max_iterations=5)
+    assert model.majority_dictionary == ml.create_majority_dict(train_sentences)
+    assert len(model.majority_dictionary) > 0
+
+def test_save_load(model, tmp_path, test_sentences):
+    model.save(str(tmp_path))
+    loaded = GlossingModel.load(str(tmp_path))
+    assert loaded.majority_dictionary == model.majority_dictionary
+    assert loaded.gloss_batch(test_sentences) == model.gloss_batch(test_sentences)
+
+def test_train_counts_the_corpus_once(train_sentences, tmp_path, monkeypatch):
+    '''The majority dictionary and the backoff frequencies come from the same count.'''
+    add_sentence = ml.MajorityLexicon.add_sentence
+    counted = []
+    monkeypatch.setattr(ml.MajorityLexicon, 'add_sentence',
+                        lambda self, sentence: counted.append(sentence) or add_sentence(self, sentence))
+    model = GlossingModel.train(train_sentences, str(tmp_path / 'model.crfsuite'), n_jobs=1, max_iterations=5,
+                                backoff=True)
+    assert len(counted) == len(train_sentences)
+    monkeypatch.undo()
+    lexicon = ml.MajorityLexicon.from_corpus(train_sentences)
+    assert model.majority_dictionary == lexicon.to_dict() == ml.create_majority_dict(train_sentences)
+    assert model.backoff.deletion_index.weights == {morph: lexicon.frequency(morph) for morph in model.backoff.glosses}
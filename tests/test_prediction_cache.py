@@ -0,0 +1,37 @@
+import os
+
+from crf_glossing.model import GlossingModel
+from crf_glossing.prediction_cache import PredictionCache
+
+
+def test_lru_eviction_and_counters():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', ['A'])
+    cache.put('b', ['B'])
+    assert cache.get('a') == ['A'] # 'b' becomes the least recently used
+    cache.put('c', ['C'])
+    assert cache.get('b') is None
+    assert cache.get('c') == ['C']
+    cache.record_hits(3)
+    assert cache.stats() == {'hits': 5, 'misses': 1, 'hit_rate': 5 / 6, 'evictions': 1,
+                             'entries': 2, 'max_entries': 2}
+    cache.clear()
+    assert len(cache) == 0 and cache.get('a') is None
+
+def test_cached_labels_are_copies():
+    cache = PredictionCache()
+    cache.put('a', ['A', 'B'])
+    cache.get('a').append('C')
+    assert cache.get('a') == ['A', 'B']
+
+def test_label_batch_with_cache(model, test_sentences):
+    cache = PredictionCache(max_entries=1000)
+    cached_model = GlossingModel.load(os.path.dirname(model.model_path), prediction_cache=cache)
+    batch = test_sentences + test_sentences[:5] # Repeated within the batch: tagged once
+    expected = model.label_batch(batch)
+    assert cached_model.label_batch(batch) == expected
+    assert cache.stats()['misses'] == len(test_sentences)
+    assert cache.stats()['hits'] == 5
+    assert cached_model.label_batch(batch) == expected # All from the cache
+    assert cache.stats()['hits'] == 5 + len(batch)
+    assert len(cache) == len({tuple(sentence.split_source) for sentence in test_sentences})
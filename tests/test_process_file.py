@@ -0,0 +1,39 @@
+import pytest
+
+import crf_glossing.majority_label as ml
+import crf_glossing.process_file as cgpf
+from conftest import TEST_FILE, TRAIN_FILE
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as in_file:
+        return in_file.read()
+
+
+@pytest.mark.parametrize('path, test', [(TRAIN_FILE, False), (TEST_FILE, True)])
+@pytest.mark.parametrize('options', [dict(), {'tilde': True, 'lower': False, 'equal': False}])
+def test_stream_matches_corpus(path, test, options):
+    corpus = cgpf.IGT_Corpus(read(path).strip(), test=test, **options)
+    for source in (path, read(path).splitlines(keepends=True), read(path).rstrip('\n').split('\n')):
+        sentences = list(cgpf.IGT_Stream(source, test=test, **options))
+        assert len(sentences) == corpus.n_sent
+        assert [vars(sentence) for sentence in sentences] == [vars(sentence) for sentence in corpus]
+    stream = cgpf.IGT_Stream(path, test=test, **options)
+    assert list(stream.convert_to_crf_format()) == corpus.convert_to_crf_format()
+    assert len(list(stream)) == corpus.n_sent # A path can be read several times
+
+def test_iter_majority_label(model):
+    corpus = cgpf.IGT_Corpus(read(TEST_FILE).strip(), test=True)
+    y_pred = model.predict(model.featurize(corpus.sentences))
+    expected = ml.apply_majority_label(y_pred, model.majority_dictionary, corpus)
+    stream = cgpf.IGT_Stream(TEST_FILE, test=True)
+    assert list(ml.iter_majority_label(iter(y_pred), model.majority_dictionary, stream)) == expected
+    assert ml.apply_majority_label(y_pred, model.majority_dictionary, stream) == expected
+    backoff = model.backoff_lexicon()
+    assert list(ml.iter_majority_label(y_pred, model.majority_dictionary, stream, backoff=backoff)) == \
+        ml.apply_majority_label(y_pred, model.majority_dictionary, corpus, backoff=backoff)
+
+    with pytest.raises(AssertionError): # More sentences than predictions
+        list(ml.iter_majority_label(y_pred[:-1], model.majority_dictionary, stream))
+    with pytest.raises(AssertionError): # More predictions than sentences
+        list(ml.iter_majority_label(y_pred + y_pred[:1], model.majority_dictionary, stream))
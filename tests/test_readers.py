@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import load_script
+from crf_glossing.readers import ElanReader, TierIndex, ToolboxReader
+
+Eaf = pytest.importorskip('pympi.Elan').Eaf
+
+
+@pytest.fixture
+def eaf_path(tmp_path):
+    '''Two sentences; the last morpheme of the first one ends where the second one starts.'''
+    eaf = Eaf()
+    for tier in ('transcription', 'morphemes', 'gloss', 'translation'):
+        eaf.add_tier(tier)
+    eaf.add_annotation('transcription', 0, 1000, 'niyukwhl')
+    eaf.add_annotation('transcription', 1000, 2000, 'hla')
+    for tier, values in (('morphemes', ['ni-', 'yukw', '-hl', 'hla']), ('gloss', ['PROG-', 'walk', '-CN', 'now'])):
+        for (start, end), value in zip([(0, 300), (300, 600), (600, 1000), (1000, 1500)], values):
+            eaf.add_annotation(tier, start, end, value)
+    eaf.add_annotation('translation', 0, 1000, 'He is walking.')
+    path = str(tmp_path / 'sample.eaf')
+    eaf.to_file(path)
+    return path
+
+def test_elan_reader(eaf_path):
+    sentences = list(ElanReader(eaf_path, translation_tier='translation'))
+    assert [(sentence.source, sentence.gloss) for sentence in sentences] == \
+        [('ni-yukw-hl', 'PROG-walk-CN'), ('hla', 'now')]
+    assert sentences[0].split_translation == ['he', 'is', 'walking']
+    test_sentences = list(ElanReader(eaf_path, test=True))
+    assert [sentence.source for sentence in test_sentences] == ['ni-yukw-hl', 'hla']
+
+def test_tier_index_semantics(eaf_path):
+    '''Strict overlap excludes the touching annotations; otherwise, same results as pympi.'''
+    eaf = Eaf(eaf_path)
+    index = TierIndex.from_tier(eaf, 'morphemes')
+    annotations = eaf.get_annotation_data_for_tier('morphemes')
+    for start, end in [(0, 1000), (1000, 2000), (250, 650), (600, 600), (1500, 2000)]:
+        assert index.overlapping(start, end, strict=False) == \
+            sorted(eaf.get_annotation_data_between_times('morphemes', start, end))
+        assert index.overlapping(start, end) == sorted(annotation for annotation in annotations
+                                                       if annotation[0] < end and annotation[1] > start)
+    assert [value for _, _, value in index.overlapping(1000, 2000)] == ['hla']
+    assert [value for _, _, value in index.overlapping(1000, 2000, strict=False)] == ['-hl', 'hla']
+
+def test_converter_matches_reader(eaf_path):
+    '''The converter and ElanReader give the same sentences (strict overlap by default).'''
+    elan_to_crf = load_script('elan_to_crf')
+    eaf = Eaf(eaf_path)
+    pairs = list(elan_to_crf.align_tiers(eaf))
+    assert pairs == [[('ni-', 'PROG-'), ('yukw', 'walk'), ('-hl', '-CN')], [('hla', 'now')]]
+    assert [''.join(morph for morph, _ in sentence) for sentence in pairs] == \
+        [sentence.source for sentence in ElanReader(eaf_path)]
+    touching = list(elan_to_crf.align_tiers(eaf, strict=False))
+    assert touching[1] == [('-hl', '-CN'), ('hla', 'now')]
+
+def test_toolbox_reader(capsys):
+    lines = ['\\_sh v3.0', '', '\\t niyukwhl', '\\m ni- yukw -hl', '\\g PROG- walk -CN', '\\l He is walking.', '',
+             '\\t hla', '\\m hla', '\\g now soon', '',
+             '\\t hla', '\\m hla', '\\g now']
+    sentences = list(ToolboxReader(lines))
+    assert [(sentence.source, sentence.gloss) for sentence in sentences] == [('ni-yukw-hl', 'PROG-walk-CN'), ('hla', 'now')]
+    assert sentences[0].split_translation == ['he', 'is', 'walking']
+    captured = capsys.readouterr()
+    assert captured.out == '' and 'skipping record 3' in captured.err # Warnings not mixed with the output
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+import pytest
+
+from crf_glossing.registry import ModelRegistry
+
+
+class CountingLoader:
+    '''Fake loader: the "model" is its directory name; counts (and slows down) the loads.'''
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.loads = []
+        self._lock = threading.Lock()
+
+    def __call__(self, directory):
+        time.sleep(self.seconds)
+        with self._lock:
+            self.loads.append(directory)
+        return directory
+
+def make_registry(languages='abcd', max_bytes=None, sizes=None, seconds=0.0):
+    sizes = sizes or dict()
+    return ModelRegistry({language: language for language in languages}, max_bytes=max_bytes,
+                         loader=CountingLoader(seconds), footprint=lambda model: sizes.get(model, 10))
+
+
+def test_lru_order():
+    registry = make_registry()
+    for language in 'abcab':
+        assert registry.get(language) == language
+    assert list(registry.resident) == ['c', 'a', 'b'] # Least recently used first
+    assert registry.loader.loads == ['a', 'b', 'c']
+
+def test_eviction_by_memory_budget():
+    registry = make_registry(max_bytes=25) # Two models of 10 bytes
+    for language in 'abac':
+        registry.get(language)
+    assert list(registry.resident) == ['a', 'c'] # b was the least recently used
+    assert registry.resident_bytes == 20
+    assert registry.stats()['evictions'] == 1
+    registry.get('b') # Reloaded
+    assert registry.loader.loads == ['a', 'b', 'c', 'b']
+    assert list(registry.resident) == ['c', 'b']
+
+def test_oversized_model_stays_resident():
+    registry = make_registry(max_bytes=25, sizes={'d': 100})
+    registry.get('a')
+    registry.get('d')
+    assert list(registry.resident) == ['d']
+    assert registry.resident_bytes == 100
+
+def test_stats():
+    registry = make_registry()
+    for language in 'aabca':
+        registry.get(language)
+    stats = registry.stats()
+    assert (stats['hits'], stats['misses']) == (2, 3)
+    assert stats['hit_rate'] == pytest.approx(0.4)
+    assert stats['resident'] == ['b', 'c', 'a']
+    with pytest.raises(KeyError):
+        registry.get('z')
+
+def test_concurrent_first_requests():
+    registry = make_registry(seconds=0.05)
+    barrier = threading.Barrier(8)
+    results = []
+    def request():
+        barrier.wait()
+        results.append(registry.get('a'))
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['a'] * 8
+    assert registry.loader.loads == ['a'] # Loaded once
+    stats = registry.stats()
+    assert (stats['hits'], stats['misses']) == (7, 1)
+
+def test_from_directory(model, test_sentences):
+    root = os.path.dirname(os.path.dirname(model.model_path))
+    registry = ModelRegistry.from_directory(root)
+    language = os.path.basename(os.path.dirname(model.model_path))
+    assert language in registry.languages()
+    sentences = [' '.join(sentence.source) for sentence in test_sentences[:3]]
+    assert registry.gloss_batch([(language, sentence) for sentence in sentences]) == model.gloss_batch(sentences)
@@ -0,0 +1,25 @@
+import asyncio
+
+from crf_glossing.server import MicroBatcher
+
+
+def gloss_function(sentences):
+    for sentence in sentences:
+        assert sentence != 'bad', 'Malformed sentence.'
+    return [sentence.upper() for sentence in sentences]
+
+def test_failing_request_does_not_fail_its_batch():
+    async def run():
+        batcher = MicroBatcher(gloss_function, max_batch_size=8, max_delay=0.05, n_workers=1)
+        batcher.start()
+        try:
+            return await asyncio.gather(*[batcher.submit(sentence) for sentence in ['ap', 'bad', 'yukw-hl']],
+                                        return_exceptions=True), batcher
+        finally:
+            await batcher.stop()
+
+    (good, bad, other), batcher = asyncio.run(run())
+    assert (good, other) == ('AP', 'YUKW-HL')
+    assert isinstance(bad, AssertionError)
+    assert batcher.metrics.n_errors == 1
+    assert list(batcher.metrics.batch_sizes) == [3]
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+import crf_glossing.simple_eval as simple_eval
+from crf_glossing.data import load_data_file
+from conftest import ROOT, TEST_FILE
+
+PREDICTION_FILE = os.path.join(ROOT, 'demonstration', 'prediction.txt')
+
+
+def batch_evaluation(pred, gold):
+    '''Metrics computed on the whole loaded files (the former evaluate_igt).'''
+    pred = load_data_file(pred)
+    gold = load_data_file(gold)
+    word_eval = simple_eval.eval_accuracy([line.gloss_list() for line in pred], [line.gloss_list() for line in gold])
+    morpheme_eval = simple_eval.eval_morpheme_glosses([line.gloss_list(segmented=True) for line in pred],
+                                                      [line.gloss_list(segmented=True) for line in gold])
+    return {'word_level': word_eval, 'morpheme_level': morpheme_eval['morpheme_level'],
+            'classes': morpheme_eval['classes']}
+
+@pytest.fixture
+def truncated_prediction(tmp_path):
+    '''Prediction file missing its last entries.'''
+    with open(PREDICTION_FILE, 'r', encoding='utf-8') as in_file:
+        blocks = in_file.read().strip().split('\n\n')
+    assert len(blocks) > 5
+    path = tmp_path / 'truncated.txt'
+    path.write_text('\n\n'.join(blocks[:-5]) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_streaming_evaluation():
+    assert simple_eval.evaluate_pair(PREDICTION_FILE, TEST_FILE) == batch_evaluation(PREDICTION_FILE, TEST_FILE)
+    assert simple_eval.evaluate_pair(TEST_FILE, TEST_FILE)['morpheme_level']['accuracy'] == 1
+
+def test_streaming_evaluation_of_a_shorter_prediction(truncated_prediction):
+    assert simple_eval.evaluate_pair(truncated_prediction, TEST_FILE) == \
+        batch_evaluation(truncated_prediction, TEST_FILE)
+
+def test_several_predictions_one_gold(truncated_prediction, tmp_path):
+    predictions = [PREDICTION_FILE, truncated_prediction, TEST_FILE]
+    report = simple_eval.evaluate_files([(pred, TEST_FILE) for pred in predictions], n_jobs=2)
+    assert [entry['pred'] for entry in report] == predictions
+    for entry in report:
+        assert entry['results'] == batch_evaluation(entry['pred'], TEST_FILE)
+
+    output = tmp_path / 'report.json'
+    arguments = [option for pred in predictions for option in ('--pred', pred)]
+    result = CliRunner().invoke(simple_eval.evaluate_igt,
+                                arguments + ['--gold', TEST_FILE, '--output', str(output), '--jobs', '1'])
+    assert result.exit_code == 0, result.output
+    assert json.loads(output.read_text(encoding='utf-8')) == report
+    result = CliRunner().invoke(simple_eval.evaluate_igt, arguments + ['--gold', TEST_FILE, '--gold', TEST_FILE])
+    assert result.exit_code != 0 # Neither one gold file nor one per prediction
@@ -0,0 +1,36 @@
+import pytest
+
+import crf_glossing.features as cgfeat
+import crf_glossing.majority_label as ml
+import crf_glossing.tuning as tuning
+
+
+@pytest.mark.parametrize('n_items, n_folds', [(31, 5), (10, 10), (7, 2)])
+def test_kfold_indices(n_items, n_folds):
+    folds = tuning.kfold_indices(n_items, n_folds, seed=3)
+    assert len(folds) == n_folds
+    assert sorted(i for fold in folds for i in fold) == list(range(n_items)) # Cover, no overlap
+    assert max(map(len, folds)) - min(map(len, folds)) <= 1
+    assert tuning.kfold_indices(n_items, n_folds, seed=3) == folds
+
+def test_parameter_grid():
+    assert tuning.parameter_grid({'c1': [0.1, 1.0], 'c2': 0.1}) == [{'c1': 0.1, 'c2': 0.1}, {'c1': 1.0, 'c2': 0.1}]
+    assert len(tuning.parameter_grid([{'c1': [0.1, 1.0]}, {'c2': [0.1]}])) == 3
+
+def test_parallel_cross_validation(train_sentences, tmp_path):
+    crf_sents = [sentence.to_crf_format(stem=True) for sentence in train_sentences]
+    X, y = cgfeat.corpus2features(crf_sents, n_jobs=1), [cgfeat.sent2labels(s) for s in crf_sents]
+    grid = tuning.parameter_grid({'c1': [0.01, 1.0], 'max_iterations': [5, 10]})
+    results = [tuning.cross_validate(X, y, train_sentences, grid, n_folds=3, n_jobs=n_jobs, seed=1)
+               for n_jobs in (1, 2)]
+    for serial, parallel in zip(*results):
+        assert serial['params'] == parallel['params']
+        assert serial['fold_results'] == parallel['fold_results']
+        assert serial['fold_scores'] == parallel['fold_scores']
+        assert serial['mean_score'] == parallel['mean_score']
+    assert tuning.best_configuration(results[0]) == tuning.best_configuration(results[1])
+
+    model, cv_results = tuning.tune(train_sentences, {'c1': [0.01, 1.0], 'max_iterations': [5]},
+                                    str(tmp_path / 'model.crfsuite'), n_folds=3, n_jobs=2, seed=1)
+    assert len(cv_results) == 2
+    assert model.majority_dictionary == ml.create_majority_dict(train_sentences)
@@ -0,0 +1,22 @@
+import crf_glossing.features as cgfeat
+import crf_glossing.utils as utils
+
+
+def square(x):
+    return x * x
+
+def test_parallel_map_keeps_order():
+    items = (i for i in range(2000)) # One-shot iterator, read by chunks
+    assert utils.parallel_map(square, items, n_jobs=2, chunksize=100, min_parallel=10, max_pending=3) == \
+        [i * i for i in range(2000)]
+
+def test_parallel_map_serial_iterator():
+    assert utils.parallel_map(square, iter(range(5)), n_jobs=2) == [0, 1, 4, 9, 16]
+    assert utils.parallel_map(square, [], n_jobs=2) == []
+
+def test_corpus2features_parallel(train_sentences):
+    crf_corpus = [sentence.to_crf_format(stem=True) for sentence in train_sentences]
+    serial = [cgfeat.sent2features(sentence) for sentence in crf_corpus]
+    assert cgfeat.corpus2features(crf_corpus, n_jobs=2, chunksize=4, min_parallel=1) == serial
+    assert cgfeat.corpus2features(iter(crf_corpus), n_jobs=2, chunksize=4, min_parallel=1, hash_size=64) == \
+        [cgfeat.sent2features(sentence, hash_size=64) for sentence in crf_corpus]
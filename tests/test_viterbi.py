@@ -0,0 +1,33 @@
+import pytest
+
+import crf_glossing.majority_label as ml
+from crf_glossing.viterbi import ViterbiDecoder, label_candidates
+
+
+@pytest.fixture(scope='module')
+def decoder(model):
+    return ViterbiDecoder.from_model(model.model_path)
+
+@pytest.fixture(scope='module')
+def X_test(model, test_sentences):
+    return model.featurize(test_sentences)
+
+def test_decode_matches_crfsuite(model, decoder, X_test):
+    assert decoder.decode(X_test) == model.predict(X_test)
+
+def test_decode_morphemes_matches_crfsuite(model, decoder, X_test, test_sentences):
+    assert decoder.decode_morphemes([list(sentence.split_source) for sentence in test_sentences]) == \
+        model.predict(X_test)
+
+def test_constrained_decoding(model, decoder, X_test, test_sentences, train_sentences):
+    no_candidates = [[None] * len(features) for features in X_test]
+    assert decoder.decode(X_test, no_candidates) == model.predict(X_test)
+
+    lexicon = ml.MajorityLexicon.from_corpus(train_sentences)
+    candidates = [label_candidates(sentence.split_source, lexicon, decoder) for sentence in test_sentences]
+    y_pred = decoder.decode(X_test, candidates)
+    assert [len(labels) for labels in y_pred] == [len(features) for features in X_test]
+    for labels, sentence_candidates in zip(y_pred, candidates):
+        for label, position_candidates in zip(labels, sentence_candidates):
+            if position_candidates is not None:
+                assert decoder.label_index[label] in position_candidates